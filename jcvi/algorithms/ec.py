@@ -52,8 +52,13 @@ def genome_mutation(candidate):
     locations along the candidate and reverses the values within that
     slice. Insertion is done by popping one item and insert it back at random
     position.
+
+    The move is recorded in the mutant together with the fitness of the
+    candidate, if known, so that the fitness can be updated incrementally,
+    see mutation_parent().
     """
     size = len(candidate)
+    fitness = candidate.fitness.values if candidate.fitness.valid else None
     prob = random.random()
     if prob > 0.5:  # Inversion
         p = random.randint(0, size - 1)
@@ -63,15 +68,38 @@ def genome_mutation(candidate):
         q += 1
         s = candidate[p:q]
         x = candidate[:p] + s[::-1] + candidate[q:]
-        return (creator.Individual(x),)
+        mutant = creator.Individual(x)
+        mutant.move = (fitness, "inversion", p, q) if fitness else None
+        return (mutant,)
     else:  # Insertion
         p = random.randint(0, size - 1)
         q = random.randint(0, size - 1)
         cq = candidate.pop(q)
         candidate.insert(p, cq)
+        candidate.move = (fitness, "insertion", p, q) if fitness else None
         return (candidate,)
 
 
+def mutation_parent(candidate):
+    """Undo the move recorded by genome_mutation().
+
+    Returns (parent, fitness, lo, hi, moved) where the parent with known
+    fitness differs from the candidate only at positions lo..hi, by reversal
+    (moved=-1) or by moving the contig now at position `moved`. Returns None
+    if the candidate is not a mutant of an evaluated parent.
+    """
+    move = getattr(candidate, "move", None)
+    if move is None:
+        return None
+    fitness, kind, p, q = move
+    parent = array.array("i", candidate)
+    if kind == "inversion":
+        parent[p:q] = parent[p:q][::-1]
+        return parent, fitness, p, q - 1, -1
+    parent.insert(q, parent.pop(p))
+    return parent, fitness, min(p, q), max(p, q), p
+
+
 def genome_mutation_orientation(candidate):
     size = len(candidate)
     prob = random.random()
@@ -110,6 +138,7 @@ def eaSimpleConverge(
     halloffame=None,
     callback=None,
     verbose=True,
+    rescore=20,
 ):
     """This algorithm reproduce the simplest evolutionary algorithm as
     presented in chapter 7 of [Back2000]_.
@@ -118,6 +147,10 @@ def eaSimpleConverge(
     rule for convergence. Interface is similar to eaSimple(). However, in
     eaSimple, ngen is total number of iterations; in eaSimpleConverge, we
     terminate only when the best is NOT updated for ngen iterations.
+
+    Fitness updated from the parent, see mutation_parent(), accumulates
+    rounding errors, so the whole population is evaluated from scratch every
+    rescore generations.
     """
     # Evaluate the individuals with an invalid fitness
     invalid_ind = [ind for ind in population if not ind.fitness.valid]
@@ -141,10 +174,16 @@ def eaSimpleConverge(
         offspring = varAnd(offspring, toolbox, cxpb, mutpb)
 
         # Evaluate the individuals with an invalid fitness
-        invalid_ind = [ind for ind in offspring if not ind.fitness.valid]
+        if rescore and gen % rescore == 0:
+            for ind in offspring:
+                ind.move = None
+            invalid_ind = offspring
+        else:
+            invalid_ind = [ind for ind in offspring if not ind.fitness.valid]
         fitnesses = toolbox.map(toolbox.evaluate, invalid_ind)
         for ind, fit in zip(invalid_ind, fitnesses):
             ind.fitness.values = fit
+            ind.move = None  # Only valid for the evaluation right after
 
         # Update the hall of fame with the generated individuals
         if halloffame is not None:
@@ -175,10 +214,17 @@ def eaSimpleConverge(
     return population
 
 
-def GA_run(toolbox, ngen=500, npop=100, seed=666, cpus=1, callback=None):
+def GA_run(toolbox, ngen=500, npop=100, seed=666, cpus=1, callback=None, pool=None):
+    """
+    Run the GA, the fitness is evaluated in parallel when cpus > 1. An existing
+    `pool` (anything with a map() method) is used as is and kept open, so it
+    can be reused across runs.
+    """
     logger.debug("GA setup: ngen=%d npop=%d cpus=%d seed=%d", ngen, npop, cpus, seed)
-    if cpus > 1:
+    own_pool = pool is None and cpus > 1
+    if own_pool:
         pool = multiprocessing.Pool(cpus)
+    if pool is not None:
         toolbox.register("map", pool.map)
     random.seed(seed)
     pop = toolbox.population(n=npop)
@@ -192,7 +238,10 @@ def GA_run(toolbox, ngen=500, npop=100, seed=666, cpus=1, callback=None):
         pop, toolbox, 0.7, 0.2, ngen, stats=stats, halloffame=hof, callback=callback
     )
     tour = hof[0]
-    if cpus > 1:
+    # Report the exact fitness of the best tour
+    tour.move = None
+    (tour.fitness.values,) = toolbox.map(toolbox.evaluate, [tour])
+    if own_pool:
         pool.terminate()
     return tour, tour.fitness
 
@@ -10,6 +10,8 @@ import bisect
 # We want a maximum function which accepts a default value
 from functools import partial, reduce
 
+import numpy as np
+
 maximum = partial(reduce, max)
 
 
@@ -68,13 +70,24 @@ def longest_monotonic_subseq_length_loose(xs):
 
 
 def longest_increasing_subseq_length_loose(xs):
-    xs = [(x, i) for (i, x) in enumerate(xs)]
-    return longest_increasing_subseq_length(xs)
+    """Return the length of the longest non-decreasing subsequence of xs.
+    Same as patience sorting (x, i) pairs, but bisect directly on the values.
+
+    >>> longest_increasing_subseq_length_loose([1, 1, 0, 2, 2])
+    4
+    """
+    pile_tops = []
+    for x in xs:
+        pile = bisect.bisect_right(pile_tops, x)
+        if pile == len(pile_tops):
+            pile_tops.append(x)
+        else:
+            pile_tops[pile] = x
+    return len(pile_tops)
 
 
 def longest_decreasing_subseq_length_loose(xs):
-    xs = [(x, -i) for (i, x) in enumerate(xs)]
-    return longest_decreasing_subseq_length(xs)
+    return longest_increasing_subseq_length_loose(reversed(xs))
 
 
 def longest_increasing_subsequence(xs):
@@ -143,14 +156,58 @@ def longest_decreasing_subsequence_loose(xs):
     return [x for (x, i) in ll]
 
 
-def backtracking(a, L, bestsofar):
+def heaviest_subsequence(a, loose=False, decreasing=False, debug=False):
     """
-    Start with the heaviest weight and emit index
+    Returns the heaviest monotonic subsequence for array a, in O(n log n) time.
+    Elements are (key, weight) pairs. Keys are strictly monotonic unless
+    `loose`, and increasing unless `decreasing`.
+
+    Prefix maxima of the weights are kept in a Fenwick tree indexed by the
+    rank of the keys. Ties are broken towards the smallest key, then the
+    earliest element, both for the predecessors and for the last element.
+
+    >>> heaviest_subsequence([(1, 1), (1, 2), (2, 1)], loose=True)
+    ([(1, 1), (1, 2), (2, 1)], 4)
+    >>> heaviest_subsequence([(1, 1), (3, 3), (2, 1)], decreasing=True)
+    ([(3, 3), (2, 1)], 4)
     """
-    w, j = max(L.items())
+    keys = sorted(set(key for key, weight in a))
+    nkeys = len(keys)
+    rank = dict((key, r) for r, key in enumerate(keys, 1))
+    # Entries are (weight, -rank, -idx) so that max() picks the heaviest, then
+    # the smallest key, then the earliest element; `empty` is the null prefix
+    empty = (0, -nkeys - 1, 1)
+    tree = [empty] * (nkeys + 1)
+    from_idx = [-1] * len(a)
+    best = empty
+    for i, (key, weight) in enumerate(a):
+        r = rank[key]
+        if decreasing:
+            r = nkeys + 1 - r
+        q = r if loose else r - 1
+        prefix = empty
+        while q > 0:
+            if tree[q] > prefix:
+                prefix = tree[q]
+            q -= q & -q
+        entry = (prefix[0] + weight, -r, -i)
+        from_idx[i] = -prefix[2]
+        if entry > best:
+            best = entry
+        while r <= nkeys:
+            if entry > tree[r]:
+                tree[r] = entry
+            r += r & -r
+
+        if debug:
+            print((key, weight), (entry[0], from_idx[i]))
+
+    tb = []
+    j = -best[2]
     while j != -1:
-        yield j
-        w, j = bestsofar[j]
+        tb.append(j)
+        j = from_idx[j]
+    return [a[x] for x in reversed(tb)], best[0]
 
 
 def heaviest_increasing_subsequence(a, debug=False):
@@ -161,30 +218,72 @@ def heaviest_increasing_subsequence(a, debug=False):
     >>> heaviest_increasing_subsequence([(3, 3), (2, 2), (1, 1), (0, 5)])
     ([(0, 5)], 5)
     """
-    # Stores the smallest idx of last element of a subsequence of weight w
-    L = {0: -1}
-    bestsofar = [(0, -1)] * len(a)  # (best weight, from_idx)
-    for i, (key, weight) in enumerate(a):
+    return heaviest_subsequence(a, debug=debug)
 
-        for w, j in list(L.items()):
-            if j != -1 and a[j][0] >= key:
-                continue
 
-            new_weight = w + weight
-            if new_weight in L and a[L[new_weight]][0] <= key:
-                continue
+def heaviest_decreasing_subsequence(a, debug=False):
+    """
+    Returns the heaviest decreasing subsequence for array a. Elements are (key,
+    weight) pairs.
 
-            L[new_weight] = i
-            newbest = (new_weight, j)
-            if newbest > bestsofar[i]:
-                bestsofar[i] = newbest
+    >>> heaviest_decreasing_subsequence([(3, 3), (2, 2), (1, 1), (0, 5)])
+    ([(3, 3), (2, 2), (1, 1), (0, 5)], 11)
+    """
+    return heaviest_subsequence(a, decreasing=True, debug=debug)
+
+
+def heaviest_increasing_subsequence_loose(a, debug=False):
+    return heaviest_subsequence(a, loose=True, debug=debug)
 
-        if debug:
-            # print (key, weight), L
-            print((key, weight), bestsofar)
 
-    tb = reversed(list(backtracking(a, L, bestsofar)))
-    return [a[x] for x in tb], max(L.items())[0]
+def heaviest_decreasing_subsequence_loose(a, debug=False):
+    return heaviest_subsequence(a, loose=True, decreasing=True, debug=debug)
+
+
+def heaviest_subsequence_weights(keys, weights, loose=False, decreasing=False):
+    """
+    Returns the weights of the heaviest monotonic subsequences for many series
+    at once, see heaviest_subsequence(). `keys` and `weights` are 2D arrays
+    with one series per row, pad shorter series with zero weights. The Fenwick
+    trees of all series are updated together, one column at a time.
+
+    >>> heaviest_subsequence_weights([[3, 2, 1, 0], [0, 1, 2, 3]], [[3, 2, 1, 5]] * 2)
+    array([ 5., 11.])
+    """
+    keys = np.atleast_2d(keys)
+    weights = np.atleast_2d(np.asarray(weights, dtype=float))
+    nseries, n = keys.shape
+    rows = np.arange(nseries)
+
+    # Dense ranks of the keys within each series, starting from 1
+    order = np.argsort(keys, axis=1, kind="stable")
+    sorted_keys = np.take_along_axis(keys, order, axis=1)
+    is_new = np.ones(keys.shape, dtype=int)
+    is_new[:, 1:] = sorted_keys[:, 1:] != sorted_keys[:, :-1]
+    dense = np.cumsum(is_new, axis=1)
+    ranks = np.empty_like(dense)
+    np.put_along_axis(ranks, order, dense, axis=1)
+    if decreasing:
+        ranks = dense[:, -1:] + 1 - ranks
+
+    # Slot 0 is the null prefix, slot n + 1 absorbs updates beyond the tree
+    tree = np.zeros((nseries, n + 2))
+    best = np.zeros(nseries)
+    nsteps = int(n).bit_length()
+    for t in range(n):
+        r = ranks[:, t]
+        q = r if loose else r - 1
+        prefix = np.zeros(nseries)
+        for _ in range(nsteps):
+            np.maximum(prefix, tree[rows, q], out=prefix)
+            q = q - (q & -q)
+        entry = prefix + weights[:, t]
+        np.maximum(best, entry, out=best)
+        for _ in range(nsteps):
+            rr = np.minimum(r, n + 1)
+            tree[rows, rr] = np.maximum(tree[rows, rr], entry)
+            r = r + (r & -r)
+    return best
 
 
 if __name__ == "__main__":
@@ -192,8 +291,6 @@ if __name__ == "__main__":
 
     doctest.testmod()
 
-    import numpy as np
-
     LENGTH = 20
     A = [np.random.randint(0, 20) for x in range(LENGTH)]
     A = list(A)
@@ -12,6 +12,7 @@ import sys
 
 from ..apps.base import ActionDispatcher, OptionParser
 from ..formats.gff import (
+    FeatureNotFoundError,
     Gff,
     get_piles,
     make_index,
@@ -265,7 +266,10 @@ def trimUTR(args):
                                                 extras.add(exon)
                         else:
                             refc = None
-                    except gffutils.exceptions.FeatureNotFoundError:
+                    except (
+                        FeatureNotFoundError,
+                        gffutils.exceptions.FeatureNotFoundError,
+                    ):
                         pass
                 start, end = get_cds_minmax(gff, cid, level=1)
                 if cid in trimrange:
@@ -659,6 +659,12 @@ class OptionParser(ArgumentParser):
                 "|".join(set1)
             ),
         )
+        group.add_argument(
+            "--raster",
+            default=False,
+            action="store_true",
+            help="Draw all the anchors as a density raster instead of sampled dots",
+        )
         return group
 
     def set_depth(self, depth=50):
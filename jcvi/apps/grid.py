@@ -93,6 +93,89 @@ class Queue(Queue):
         return not self.qsize()
 
 
+# Data attached to the processes of each WorkerPool, by name
+WORKER_DATA = {}
+
+
+def attach_worker_data(name, data, initializer=None):
+    """
+    Pool initializer of WorkerPool, the data is replaced by initializer(data)
+    if given.
+    """
+    if initializer is not None:
+        data = initializer(data)
+    WORKER_DATA[name] = data
+
+
+def worker_data(name):
+    """
+    Returns the data of the WorkerPool name, from within its tasks.
+    """
+    return WORKER_DATA[name]
+
+
+class SerialResult(object):
+    """
+    Result of WorkerPool.apply_async() without workers, computed on get().
+    """
+
+    def __init__(self, func, args):
+        self.func = func
+        self.args = args
+
+    def get(self):
+        return self.func(*self.args)
+
+
+class WorkerPool(object):
+    """
+    Pool of workers that share the same data, which is sent once to each
+    worker rather than with each task. Tasks read it with worker_data(name).
+    With a single CPU, the tasks run in this process. Use as a context
+    manager: the workers are stopped on exit, also when a task fails.
+    """
+
+    def __init__(self, name, data, cpus=1, initializer=None):
+        self.name = name
+        self.pool = None
+        if cpus > 1:
+            self.pool = Pool(
+                processes=cpus,
+                initializer=attach_worker_data,
+                initargs=(name, data, initializer),
+            )
+        else:
+            attach_worker_data(name, data, initializer)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool.join()
+            self.pool = None
+        WORKER_DATA.pop(self.name, None)
+
+    def map(self, func, iterable, chunksize=None):
+        if self.pool is None:
+            return list(map(func, iterable))
+        return self.pool.map(func, iterable, chunksize=chunksize)
+
+    def imap(self, func, iterable, chunksize=1):
+        if self.pool is None:
+            return map(func, iterable)
+        return self.pool.imap(func, iterable, chunksize=chunksize)
+
+    def apply_async(self, func, args=()):
+        if self.pool is None:
+            return SerialResult(func, args)
+        return self.pool.apply_async(func, args)
+
+
 class Parallel(object):
     """
     Run a number of commands in parallel.
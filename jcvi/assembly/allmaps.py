@@ -8,9 +8,12 @@ import os.path as op
 import os
 import sys
 
+from argparse import Namespace
 from collections import Counter, defaultdict
 from functools import partial
+from io import StringIO
 from itertools import combinations, product
+from operator import attrgetter
 from typing import Optional
 
 import numpy as np
@@ -40,6 +43,7 @@ from ..apps.base import (
     sh,
     version,
 )
+from ..apps.grid import WorkerPool, worker_data
 from ..formats.agp import AGP, order_to_agp, build as agp_build, reindex
 from ..formats.base import DictFile, FileMerger, must_open, read_block
 from ..formats.bed import Bed, BedLine, natsorted, sort
@@ -50,6 +54,11 @@ from ..utils.cbook import human_size, percentage
 from ..utils.grouper import Grouper
 from ..utils.table import tabulate
 
+try:
+    from .chic import colinear_score
+except ImportError:
+    logger.error("Fall back to Python implementation of colinear_score")
+    colinear_score = None
 
 START, END = "START", "END"
 distance_choices = ("cM", "rank")
@@ -199,7 +208,13 @@ class ScaffoldOO(object):
             scfs, tour, ww = self.prepare_ec(scaffolds, tour, weights)
             callbacki = partial(callback, i=i)
             toolbox = GA_setup(tour)
-            toolbox.register("evaluate", colinear_evaluate_multi, scfs=scfs, weights=ww)
+            series = ColinearSeries(scfs, len(scaffolds))
+            toolbox.register(
+                "evaluate",
+                colinear_evaluate_compiled,
+                series=series,
+                weights=np.array(ww),
+            )
             tour, fitness = GA_run(
                 toolbox, ngen=ngen, npop=npop, cpus=cpus, seed=seed, callback=callbacki
             )
@@ -803,6 +818,90 @@ def colinear_evaluate_multi(tour, scfs, weights):
     return (weighted_score,)
 
 
+class ColinearSeries(object):
+    """
+    Precompiled form of the marker series from ScaffoldOO.prepare_ec(). The
+    series of all maps are stored in one flat array, the series of a scaffold
+    in a map is the slice at `offsets[map, scaffold]` of `lengths[map,
+    scaffold]`, where the length is zero if the scaffold has no markers.
+    """
+
+    def __init__(self, scfs, nscaffolds):
+        self.nmaps = len(scfs)
+        self.offsets = np.zeros((self.nmaps, nscaffolds), dtype=int)
+        self.lengths = np.zeros((self.nmaps, nscaffolds), dtype=int)
+        markers = []
+        for i, scf in enumerate(scfs):
+            for si, series in scf.items():
+                self.offsets[i, si] = len(markers)
+                self.lengths[i, si] = len(series)
+                markers.extend(series)
+        self.markers = np.array(markers, dtype=float)
+
+    def gather(self, tour):
+        """
+        Returns the marker series along the tour concatenated for all maps,
+        and the boundaries of each map within.
+        """
+        tour = np.asarray(tour, dtype=int)
+        lengths = self.lengths[:, tour].ravel()
+        ends = np.cumsum(lengths)
+        bounds = np.zeros(self.nmaps + 1, dtype=int)
+        if not len(ends) or not ends[-1]:
+            return np.empty(0), bounds
+        # Index of each output marker into the flat array
+        shifts = self.offsets[:, tour].ravel() - ends + lengths
+        idx = np.arange(ends[-1]) + np.repeat(shifts, lengths)
+        bounds[1:] = ends.reshape(self.nmaps, -1)[:, -1]
+        return self.markers[idx], bounds
+
+
+def colinear_evaluate_compiled(tour, series, weights):
+    """
+    Same as colinear_evaluate_multi(), with the marker series gathered from
+    the precompiled ColinearSeries and scored in one kernel call.
+    """
+    markers, bounds = series.gather(tour)
+    if colinear_score is None:
+        return (colinear_score_py(markers, bounds, weights),)
+    return (colinear_score(markers, bounds, weights),)
+
+
+def colinear_score_py(markers, bounds, weights):
+    """
+    Python version of chic.colinear_score().
+    """
+    weighted_score = 0
+    markers = markers.tolist()
+    for a, b, w in zip(bounds[:-1], bounds[1:], weights):
+        score, diff = lms(markers[a:b])
+        weighted_score += score * w
+    return weighted_score
+
+
+def order_partition(arg):
+    """
+    Order and orient the scaffolds in one partition, see ScaffoldOO. Tour
+    records are kept in memory so that they can be written in partition
+    order. Returns (object, tour, tour records).
+    """
+    lgs, scaffolds, kwargs = arg
+    logger.debug("Working on %s ...", "|".join(lgs))
+    d = worker_data("partition")
+    fwtour = StringIO()
+    s = ScaffoldOO(
+        lgs,
+        scaffolds,
+        d["mapc"],
+        d["pivot"],
+        d["weights"],
+        d["sizes"],
+        fwtour=fwtour,
+        **kwargs
+    )
+    return s.object, s.tour, fwtour.getvalue()
+
+
 def get_rho(xy):
     if not xy:
         return 0
@@ -1328,7 +1427,7 @@ def best_no_ambiguous(d, label):
 
 def get_function(field):
     assert field in distance_choices
-    return (lambda x: x.cm) if field == "cM" else (lambda x: x.rank)
+    return attrgetter("cm") if field == "cM" else attrgetter("rank")
 
 
 def print_tour(fw, object, tag, label, tour, recode=False):
@@ -1413,6 +1512,12 @@ def path(args):
         help="Renumber chromosome based on decreasing sizes",
     )
     p.set_cpus(cpus=16)
+    p.add_argument(
+        "--partition_cpus",
+        default=1,
+        type=int,
+        help="Order partitions in parallel, each GA then runs on a single CPU",
+    )
 
     q = p.add_argument_group("Genetic algorithm options")
     q.add_argument(
@@ -1540,7 +1645,7 @@ def path(args):
     sizes = Sizes(fastafile).mapping
     fwagp = must_open(agpfile, "w")
     fwtour = must_open(tourfile, "w")
-    solutions = []
+    tasks = []
     for lgs, scaffolds in natsorted(partitions.items()):
         if oseqid and oseqid not in lgs:
             continue
@@ -1549,24 +1654,37 @@ def path(args):
         if pivot not in lgs_maps:
             logger.debug("Skipping %s ...", tag)
             continue
-        logger.debug("Working on %s ...", tag)
-        s = ScaffoldOO(
-            lgs,
-            scaffolds,
-            cc,
-            pivot,
-            weights,
-            sizes,
+        # Every partition is seeded the same way regardless of scheduling
+        kwargs = dict(
             function=function,
             linkage=linkage,
-            fwtour=fwtour,
             ngen=ngen,
             npop=npop,
             cpus=cpus,
             seed=seed,
         )
+        tasks.append((lgs, scaffolds, kwargs))
+
+    partition_cpus = min(opts.partition_cpus, len(tasks))
+    if partition_cpus > 1:
+        # Daemonic pool workers cannot start their own GA pool
+        for lgs, scaffolds, kwargs in tasks:
+            kwargs["cpus"] = 1
+        logger.debug("Order %d partitions on %d CPUs", len(tasks), partition_cpus)
 
-        solutions.append(s)
+    solutions = []
+    data = dict(mapc=cc, pivot=pivot, weights=weights, sizes=sizes)
+    with WorkerPool("partition", data, cpus=partition_cpus) as pool:
+        # Largest partitions first to balance the load, results are still
+        # collected in partition order
+        results = [None] * len(tasks)
+        for i in sorted(range(len(tasks)), key=lambda i: -len(tasks[i][1])):
+            results[i] = pool.apply_async(order_partition, (tasks[i],))
+        for result in results:
+            seqid, tour, tourlines = result.get()
+            fwtour.write(tourlines)
+            fwtour.flush()
+            solutions.append(Namespace(object=seqid, tour=tour))
     fwtour.close()
 
     # Renumber chromosome based on decreasing size
@@ -12,6 +12,8 @@ Support three versions with different objective functions:
   plus the actual link distances. Maximize Sum(1 / distance) for all links.
   For performance consideration, we actually use a histogram to approximate
   all link distances. See golden_array() in hic for details.
+
+Also colinear_score() for the GA fitness in ALLMAPS.
 """
 
 from __future__ import division
@@ -19,6 +21,7 @@ import numpy as np
 cimport numpy as np
 cimport cython
 from cpython cimport array
+from libc.stdlib cimport malloc, free
 import array
 
 
@@ -103,3 +106,239 @@ def score_evaluate_Q(array.array[int] tour,
                 c = tour_Q[a, b, ic]
                 s += c / (GR[ic] + dist)
     return s,
+
+
+def score_evaluate_Q_csr(array.array[int] tour,
+                         np.ndarray[INT, ndim=1] tour_sizes=None,
+                         tour_Q=None):
+    """
+    Same as score_evaluate_Q(), but with the sparse Q in CSR format (indptr,
+    indices, data), see CLMFile.Q_csr.
+    """
+    cdef np.ndarray[INT, ndim=1] indptr = tour_Q[0]
+    cdef np.ndarray[INT, ndim=1] indices = tour_Q[1]
+    cdef np.ndarray[INT, ndim=2] data = tour_Q[2]
+    cdef np.ndarray[INT, ndim=1] sizes_oo = tour_sizes[tour]
+    cdef np.ndarray[INT, ndim=1] sizes_cum = np.cumsum(sizes_oo)
+    cdef np.ndarray[INT, ndim=1] pos = np.ones(len(tour_sizes), dtype=int) * -1
+
+    cdef double s = 0.0
+    cdef int size = len(tour)
+    cdef int a, c, ia, ib, ic, j
+    cdef double dist
+    for ia in range(size):
+        pos[tour[ia]] = ia
+    for ia in range(size):
+        a = tour[ia]
+        for j in range(indptr[a], indptr[a + 1]):
+            ib = pos[indices[j]]
+            if ib <= ia:
+                continue
+            dist = sizes_cum[ib - 1] - sizes_cum[ia]
+            if dist > LIMIT:
+                continue
+            for ic in range(BB):
+                c = data[j, ic]
+                s += c / (GR[ic] + dist)
+    return s,
+
+
+cdef double crossing_score_M(int *t, INT[:] sizes_cum, INT[:, :] tour_M,
+                             int size, int lo, int hi):
+    """
+    Part of score_evaluate_M() from the pairs with exactly one contig at
+    positions lo..hi of the tour, only the contigs within LIMIT of the window
+    boundaries are visited.
+    """
+    cdef double s = 0.0
+    cdef int a, b, ia, ib
+    cdef int links
+    cdef double dist
+    # Pairs from the window to the right
+    if hi + 1 < size:
+        for ia in range(hi, lo - 1, -1):
+            if sizes_cum[hi + 1] - sizes_cum[ia] > LIMIT:
+                break
+            a = t[ia]
+            for ib in range(hi + 1, size):
+                dist = sizes_cum[ib] - sizes_cum[ia]
+                if dist > LIMIT:
+                    break
+                links = tour_M[a, t[ib]]
+                if links != 0:
+                    s += links / dist
+    # Pairs from the left to the window
+    if lo > 0:
+        for ib in range(lo, hi + 1):
+            if sizes_cum[ib] - sizes_cum[lo - 1] > LIMIT:
+                break
+            b = t[ib]
+            for ia in range(lo - 1, -1, -1):
+                dist = sizes_cum[ib] - sizes_cum[ia]
+                if dist > LIMIT:
+                    break
+                links = tour_M[t[ia], b]
+                if links != 0:
+                    s += links / dist
+    return s
+
+
+cdef double contig_score_M(int *t, INT[:] sizes_cum, INT[:, :] tour_M,
+                           int lo, int hi, int m):
+    """
+    Part of score_evaluate_M() from the pairs between the contig at position
+    m and the other contigs at positions lo..hi.
+    """
+    cdef double s = 0.0
+    cdef int c = t[m]
+    cdef int ia, ib
+    cdef int links
+    cdef double dist
+    for ib in range(m + 1, hi + 1):
+        dist = sizes_cum[ib] - sizes_cum[m]
+        if dist > LIMIT:
+            break
+        links = tour_M[c, t[ib]]
+        if links != 0:
+            s += links / dist
+    for ia in range(m - 1, lo - 1, -1):
+        dist = sizes_cum[m] - sizes_cum[ia]
+        if dist > LIMIT:
+            break
+        links = tour_M[t[ia], c]
+        if links != 0:
+            s += links / dist
+    return s
+
+
+def score_delta_M(array.array[int] tour, array.array[int] new_tour, int lo, int hi,
+                  np.ndarray[INT, ndim=1] tour_sizes=None,
+                  np.ndarray[INT, ndim=2] tour_M=None, int moved=-1):
+    """
+    Change of score_evaluate_M() from `tour` to `new_tour`, where `new_tour`
+    only rearranges the contigs at positions lo..hi, by a segment reversal
+    (moved=-1) or a transposition of the single contig at position `moved`
+    of `new_tour`. Pairs outside the window keep their distances, and so do
+    the pairs within the window except those with the transposed contig, so
+    only the pairs within LIMIT of the window boundaries are scored.
+    """
+    cdef np.ndarray[INT, ndim=1] sizes_oo = tour_sizes[tour]
+    cdef np.ndarray[INT, ndim=1] sizes_cum = np.cumsum(sizes_oo) - sizes_oo // 2
+    cdef np.ndarray[INT, ndim=1] new_sizes_oo = tour_sizes[new_tour]
+    cdef np.ndarray[INT, ndim=1] new_sizes_cum = \
+         np.cumsum(new_sizes_oo) - new_sizes_oo // 2
+
+    cdef int *t = tour.data.as_ints
+    cdef int *nt = new_tour.data.as_ints
+    cdef int size = len(tour)
+    cdef int m = lo
+    cdef double s = crossing_score_M(nt, new_sizes_cum, tour_M, size, lo, hi) - \
+                    crossing_score_M(t, sizes_cum, tour_M, size, lo, hi)
+    if moved >= 0:
+        for m in range(lo, hi + 1):
+            if t[m] == nt[moved]:
+                break
+        s += contig_score_M(nt, new_sizes_cum, tour_M, lo, hi, moved) - \
+             contig_score_M(t, sizes_cum, tour_M, lo, hi, m)
+    return s,
+
+
+def score_delta_M_delete(array.array[int] tour, positions,
+                         np.ndarray[INT, ndim=1] tour_sizes=None,
+                         np.ndarray[INT, ndim=2] tour_M=None):
+    """
+    Change of score_evaluate_M() by deleting the contig at each of the
+    `positions` of the tour, i.e. score(tour) - score(tour without it). The
+    contigs that span the deleted contig get closer, so only the pairs within
+    LIMIT around the position are scored.
+    """
+    cdef np.ndarray[INT, ndim=1] sizes_oo = tour_sizes[tour]
+    cdef np.ndarray[INT, ndim=1] sizes_cum = np.cumsum(sizes_oo) - sizes_oo // 2
+    cdef np.ndarray[np.float64_t, ndim=1] deltas = np.zeros(len(positions))
+
+    cdef int *t = tour.data.as_ints
+    cdef double s
+    cdef int size = len(tour)
+    cdef int i, j, c, sc, ia, ib
+    cdef int links
+    cdef double dist, sdist
+    for j, i in enumerate(positions):
+        c = t[i]
+        sc = sizes_oo[i]
+        s = 0.0
+        # Pairs with the deleted contig
+        for ib in range(i + 1, size):
+            dist = sizes_cum[ib] - sizes_cum[i]
+            if dist > LIMIT:
+                break
+            links = tour_M[c, t[ib]]
+            if links != 0:
+                s += links / dist
+        for ia in range(i - 1, -1, -1):
+            dist = sizes_cum[i] - sizes_cum[ia]
+            if dist > LIMIT:
+                break
+            links = tour_M[t[ia], c]
+            if links != 0:
+                s += links / dist
+        # Pairs spanning the deleted contig become closer by its size
+        for ia in range(i - 1, -1, -1):
+            if i + 1 == size or sizes_cum[i + 1] - sizes_cum[ia] - sc > LIMIT:
+                break
+            for ib in range(i + 1, size):
+                dist = sizes_cum[ib] - sizes_cum[ia]
+                sdist = dist - sc
+                if sdist > LIMIT:
+                    break
+                links = tour_M[t[ia], t[ib]]
+                if links == 0:
+                    continue
+                if dist <= LIMIT:
+                    s += links / dist
+                s -= links / sdist
+        deltas[j] = s
+    return deltas
+
+
+cdef int nondecreasing_length(double *x, int n, int step, double *tops):
+    # Patience sorting, bisect right on the pile tops
+    cdef int i, lo, hi, mid, npiles = 0
+    cdef double v
+    for i in range(n):
+        v = x[i * step]
+        lo, hi = 0, npiles
+        while lo < hi:
+            mid = (lo + hi) >> 1
+            if tops[mid] <= v:
+                lo = mid + 1
+            else:
+                hi = mid
+        tops[lo] = v
+        if lo == npiles:
+            npiles += 1
+    return npiles
+
+
+def colinear_score(double[::1] markers, long[::1] bounds, double[::1] weights):
+    """
+    Weighted sum of the longest monotonic (non-strict) subsequence lengths of
+    the series markers[bounds[i]:bounds[i + 1]], same as summing
+    longest_monotonic_subseq_length_loose() in lis.py.
+    """
+    cdef int i, n, li, ld
+    cdef double s = 0
+    cdef double *tops
+    if markers.shape[0] == 0:
+        return 0.
+    tops = <double *>malloc(markers.shape[0] * sizeof(double))
+    if tops == NULL:
+        raise MemoryError()
+    for i in range(weights.shape[0]):
+        n = bounds[i + 1] - bounds[i]
+        if n == 0:
+            continue
+        li = nondecreasing_length(&markers[bounds[i]], n, 1, tops)
+        ld = nondecreasing_length(&markers[bounds[i + 1] - 1], n, -1, tops)
+        s += max(li, ld) * weights[i]
+    free(tops)
+    return s
@@ -14,13 +14,14 @@ import sys
 from collections import defaultdict
 from functools import partial
 from multiprocessing import Pool
+from multiprocessing.shared_memory import SharedMemory
 from typing import List, Optional, Tuple
 
 import numpy as np
 
 from natsort import natsorted
 
-from ..algorithms.ec import GA_run, GA_setup
+from ..algorithms.ec import GA_run, GA_setup, mutation_parent
 from ..algorithms.formula import outlier_cutoff
 from ..algorithms.matrix import get_signs
 from ..apps.base import (
@@ -32,7 +33,7 @@ from ..apps.base import (
     mkdir,
     symlink,
 )
-from ..apps.grid import Jobs
+from ..apps.grid import Jobs, WorkerPool, worker_data
 from ..compara.synteny import check_beds, get_bed_filenames
 from ..formats.agp import order_to_agp
 from ..formats.base import LineFile, must_open
@@ -58,6 +59,7 @@ RR = {"+": -1, "-": 1, "?": -1}
 LB = 18  # Lower bound for golden_array()
 UB = 29  # Upper bound for golden_array()
 BB = UB - LB + 1  # Span for golden_array()
+QQ = {(1, 1): 0, (1, -1): 1, (-1, 1): 2, (-1, -1): 3}  # Orientation configurations
 ACCEPT = "[green]ACCEPT"
 REJECT = "[red]REJECT"
 BINSIZE = 50000
@@ -121,13 +123,21 @@ class CLMFile:
     tig00030676- tig00077819-       5       108422 157204 157204 137924 142611
     """
 
-    def __init__(self, clmfile, skiprecover=False):
+    def __init__(self, clmfile, skiprecover=False, sparse=False):
         self.name = op.basename(clmfile).rsplit(".", 1)[0]
         self.clmfile = clmfile
         self.idsfile = clmfile.rsplit(".", 1)[0] + ".ids"
+        self.sparse = sparse
         self.parse_ids(skiprecover)
         self.parse_clm()
         self.signs = None
+        # Matrices of the active contigs, see active_matrix()
+        self._active_key = None
+        self._active_coos = {}
+        self._matrices = {}
+        # Sparse Q of the active contigs, see Q_csr
+        self._Q_sorted = None
+        self._Q_csr = None
 
     def parse_ids(self, skiprecover):
         """IDS file has a list of contigs that need to be ordered. 'recover',
@@ -156,6 +166,7 @@ class CLMFile:
         self.contigs = set(_tigs)
         self.sizes = np.array(_sizes)
         self.tig_to_size = dict(tigs)
+        self.tig_to_index = dict((x, i) for (i, x) in enumerate(_tigs))
 
         # Initially all contigs are considered active
         self.active = set(_tigs)
@@ -194,6 +205,38 @@ class CLMFile:
             strandedness, md, mh = min(dists, key=lambda x: x[-1])
             orientations[(at, bt)] = (strandedness, len(md), mh)
         self.orientations = orientations
+        self.index_contacts()
+
+    def index_contacts(self):
+        """
+        Convert the contacts into sparse (COO) arrays over all contigs, where
+        each pair is listed in both directions, in the same order as the cells
+        were filled in the dense matrices. The matrices of the active contigs
+        are sliced from these arrays.
+        """
+
+        def coo(pairs, symmetric=True):
+            idx = self.tig_to_index
+            a = np.array([idx[at] for (at, bt) in pairs], dtype=int)
+            b = np.array([idx[bt] for (at, bt) in pairs], dtype=int)
+            if not symmetric:
+                return a, b
+            return np.column_stack((a, b)).ravel(), np.column_stack((b, a)).ravel()
+
+        links = np.array(list(self.contacts.values()), dtype=int)
+        self.M_coo = coo(self.contacts) + (np.repeat(links, 2),)
+
+        orientations = list(self.orientations.values())
+        strandedness, md, mh = np.array(orientations, dtype=int).reshape(-1, 3).T
+        self.O_coo = coo(self.orientations) + (np.repeat(strandedness * md, 2),)
+        self.P_coo = coo(self.orientations) + (np.repeat(md, 2), np.repeat(mh, 2))
+
+        # Distances for each of the 4 orientation configurations, see QQ
+        k = np.ones((len(self.contacts_oriented), len(QQ), BB), dtype=int) * -1
+        for i, ko in enumerate(self.contacts_oriented.values()):
+            for oo, gdists in ko.items():
+                k[i, QQ[oo]] = gdists
+        self.Q_coo = coo(self.contacts_oriented, symmetric=False) + (k,)
 
     def calculate_densities(self):
         """
@@ -301,8 +344,10 @@ class CLMFile:
         taking orientation into consideration. This may be the most accurate
         evaluation under the right condition.
         """
-        from .chic import score_evaluate_Q
+        from .chic import score_evaluate_Q, score_evaluate_Q_csr
 
+        if self.sparse:
+            return score_evaluate_Q_csr(tour, self.active_sizes, self.Q_csr)
         return score_evaluate_Q(tour, self.active_sizes, self.Q)
 
     def flip_log(self, method, score, score_flipped, tag):
@@ -374,40 +419,47 @@ class CLMFile:
         """Test deleting each contig and check the delta_score; tour here must
         be an array of ints.
         """
-        while True:
-            (tour_score,) = self.evaluate_tour_M(tour)
-            logger.debug("Starting score: %d", tour_score)
-            active_sizes = self.active_sizes
-            M = self.M
-            args = []
-            for i, t in enumerate(tour):
-                stour = tour[:i] + tour[i + 1 :]
-                args.append((t, stour, tour_score, active_sizes, M))
-
-            # Parallel run
-            p = Pool(processes=cpus)
-            results = list(p.imap(prune_tour_worker, args))
-            assert len(tour) == len(
-                results
-            ), "Array size mismatch, tour({}) != results({})".format(
-                len(tour), len(results)
-            )
+        # The tours are scored against the matrix of the starting contigs in
+        # all rounds, so that the matrix is shared with the workers only once
+        tig_to_idx = self.tig_to_idx
+        with TourScorer(self.active_sizes, self.M, cpus) as scorer:
+            while True:
+                active_contigs = self.active_contigs
+                stour = array.array("i", [tig_to_idx[active_contigs[x]] for x in tour])
+                (tour_score,) = scorer.evaluate(stour)
+                logger.debug("Starting score: %d", tour_score)
+                # Each worker scores the deletions at a batch of positions
+                batch = max(len(tour) // (4 * cpus), 1)
+                args = []
+                for i in range(0, len(tour), batch):
+                    positions = range(i, min(i + batch, len(tour)))
+                    args.append((stour, [tour[x] for x in positions], positions))
+
+                results = []
+                for res in scorer.imap(prune_tour_worker, args, chunksize=16):
+                    results.extend(res)
+                assert len(tour) == len(
+                    results
+                ), "Array size mismatch, tour({}) != results({})".format(
+                    len(tour), len(results)
+                )
 
-            # Identify outliers
-            active_contigs = self.active_contigs
-            idx, log10deltas = zip(*results)
-            lb, ub = outlier_cutoff(log10deltas)
-            logger.debug("Log10(delta_score) ~ [%d, %d]", lb, ub)
+                # Identify outliers
+                idx, log10deltas = zip(*results)
+                lb, ub = outlier_cutoff(log10deltas)
+                logger.debug("Log10(delta_score) ~ [%d, %d]", lb, ub)
 
-            remove = set(active_contigs[x] for (x, d) in results if d < lb)
-            self.active -= remove
-            self.report_active()
+                remove = set(active_contigs[x] for (x, d) in results if d < lb)
+                self.active -= remove
+                self.report_active()
 
-            tig_to_idx = self.tig_to_idx
-            tour = [active_contigs[x] for x in tour]
-            tour = array.array("i", [tig_to_idx[x] for x in tour if x not in remove])
-            if not remove:
-                break
+                active_to_idx = self.tig_to_idx
+                tour = [active_contigs[x] for x in tour]
+                tour = array.array(
+                    "i", [active_to_idx[x] for x in tour if x not in remove]
+                )
+                if not remove:
+                    break
 
         self.tour = tour
         self.flip_all(tour)
@@ -418,9 +470,24 @@ class CLMFile:
     def active_contigs(self):
         return list(self.active)
 
+    @property
+    def active_index(self):
+        """
+        Index of the active contigs (in the order of `self.active`) among all
+        contigs. The matrices are cached for the same set of active contigs.
+        """
+        key = tuple(self.active)
+        if key != self._active_key:
+            tig_to_index = self.tig_to_index
+            self._active_key = key
+            self._active_index = np.array([tig_to_index[x] for x in key], dtype=int)
+            self._tig_to_idx = dict((x, i) for (i, x) in enumerate(key))
+            self._active_coos = {}
+        return self._active_index
+
     @property
     def active_sizes(self):
-        return np.array([self.tig_to_size[x] for x in self.active])
+        return self.sizes[self.active_index]
 
     @property
     def N(self):
@@ -432,7 +499,50 @@ class CLMFile:
 
     @property
     def tig_to_idx(self):
-        return dict((x, i) for (i, x) in enumerate(self.active))
+        self.active_index
+        return self._tig_to_idx
+
+    def active_coo(self, name):
+        """
+        Select the entries in the COO arrays (e.g. `M_coo` for name `M`) among
+        the active contigs, and convert to the indices of the active contigs.
+        """
+        index = self.active_index
+        if name not in self._active_coos:
+            coo = getattr(self, name + "_coo")
+            idx = np.ones(len(self.sizes), dtype=int) * -1
+            idx[index] = np.arange(len(index))
+            a, b = idx[coo[0]], idx[coo[1]]
+            keep = (a >= 0) & (b >= 0)
+            self._active_coos[name] = (a[keep], b[keep]) + tuple(
+                x[keep] for x in coo[2:]
+            )
+        return self._active_coos[name]
+
+    def active_matrix(self, name, build):
+        """
+        Return the cached matrix for the active contigs. When contigs are
+        deactivated, the rows and columns are deleted from the cached matrix
+        rather than building it again.
+        """
+        index = self.active_index
+        if name in self._matrices:
+            cached_index, matrix = self._matrices[name]
+            if np.array_equal(cached_index, index):
+                return matrix
+            # Positions of the active contigs in the cached matrix, rows and
+            # columns can be deleted if the active contigs keep their order
+            idx = np.ones(len(self.sizes), dtype=int) * -1
+            idx[cached_index] = np.arange(len(cached_index))
+            keep = idx[index]
+            if (keep >= 0).all() and (np.diff(keep) > 0).all():
+                matrix = matrix[np.ix_(keep, keep)]
+                self._matrices[name] = (index, matrix)
+                return matrix
+
+        matrix = build()
+        self._matrices[name] = (index, matrix)
+        return matrix
 
     @property
     def M(self):
@@ -440,16 +550,15 @@ class CLMFile:
         Contact frequency matrix. Each cell contains how many inter-contig
         links between i-th and j-th contigs.
         """
-        N = self.N
-        tig_to_idx = self.tig_to_idx
-        M = np.zeros((N, N), dtype=int)
-        for (at, bt), links in self.contacts.items():
-            if not (at in tig_to_idx and bt in tig_to_idx):
-                continue
-            ai = tig_to_idx[at]
-            bi = tig_to_idx[bt]
-            M[ai, bi] = M[bi, ai] = links
-        return M
+
+        def build():
+            N = self.N
+            a, b, links = self.active_coo("M")
+            M = np.zeros((N, N), dtype=int)
+            M[a, b] = links
+            return M
+
+        return self.active_matrix("M", build)
 
     @property
     def O(self):
@@ -457,17 +566,15 @@ class CLMFile:
         Pairwise strandedness matrix. Each cell contains whether i-th and j-th
         contig are the same orientation +1, or opposite orientation -1.
         """
-        N = self.N
-        tig_to_idx = self.tig_to_idx
-        O = np.zeros((N, N), dtype=int)
-        for (at, bt), (strandedness, md, mh) in self.orientations.items():
-            if not (at in tig_to_idx and bt in tig_to_idx):
-                continue
-            ai = tig_to_idx[at]
-            bi = tig_to_idx[bt]
-            score = strandedness * md
-            O[ai, bi] = O[bi, ai] = score
-        return O
+
+        def build():
+            N = self.N
+            a, b, score = self.active_coo("O")
+            O = np.zeros((N, N), dtype=int)
+            O[a, b] = score
+            return O
+
+        return self.active_matrix("O", build)
 
     @property
     def P(self):
@@ -479,17 +586,25 @@ class CLMFile:
         shortest. This offers better precision for the distance between big
         contigs.
         """
-        N = self.N
-        tig_to_idx = self.tig_to_idx
-        P = np.zeros((N, N, 2), dtype=int)
-        for (at, bt), (strandedness, md, mh) in self.orientations.items():
-            if not (at in tig_to_idx and bt in tig_to_idx):
-                continue
-            ai = tig_to_idx[at]
-            bi = tig_to_idx[bt]
-            P[ai, bi, 0] = P[bi, ai, 0] = md
-            P[ai, bi, 1] = P[bi, ai, 1] = mh
-        return P
+
+        def build():
+            N = self.N
+            a, b, md, mh = self.active_coo("P")
+            P = np.zeros((N, N, 2), dtype=int)
+            P[a, b, 0] = md
+            P[a, b, 1] = mh
+            return P
+
+        return self.active_matrix("P", build)
+
+    def oriented_coo(self):
+        """
+        Returns the entries of Q among the active contigs, with the distances
+        chosen by the current orientations of the contigs.
+        """
+        a, b, k = self.active_coo("Q")
+        signs = self.signs
+        return a, b, k[np.arange(len(a)), orientation_index(signs[a], signs[b])]
 
     @property
     def Q(self):
@@ -497,21 +612,76 @@ class CLMFile:
         Contact frequency matrix when contigs are already oriented. This is s a
         similar matrix as M, but rather than having the number of links in the
         cell, it points to an array that has the actual distances.
+
+        The cached matrix is updated in place for the contigs whose
+        orientations have changed since it was last filled.
         """
         N = self.N
-        tig_to_idx = self.tig_to_idx
-        signs = self.signs
-        Q = np.ones((N, N, BB), dtype=int) * -1  # Use -1 as the sentinel
-        for (at, bt), k in self.contacts_oriented.items():
-            if not (at in tig_to_idx and bt in tig_to_idx):
-                continue
-            ai = tig_to_idx[at]
-            bi = tig_to_idx[bt]
-            ao = signs[ai]
-            bo = signs[bi]
-            Q[ai, bi] = k[(ao, bo)]
+        index = self.active_index
+        signs = self.signs[:N]
+
+        def build():
+            a, b, k = self.oriented_coo()
+            Q = np.ones((N, N, BB), dtype=int) * -1  # Use -1 as the sentinel
+            Q[a, b] = k
+            # Orientations of the contigs (among all contigs) when Q is filled
+            self._Q_signs = np.zeros(len(self.sizes), dtype=int)
+            self._Q_signs[index] = signs
+            return Q
+
+        Q = self.active_matrix("Q", build)
+        (flipped,) = np.nonzero(self._Q_signs[index] != signs)
+        if len(flipped):
+            a, b, k = self.active_coo("Q")
+            update = np.isin(a, flipped) | np.isin(b, flipped)
+            a, b, k = a[update], b[update], k[update]
+            Q[a, b] = k[np.arange(len(a)), orientation_index(signs[a], signs[b])]
+            self._Q_signs[index] = signs
         return Q
 
+    @property
+    def Q_csr(self):
+        """
+        Sparse version of Q in CSR format (indptr, indices, data), where each
+        row of data contains the distances between the two contigs. This
+        avoids the dense N x N x BB matrix when there are many contigs.
+
+        The arrays are cached, they are sorted again only when the active
+        contigs change, and the distances are picked again only when the
+        orientations of the contigs change.
+        """
+        N = self.N
+        index = self.active_index
+        signs = self.signs[:N]
+        if self._Q_csr is not None:
+            cached_index, cached_signs, csr = self._Q_csr
+            if np.array_equal(cached_index, index) and np.array_equal(
+                cached_signs, signs
+            ):
+                return csr
+
+        if self._Q_sorted is None or not np.array_equal(self._Q_sorted[0], index):
+            a, b, k = self.active_coo("Q")
+            order = np.lexsort((b, a))
+            self._Q_sorted = (index, a[order], b[order], k[order])
+
+        _, a, b, k = self._Q_sorted
+        k = k[np.arange(len(a)), orientation_index(signs[a], signs[b])]
+        present = k[:, 0] != -1
+        a, b, k = a[present], b[present], k[present]
+        indptr = np.zeros(N + 1, dtype=int)
+        np.cumsum(np.bincount(a, minlength=N), out=indptr[1:])
+        csr = (indptr, b, k)
+        self._Q_csr = (index, signs.copy(), csr)
+        return csr
+
+
+def orientation_index(ao, bo):
+    """
+    Index into the distances of the 4 orientation configurations, see QQ.
+    """
+    return (1 - ao) + (1 - bo) // 2
+
 
 def hmean_int(a, a_min=5778, a_max=1149851):
     """Harmonic mean of an array, returns the closest int"""
@@ -543,15 +713,82 @@ def golden_array(a, phi=1.61803398875, lb=LB, ub=UB):
     return counts
 
 
+def attach_shared(specs):
+    """Attach the workers of TourScorer to the arrays in shared memory"""
+    data = {}
+    for key, (name, shape, dtype) in specs.items():
+        shm = SharedMemory(name=name)
+        data[key] = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+        data[key + "_shm"] = shm
+    return data
+
+
+class TourScorer(WorkerPool):
+    """
+    Persistent worker pool to score tours with score_evaluate_M(). The contig
+    sizes and contact matrix are placed in shared memory once, so only the
+    tours are sent to the workers. Use as a context manager.
+    """
+
+    def __init__(self, tour_sizes, tour_M, cpus=1):
+        self.tour_sizes = tour_sizes
+        self.tour_M = tour_M
+        self.shms = []
+        if cpus <= 1:
+            data = dict(tour_sizes=tour_sizes, tour_M=tour_M)
+            super().__init__("tour", data)
+            return
+
+        specs = {}
+        for key, a in (("tour_sizes", tour_sizes), ("tour_M", tour_M)):
+            shm = SharedMemory(create=True, size=max(a.nbytes, 1))
+            np.ndarray(a.shape, dtype=a.dtype, buffer=shm.buf)[:] = a
+            self.shms.append(shm)
+            specs[key] = (shm.name, a.shape, a.dtype.str)
+        super().__init__("tour", specs, cpus=cpus, initializer=attach_shared)
+
+    def close(self):
+        super().close()
+        for shm in self.shms:
+            shm.close()
+            shm.unlink()
+        self.shms = []
+
+    def evaluate(self, tour):
+        from .chic import score_evaluate_M
+
+        return score_evaluate_M(tour, self.tour_sizes, self.tour_M)
+
+
+def score_evaluate_M_shared(tour):
+    """Evaluate the score of a tour with the arrays shared by TourScorer. The
+    score of a GA mutant is updated from its parent within the moved window.
+    """
+    from .chic import score_delta_M, score_evaluate_M
+
+    d = worker_data("tour")
+    tour_sizes, tour_M = d["tour_sizes"], d["tour_M"]
+    parent = mutation_parent(tour)
+    if parent is None:
+        return score_evaluate_M(tour, tour_sizes, tour_M)
+
+    parent, (parent_score,), lo, hi, moved = parent
+    (delta_score,) = score_delta_M(
+        parent, tour, lo, hi, tour_sizes, tour_M, moved=moved
+    )
+    return (parent_score + delta_score,)
+
+
 def prune_tour_worker(arg):
     """Worker thread for CLMFile.prune_tour()"""
-    from .chic import score_evaluate_M
+    from .chic import score_delta_M_delete
 
-    t, stour, tour_score, active_sizes, M = arg
-    (stour_score,) = score_evaluate_M(stour, active_sizes, M)
-    delta_score = tour_score - stour_score
-    log10d = np.log10(delta_score) if delta_score > 1e-9 else -9
-    return t, log10d
+    tour, tigs, positions = arg
+    d = worker_data("tour")
+    deltas = score_delta_M_delete(tour, positions, d["tour_sizes"], d["tour_M"])
+    log10ds = np.log10(np.maximum(deltas, 1e-9))
+    log10ds[deltas <= 1e-9] = -9
+    return list(zip(tigs, log10ds.tolist()))
 
 
 def main():
@@ -698,9 +935,12 @@ def read_matrix(
 ):
     """
     Read the matrix from the npy file and apply log transformation and thresholding.
+    The sparse .npz matrix is only made dense for the selected submatrix.
     """
+    from scipy.sparse import issparse
+
     # Load the matrix
-    A = np.load(npyfile)
+    A = load_matrix(npyfile)
     total_bins = header["total_bins"]
 
     # Select specific submatrix
@@ -711,6 +951,8 @@ def read_matrix(
         A = A[contig_start:contig_end, contig_start:contig_end]
     else:
         A = A[:total_bins, :total_bins]
+    if issparse(A):
+        A = A.toarray()
 
     # Convert seqids to positions for each group
     new_groups = []
@@ -804,9 +1046,10 @@ def heatmap(args):
 
     Plot heatmap based on .npy data file. The .npy stores a square matrix with
     bins of genome, and cells inside the matrix represent number of links
-    between bin i and bin j. The `genome.json` contains the offsets of each
-    contig/chr so that we know where to draw boundary lines, or extract per
-    contig/chromosome heatmap.
+    between bin i and bin j. The sparse .npz from `bam2mat --sparse` is also
+    accepted. The `genome.json` contains the offsets of each contig/chr so
+    that we know where to draw boundary lines, or extract per contig/chromosome
+    heatmap.
 
     If a 'groups' file is given (with --groups), we will draw squares on the
     heatmap. The 'groups' file has the following format, for example:
@@ -866,8 +1109,11 @@ def mergemat(args):
     """
     %prog mergemat *.npy
 
-    Combine counts from multiple .npy data files.
+    Combine counts from multiple .npy data files. Sparse .npz files from
+    `bam2mat --sparse` are combined into .npz.
     """
+    from scipy.sparse import csr_matrix, issparse, save_npz
+
     p = OptionParser(mergemat.__doc__)
     p.set_outfile(outfile="out")
     opts, args = p.parse_args(args)
@@ -876,16 +1122,23 @@ def mergemat(args):
         sys.exit(not p.print_help())
 
     npyfiles = args
-    A = np.load(npyfiles[0])
+    A = load_matrix(npyfiles[0])
     logger.debug("Load `%s`: matrix of shape %s; sum=%d", npyfiles[0], A.shape, A.sum())
     for npyfile in npyfiles[1:]:
-        B = np.load(npyfile)
-        A += B
+        B = load_matrix(npyfile)
+        if issparse(A) or issparse(B):
+            A = csr_matrix(A) + csr_matrix(B)
+        else:
+            A += B
         logger.debug("Load `%s`: sum=%d", npyfiles[0], A.sum())
 
     pf = opts.outfile
-    np.save(pf, A)
-    logger.debug("Combined %d files into `%s.npy`", len(npyfiles), pf)
+    if issparse(A):
+        save_npz(pf + ".npz", A)
+        logger.debug("Combined %d files into `%s.npz`", len(npyfiles), pf)
+    else:
+        np.save(pf, A)
+        logger.debug("Combined %d files into `%s.npy`", len(npyfiles), pf)
 
 
 def get_seqstarts(bamfile, N, seqids=None):
@@ -924,6 +1177,113 @@ def get_distbins(start=100, bins=2000, ratio=1.01):
     return bins, binsizes
 
 
+def count_links(
+    bamfilename,
+    seqstarts,
+    total_bins,
+    N,
+    contig=None,
+    minsize=100,
+    bins=1500,
+    threads=1,
+    batchsize=1000000,
+):
+    """
+    Count the links in the bam file into a sparse matrix of bins, plus the
+    link distances into exponentially sized bins, see bam2mat(). Reads are
+    parsed into arrays in batches, then filtered and binned with NumPy. Only
+    reads on `contig` are counted if given, which requires the bam index.
+
+    Returns (A, B, nreads, nlinks), where A is a CSR matrix.
+    """
+    import pysam
+    from scipy.sparse import csr_matrix
+
+    bamfile = pysam.AlignmentFile(bamfilename, "rb", threads=threads)
+    # Bin starts indexed by reference_id, -1 for unused seqids and tid -1
+    tid_starts = np.full(bamfile.nreferences + 1, -1, dtype=int)
+    for seqid, start in seqstarts.items():
+        tid_starts[bamfile.get_tid(seqid)] = start
+    logratio = math.log(1.01)
+
+    A = csr_matrix((total_bins, total_bins), dtype=int)
+    B = np.zeros(bins, dtype=int)
+    nreads = nlinks = 0
+    columns = [array.array("l") for _ in range(6)]
+
+    def add_batch():
+        nonlocal A, B, nlinks
+        flag, mapq, tid, pos, mtid, mpos = (np.array(x, dtype=int) for x in columns)
+        for x in columns:
+            del x[:]
+        # Check all reads, rules borrowed from LACHESIS
+        # https://github.com/shendurelab/LACHESIS/blob/master/src/GenomeLinkMatrix.cc#L1476
+        keep = (flag & 0x600) != 0x600  # qcfail and duplicate
+        keep &= (flag & 0x900) != 0x900  # secondary and supplementary
+        keep &= mapq != 0
+        keep &= (flag & 0x1) != 0  # paired
+        keep &= (flag & 0x80) == 0  # Take only one read
+        astart, bstart = tid_starts[tid], tid_starts[mtid]
+        keep &= (astart >= 0) & (bstart >= 0)
+        dist = np.abs(pos - mpos)
+        same = tid == mtid
+        keep &= ~same | (dist >= minsize)
+
+        dist = dist[keep & same]
+        db = np.rint(np.log(dist / minsize) / logratio).astype(int)
+        B += np.bincount(db[db < bins], minlength=bins)
+
+        abin = astart[keep] + pos[keep] // N
+        bbin = bstart[keep] + mpos[keep] // N
+        off = abin != bbin
+        rows = np.concatenate((abin, bbin[off]))
+        cols = np.concatenate((bbin, abin[off]))
+        data = np.ones(len(rows), dtype=int)
+        A = A + csr_matrix((data, (rows, cols)), shape=A.shape)
+        nlinks += len(abin)
+
+    reads = bamfile.fetch(contig) if contig else bamfile.fetch(until_eof=True)
+    flag, mapq, tid, pos, mtid, mpos = columns
+    for c in reads:
+        nreads += 1
+        cflag = c.flag
+        if cflag & 0x81 != 0x1:  # Only paired read1, checked early to save time
+            continue
+        flag.append(cflag)
+        mapq.append(c.mapping_quality)
+        tid.append(c.reference_id)
+        pos.append(c.reference_start)
+        mtid.append(c.next_reference_id)
+        mpos.append(c.next_reference_start)
+        if len(flag) == batchsize:
+            add_batch()
+            logger.debug("%d reads counted", nreads)
+    add_batch()
+    bamfile.close()
+
+    return A, B, nreads, nlinks
+
+
+def count_links_contig(arg):
+    """
+    Worker for bam2mat(), count the links of reads on one contig.
+    """
+    bamfilename, seqstarts, total_bins, N, contig = arg
+    return count_links(bamfilename, seqstarts, total_bins, N, contig=contig)
+
+
+def load_matrix(npyfile):
+    """
+    Load the link counts saved by bam2mat(), as a CSR matrix from the sparse
+    .npz, otherwise as a dense array from .npy.
+    """
+    if npyfile.endswith(".npz"):
+        from scipy.sparse import load_npz
+
+        return load_npz(npyfile).tocsr()
+    return np.load(npyfile)
+
+
 def bam2mat(args):
     """
     %prog bam2mat input.bam
@@ -931,9 +1291,11 @@ def bam2mat(args):
     Convert bam file to .mat format, which is simply numpy 2D array. Important
     parameter is the resolution, which is the cell size. Small cell size lead
     to more fine-grained heatmap, but leads to large .mat size and slower
-    plotting.
+    plotting. Use --sparse to save a sparse .npz matrix instead, with only the
+    non-zero cells.
     """
     import pysam
+    from scipy.sparse import save_npz
     from jcvi.utils.cbook import percentage
 
     p = OptionParser(bam2mat.__doc__)
@@ -948,6 +1310,13 @@ def bam2mat(args):
         default=None,
         help="Use a given seqids file, a single line with seqids joined by comma",
     )
+    p.add_argument(
+        "--sparse",
+        default=False,
+        action="store_true",
+        help="Save link counts as sparse matrix in .npz",
+    )
+    p.set_cpus(cpus=1)
     opts, args = p.parse_args(args)
 
     if len(args) != 1:
@@ -961,7 +1330,7 @@ def bam2mat(args):
     minsize = 100  # Record distance if it is at least minsize
     seqids = (
         open(opts.seqids).readline().strip().split(",")
-        if op.exists(opts.seqids)
+        if opts.seqids and op.exists(opts.seqids)
         else None
     )
 
@@ -993,62 +1362,44 @@ def bam2mat(args):
     logger.debug("Contig bin starts written to `%s`", jsonfile)
 
     print(sorted(seqstarts.items(), key=lambda x: x[-1]))
-    logger.debug("Initialize matrix of size %dx%d", total_bins, total_bins)
-    A = np.zeros((total_bins, total_bins), dtype=int)
-    B = np.zeros(bins, dtype=int)
-
-    # Find the bin ID of each read
-    def bin_number(chr, pos):
-        return seqstarts[chr] + pos // N
-
-    def distbin_number(dist, start=minsize, ratio=1.01):
-        return int(round(math.log(dist * 1.0 / start, ratio)))
-
-    bamfile = pysam.AlignmentFile(bamfilename, "rb")
-    # Check all reads, rules borrowed from LACHESIS
-    # https://github.com/shendurelab/LACHESIS/blob/master/src/GenomeLinkMatrix.cc#L1476
-    j = k = 0
-    for c in bamfile:
-        j += 1
-        if j % 100000 == 0:
-            print("{} reads counted".format(j), file=sys.stderr)
-
-        if c.is_qcfail and c.is_duplicate:
-            continue
-        if c.is_secondary and c.is_supplementary:
-            continue
-        if c.mapping_quality == 0:
-            continue
-        if not c.is_paired:
-            continue
-        if c.is_read2:  # Take only one read
-            continue
-
-        # pysam v0.8.3 does not support keyword reference_name
-        achr = bamfile.getrname(c.reference_id)
-        apos = c.reference_start
-        bchr = bamfile.getrname(c.next_reference_id)
-        bpos = c.next_reference_start
-        if achr not in seqstarts or bchr not in seqstarts:
-            continue
-        if achr == bchr:
-            dist = abs(apos - bpos)
-            if dist < minsize:
-                continue
-            db = distbin_number(dist)
-            B[db] += 1
-
-        abin, bbin = bin_number(achr, apos), bin_number(bchr, bpos)
-        A[abin, bbin] += 1
-        if abin != bbin:
-            A[bbin, abin] += 1
-
-        k += 1
+    cpus = opts.cpus
+    indexed = False
+    if cpus > 1:
+        with pysam.AlignmentFile(bamfilename, "rb") as bamfile:
+            indexed = bamfile.has_index()
+    if indexed:
+        # Count each seqid on its own, largest first
+        contigs = sorted(seqsize, key=lambda x: -seqsize[x])
+        logger.debug("Count links on %d seqids with %d CPUs", len(contigs), cpus)
+        A = B = None
+        j = k = 0
+        with Pool(processes=cpus) as pool:
+            for a, b, nreads, nlinks in pool.imap_unordered(
+                count_links_contig,
+                [(bamfilename, seqstarts, total_bins, N, x) for x in contigs],
+            ):
+                A = a if A is None else A + a
+                B = b if B is None else B + b
+                j += nreads
+                k += nlinks
+    else:
+        A, B, j, k = count_links(
+            bamfilename,
+            seqstarts,
+            total_bins,
+            N,
+            minsize=minsize,
+            bins=bins,
+            threads=cpus,
+        )
 
     logger.debug("Total reads counted: %s", percentage(2 * k, j))
-    bamfile.close()
-    np.save(pf, A)
-    logger.debug("Link counts written to `%s.npy`", pf)
+    if opts.sparse:
+        save_npz(pf + ".npz", A)
+        logger.debug("Link counts written to `%s.npz`", pf)
+    else:
+        np.save(pf, A.toarray())
+        logger.debug("Link counts written to `%s.npy`", pf)
     np.save(pf + ".dist", B)
     logger.debug("Link dists written to `%s.dist.npy`", pf)
 
@@ -1275,6 +1626,12 @@ def optimize(args):
         help="Do not resume from existing tour file",
     )
     p.add_argument("--skipGA", default=False, action="store_true", help="Skip GA step")
+    p.add_argument(
+        "--sparse",
+        default=False,
+        action="store_true",
+        help="Use sparse contact matrix for orientations, to save memory for many contigs",
+    )
     p.set_outfile(outfile=None)
     p.set_cpus()
     opts, args = p.parse_args(args)
@@ -1288,7 +1645,7 @@ def optimize(args):
     cpus = opts.cpus
 
     # Load contact map
-    clm = CLMFile(clmfile, skiprecover=opts.skiprecover)
+    clm = CLMFile(clmfile, skiprecover=opts.skiprecover, sparse=opts.sparse)
 
     tourfile = opts.outfile or clmfile.rsplit(".", 1)[0] + ".tour"
     if startover:
@@ -1320,8 +1677,6 @@ def optimize_ordering(fwtour, clm, phase, cpus):
     """
     Optimize the ordering of contigs by Genetic Algorithm (GA).
     """
-    from .chic import score_evaluate_M
-
     # Prepare input files
     tour_contigs = clm.active_contigs
     tour_sizes = clm.active_sizes
@@ -1342,10 +1697,11 @@ def optimize_ordering(fwtour, clm, phase, cpus):
 
     callbacki = partial(callback, phase=phase, oo=oo)
     toolbox = GA_setup(tour)
-    toolbox.register("evaluate", score_evaluate_M, tour_sizes=tour_sizes, tour_M=tour_M)
-    tour, tour_fitness = GA_run(
-        toolbox, ngen=1000, npop=100, cpus=cpus, callback=callbacki
-    )
+    toolbox.register("evaluate", score_evaluate_M_shared)
+    with TourScorer(tour_sizes, tour_M, cpus) as scorer:
+        tour, tour_fitness = GA_run(
+            toolbox, ngen=1000, npop=100, cpus=cpus, callback=callbacki, pool=scorer
+        )
     clm.tour = tour
 
     return tour
@@ -19,17 +19,25 @@ see supplementary info for sea anemone genome paper, formula::
 
 Finally a blast.filtered file is created.
 """
-import sys
+
+import heapq
 import os.path as op
+import resource
+import shutil
+import sys
+import tempfile
 
 from collections import defaultdict
 from itertools import groupby
 
+import numpy as np
+
 from ..apps.base import OptionParser, logger
 from ..compara.synteny import check_beds
-from ..formats.blast import Blast
-from ..utils.cbook import gene_name
-from ..utils.grouper import Grouper
+from ..formats.base import must_open
+from ..formats.blast import Blast, BlastLine, best_scores, cscores
+from ..utils.cbook import gene_name, human_size
+from ..utils.grouper import IntGrouper
 
 
 def blastfilter_main(blast_file, p, opts):
@@ -48,51 +56,9 @@ def blastfilter_main(blast_file, p, opts):
     bl = Blast(blast_file)
     blasts = sorted(list(bl), key=lambda b: b.score, reverse=True)
 
-    filtered_blasts = []
-    seen = set()
-    ostrip = opts.strip_names
-    nwarnings = 0
-    for b in blasts:
-        query, subject = b.query, b.subject
-        if query == subject:
-            continue
-
-        if ostrip:
-            query, subject = gene_name(query), gene_name(subject)
-        if query not in qorder:
-            if nwarnings < 100:
-                logger.warning("{} not in {}".format(query, qbed.filename))
-            elif nwarnings == 100:
-                logger.warning("too many warnings.. suppressed")
-            nwarnings += 1
-            continue
-        if subject not in sorder:
-            if nwarnings < 100:
-                logger.warning("{} not in {}".format(subject, sbed.filename))
-            elif nwarnings == 100:
-                logger.warning("too many warnings.. suppressed")
-            nwarnings += 1
-            continue
-
-        qi, q = qorder[query]
-        si, s = sorder[subject]
-
-        if is_self and qi > si:
-            # move all hits to same side when doing self-self BLAST
-            query, subject = subject, query
-            qi, si = si, qi
-            q, s = s, q
-
-        key = query, subject
-        if key in seen:
-            continue
-        seen.add(key)
-        b.query, b.subject = [str(k) for k in key]
-
-        b.qi, b.si = qi, si
-        b.qseqid, b.sseqid = q.seqid, s.seqid
-
-        filtered_blasts.append(b)
+    filtered_blasts = list(
+        iter_blast_ranks(blasts, qbed, sbed, qorder, sorder, is_self, opts.strip_names)
+    )
 
     if exclude:
         before_filter = len(filtered_blasts)
@@ -159,6 +125,250 @@ def blastfilter_main(blast_file, p, opts):
     fw = open(blastfilteredfile, "w")
     write_new_blast(filtered_blasts, fh=fw)
     fw.close()
+    log_peak_memory()
+
+
+def blastfilter_streaming(blast_file, p, opts):
+    """
+    Same filters as blastfilter_main(), but the hits are never all held in
+    memory: the BLAST file is sorted on disk by decreasing score, and the
+    filters are chained as generators over the sorted stream. The local dups
+    filter needs the tandems first, so the stream is spilled to disk and
+    replayed once the tandems are known. The hits used to group the tandems
+    are also sorted on disk (TandemHits), so that memory is bounded by
+    `--chunksize` and the size of the bed files.
+    """
+    qbed, sbed, qorder, sorder, is_self = check_beds(blast_file, p, opts)
+
+    tandem_Nmax = opts.tandem_Nmax
+    cscore = opts.cscore
+    exclude = opts.exclude
+
+    logger.debug("Sort BLAST file `%s` (chunksize=%d)", blast_file, opts.chunksize)
+    blasts = sort_blast(blast_file, chunksize=opts.chunksize, tmpdir=opts.tmpdir)
+    filtered_blasts = iter_blast_ranks(
+        blasts, qbed, sbed, qorder, sorder, is_self, opts.strip_names
+    )
+    if exclude:
+        logger.debug("running excluded pairs (--exclude `{}`) ..".format(exclude))
+        filtered_blasts = filter_exclude(filtered_blasts, exclude=exclude)
+    if cscore:
+        logger.debug("running the cscore filter (cscore>=%.2f) .." % cscore)
+        filtered_blasts = filter_cscore_sorted(filtered_blasts, cscore=cscore)
+
+    blastfilteredfile = blast_file + ".filtered"
+    if not tandem_Nmax:
+        with open(blastfilteredfile, "w") as fw:
+            write_new_blast(filtered_blasts, fh=fw)
+        log_peak_memory()
+        return
+
+    logger.debug(
+        "running the local dups filter (tandem_Nmax={}) ..".format(tandem_Nmax)
+    )
+    workdir = tempfile.mkdtemp(dir=opts.tmpdir)
+    spillfile = op.join(workdir, "filtered.blast")
+    # only keep what the tandem grouping needs, keyed by the gene ranks
+    qsimple = TandemHits(workdir, "qhits", chunksize=opts.chunksize)
+    ssimple = TandemHits(workdir, "shits", chunksize=opts.chunksize)
+    with open(spillfile, "w") as fw:
+        for b in filtered_blasts:
+            print(b, file=fw)
+            if b.evalue < 1e-10:
+                qsimple.append((b.si, (b.qseqid, b.qi)))
+                ssimple.append((b.qi, (b.sseqid, b.si)))
+
+    qtandems = group_tandems(qsimple, tandem_Nmax=tandem_Nmax)
+    standems = group_tandems(ssimple, tandem_Nmax=tandem_Nmax)
+
+    qdups_fh = (
+        open(op.splitext(opts.qbed)[0] + ".localdups", "w")
+        if opts.tandems_only
+        else None
+    )
+    if is_self:
+        for s in standems:
+            qtandems.join(*s)
+        qdups_to_mother = write_localdups(qtandems, qbed, qdups_fh)
+        sdups_to_mother = qdups_to_mother
+    else:
+        qdups_to_mother = write_localdups(qtandems, qbed, qdups_fh)
+        sdups_fh = (
+            open(op.splitext(opts.sbed)[0] + ".localdups", "w")
+            if opts.tandems_only
+            else None
+        )
+        sdups_to_mother = write_localdups(standems, sbed, sdups_fh)
+
+    if opts.tandems_only:
+        # write out new .bed after tandem removal
+        write_new_bed(qbed, qdups_to_mother)
+        if not is_self:
+            write_new_bed(sbed, sdups_to_mother)
+
+    with open(blastfilteredfile, "w") as fw:
+        filtered_blasts = filter_tandem_sorted(
+            Blast(spillfile), qorder, sorder, qdups_to_mother, sdups_to_mother
+        )
+        write_new_blast(filtered_blasts, fh=fw)
+    shutil.rmtree(workdir)
+    log_peak_memory()
+
+
+def log_peak_memory():
+    # ru_maxrss is reported in kilobytes on Linux
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    logger.debug(
+        "Peak memory usage: %s", human_size(peak, a_kilobyte_is_1024_bytes=True)
+    )
+
+
+def _iter_blast_chunk(chunkfile):
+    with open(chunkfile) as fp:
+        for row in fp:
+            yield BlastLine(row)
+
+
+class TandemHits(object):
+    """
+    The (gene, (seqid, rank)) hits of group_tandems(), sorted on disk: chunks
+    of `chunksize` hits are sorted in memory and written to `workdir`, then
+    merged lazily when iterated.
+    """
+
+    def __init__(self, workdir, name, chunksize=1000000):
+        self.workdir = workdir
+        self.name = name
+        self.chunksize = chunksize
+        self.chunk = []
+        self.chunkfiles = []
+
+    def append(self, hit):
+        self.chunk.append(hit)
+        if len(self.chunk) >= self.chunksize:
+            self.spill()
+
+    def spill(self):
+        self.chunk.sort()
+        chunkfile = op.join(
+            self.workdir, "{}{}".format(self.name, len(self.chunkfiles))
+        )
+        with open(chunkfile, "w") as fw:
+            for gene, (seqid, rank) in self.chunk:
+                print(gene, seqid, rank, sep="\t", file=fw)
+        self.chunkfiles.append(chunkfile)
+        self.chunk = []
+
+    def __iter__(self):
+        if self.chunk:
+            self.spill()
+        return heapq.merge(*[self._iter_chunk(x) for x in self.chunkfiles])
+
+    @staticmethod
+    def _iter_chunk(chunkfile):
+        with open(chunkfile) as fp:
+            for row in fp:
+                gene, seqid, rank = row.rstrip("\n").split("\t")
+                yield int(gene), (seqid, int(rank))
+
+
+def sort_blast(blast_file, chunksize=1000000, tmpdir=None):
+    """
+    External merge sort of the BLAST file by decreasing score. Chunks of
+    `chunksize` lines are sorted in memory and written to disk, then merged
+    lazily. Ties keep their order in the file, same as sorting in memory.
+
+    Args:
+        blast_file (str): Path to the BLAST file.
+        chunksize (int): Number of lines to sort in memory at a time.
+        tmpdir (str, optional): Directory to hold the sorted chunks.
+
+    Yields:
+        BlastLine: Hits in decreasing order of score.
+    """
+    workdir = tempfile.mkdtemp(dir=tmpdir)
+    chunkfiles = []
+
+    def spill(chunk):
+        # only the raw rows are kept, sorted by the parsed score
+        chunk.sort(key=lambda x: x[0], reverse=True)
+        chunkfile = op.join(workdir, "chunk{}".format(len(chunkfiles)))
+        with open(chunkfile, "w") as fw:
+            for score, row in chunk:
+                fw.write(row if row.endswith("\n") else row + "\n")
+        chunkfiles.append(chunkfile)
+
+    try:
+        chunk = []
+        with must_open(blast_file) as fp:
+            for row in fp:
+                if row[0] == "#":
+                    continue
+                chunk.append((BlastLine(row).score, row))
+                if len(chunk) >= chunksize:
+                    spill(chunk)
+                    chunk = []
+        if chunk:
+            spill(chunk)
+        del chunk
+
+        chunks = [_iter_blast_chunk(x) for x in chunkfiles]
+        for b in heapq.merge(*chunks, key=lambda x: x.score, reverse=True):
+            yield b
+    finally:
+        shutil.rmtree(workdir)
+
+
+def iter_blast_ranks(blasts, qbed, sbed, qorder, sorder, is_self, ostrip=True):
+    """
+    Convert gene names in the hits to ranks in the bed files, dropping hits to
+    self, hits to genes not in the bed files, and repeated gene pairs (keyed by
+    an integer from the gene ranks).
+    """
+    seen = set()
+    nsbed = len(sbed)
+    nwarnings = 0
+    for b in blasts:
+        query, subject = b.query, b.subject
+        if query == subject:
+            continue
+
+        if ostrip:
+            query, subject = gene_name(query), gene_name(subject)
+        if query not in qorder:
+            if nwarnings < 100:
+                logger.warning("{} not in {}".format(query, qbed.filename))
+            elif nwarnings == 100:
+                logger.warning("too many warnings.. suppressed")
+            nwarnings += 1
+            continue
+        if subject not in sorder:
+            if nwarnings < 100:
+                logger.warning("{} not in {}".format(subject, sbed.filename))
+            elif nwarnings == 100:
+                logger.warning("too many warnings.. suppressed")
+            nwarnings += 1
+            continue
+
+        qi, q = qorder[query]
+        si, s = sorder[subject]
+
+        if is_self and qi > si:
+            # move all hits to same side when doing self-self BLAST
+            query, subject = subject, query
+            qi, si = si, qi
+            q, s = s, q
+
+        key = qi * nsbed + si
+        if key in seen:
+            continue
+        seen.add(key)
+        b.query, b.subject = str(query), str(subject)
+
+        b.qi, b.si = qi, si
+        b.qseqid, b.sseqid = q.seqid, s.seqid
+
+        yield b
 
 
 def write_localdups(tandems, bed, dups_fh=None):
@@ -223,15 +433,42 @@ def filter_exclude(blast_list, exclude=None):
 
 
 def filter_cscore(blast_list, cscore=0.5):
+    """
+    Keep the hits with C-score above the cutoff, where the best scores of the
+    genes are computed on arrays with the gene names interned into ids.
+    """
+    blast_list = list(blast_list)
+    gene_ids = {}
+    query = np.fromiter(
+        (gene_ids.setdefault(b.query, len(gene_ids)) for b in blast_list),
+        dtype=int,
+        count=len(blast_list),
+    )
+    subject = np.fromiter(
+        (gene_ids.setdefault(b.subject, len(gene_ids)) for b in blast_list),
+        dtype=int,
+        count=len(blast_list),
+    )
+    score = np.fromiter(
+        (b.score for b in blast_list), dtype=float, count=len(blast_list)
+    )
+    best = best_scores(query, subject, score, len(gene_ids))
+    (rows,) = np.nonzero(cscores(query, subject, score, best) > cscore)
+    for i in rows.tolist():
+        yield blast_list[i]
+
 
+def filter_cscore_sorted(blast_list, cscore=0.5):
+    """
+    Single pass version of filter_cscore() for hits sorted by decreasing score,
+    where the best score of a gene is already known when its hit is seen.
+    """
     best_score = defaultdict(float)
     for b in blast_list:
         if b.score > best_score[b.query]:
             best_score[b.query] = b.score
         if b.score > best_score[b.subject]:
             best_score[b.subject] = b.score
-
-    for b in blast_list:
         cur_cscore = b.score / max(best_score[b.query], best_score[b.subject])
         if cur_cscore > cscore:
             yield b
@@ -259,6 +496,27 @@ def filter_tandem(blast_list, qdups_to_mother, sdups_to_mother):
         yield b
 
 
+def filter_tandem_sorted(blast_list, qorder, sorder, qdups_to_mother, sdups_to_mother):
+    """
+    Streaming version of filter_tandem() for hits sorted by decreasing score,
+    with repeated gene pairs keyed by an integer from the gene ranks.
+    """
+    seen = set()
+    nsorder = len(sorder)
+    for b in blast_list:
+        if b.query in qdups_to_mother:
+            b.query = qdups_to_mother[b.query]
+        if b.subject in sdups_to_mother:
+            b.subject = sdups_to_mother[b.subject]
+        if b.query == b.subject:
+            continue
+        key = qorder[b.query][0] * nsorder + sorder[b.subject][0]
+        if key in seen:
+            continue
+        seen.add(key)
+        yield b
+
+
 def tandem_grouper(blast_list, tandem_Nmax=10, flip=True):
     if not flip:
         simple_blast = [
@@ -269,17 +527,33 @@ def tandem_grouper(blast_list, tandem_Nmax=10, flip=True):
             (b.subject, (b.qseqid, b.qi)) for b in blast_list if b.evalue < 1e-10
         ]
 
-    simple_blast.sort()
+    return group_tandems(simple_blast, tandem_Nmax=tandem_Nmax)
 
-    standems = Grouper()
+
+def group_tandems(simple_blast, tandem_Nmax=10, link_batch=1000000):
+    """
+    Group the genes hitting the same gene into tandems, `simple_blast` is a
+    list of (gene, (seqid, rank)) where rank is the position of the other gene,
+    or an iterable of them that is already sorted (e.g. TandemHits).
+    """
+    if isinstance(simple_blast, list):
+        simple_blast.sort()
+
+    # keys are gene ranks, collect the links then join them in bulk
+    standems = IntGrouper()
+    ia, ib = [], []
     for name, hits in groupby(simple_blast, key=lambda x: x[0]):
         # these are already sorted.
         hits = [x[1] for x in hits]
-        for ia, a in enumerate(hits[:-1]):
-            b = hits[ia + 1]
+        for a, b in zip(hits[:-1], hits[1:]):
             # on the same chr and rank difference no larger than tandem_Nmax
             if b[1] - a[1] <= tandem_Nmax and b[0] == a[0]:
-                standems.join(a[1], b[1])
+                ia.append(a[1])
+                ib.append(b[1])
+        if len(ia) >= link_batch:
+            standems.join_pairs(ia, ib)
+            ia, ib = [], []
+    standems.join_pairs(ia, ib)
 
     return standems
 
@@ -311,6 +585,19 @@ def main(args):
         "higher is more stringent",
     )
     p.add_argument("--exclude", help="Remove anchors from a previous run")
+    p.add_argument(
+        "--streaming",
+        default=False,
+        action="store_true",
+        help="Sort and filter the hits on disk with bounded memory",
+    )
+    p.add_argument(
+        "--chunksize",
+        default=1000000,
+        type=int,
+        help="Number of lines to sort in memory in --streaming mode",
+    )
+    p.set_tmpdir()
 
     opts, args = p.parse_args(args)
 
@@ -318,7 +605,10 @@ def main(args):
         sys.exit(not p.print_help())
 
     (blastfile,) = args
-    blastfilter_main(blastfile, p, opts)
+    if opts.streaming:
+        blastfilter_streaming(blastfile, p, opts)
+    else:
+        blastfilter_main(blastfile, p, opts)
 
 
 if __name__ == "__main__":
@@ -31,7 +31,7 @@ from ..formats.blast import (
 )
 from ..formats.fasta import Fasta
 from ..utils.cbook import gene_name
-from ..utils.grouper import Grouper
+from ..utils.grouper import Grouper, IntGrouper
 
 from .base import AnchorFile
 from .synteny import check_beds
@@ -403,18 +403,24 @@ def group(args):
         sys.exit(not p.print_help())
 
     anchorfiles = args
-    groups = Grouper()
+    # intern gene names to integer ids, in the order they are first seen
+    ids = {}
+    ia, ib = [], []
     for anchorfile in anchorfiles:
         ac = AnchorFile(anchorfile)
         for a, b, idx in ac.iter_pairs():
-            groups.join(a, b)
+            ia.append(ids.setdefault(a, len(ids)))
+            ib.append(ids.setdefault(b, len(ids)))
+    groups = IntGrouper(len(ids))
+    groups.join_pairs(ia, ib)
+    names = list(ids.keys())
 
     logger.debug("Created %d groups with %d members.", len(groups), groups.num_members)
 
     outfile = opts.outfile
     fw = must_open(outfile, "w")
     for g in groups:
-        print(",".join(sorted(g)), file=fw)
+        print(",".join(sorted(names[x] for x in g)), file=fw)
     fw.close()
 
     return outfile
@@ -765,6 +771,8 @@ def ortholog(args):
                 dargs += ["--theme", opts.theme]
             if opts.notex:
                 dargs += ["--notex"]
+            if opts.raster:
+                dargs += ["--raster"]
             dotplot_main(dargs)
         return
 
@@ -7,17 +7,19 @@ Calculation of synonymous substitutions (Ks).
 import csv
 import os
 import os.path as op
+import shlex
 import sys
 
-from functools import partial
-from itertools import combinations, product
+from functools import lru_cache, partial
+from glob import glob
+from io import StringIO
+from itertools import combinations, permutations, product
 from math import exp, log, pi, sqrt
 from typing import Optional
 
 import numpy as np
 
 from Bio import AlignIO, SeqIO
-from Bio.Align.Applications import ClustalwCommandline, MuscleCommandline
 
 from ..apps.base import (
     ActionDispatcher,
@@ -30,6 +32,7 @@ from ..apps.base import (
     mkdir,
     sh,
 )
+from ..apps.grid import WorkerPool, worker_data
 from ..formats.base import LineFile, must_open
 from ..graphics.base import AbstractLayout, adjust_spines, markup, plt, savefig
 from ..utils.cbook import gene_name
@@ -50,13 +53,17 @@ class AbstractCommandline:
 class YnCommandline(AbstractCommandline):
     """Little commandline for yn00."""
 
-    def __init__(self, ctl_file, command=PAML_BIN("yn00")):
+    def __init__(self, ctl_file, command=None, work_dir=None):
         self.ctl_file = ctl_file
         self.parameters = []
-        self.command = command
+        self.command = command or PAML_BIN("yn00")
+        self.work_dir = work_dir
 
     def __str__(self):
-        return self.command + " %s >/dev/null" % self.ctl_file
+        cmd = self.command + " %s >/dev/null" % self.ctl_file
+        if self.work_dir:
+            cmd = "cd %s && %s" % (shlex.quote(self.work_dir), cmd)
+        return cmd
 
 
 class MrTransCommandline(AbstractCommandline):
@@ -68,13 +75,13 @@ class MrTransCommandline(AbstractCommandline):
         nuc_file,
         output_file,
         outfmt="paml",
-        command=PAL2NAL_BIN("pal2nal.pl"),
+        command=None,
     ):
         self.prot_align_file = prot_align_file
         self.nuc_file = nuc_file
         self.output_file = output_file
         self.outfmt = outfmt
-        self.command = command
+        self.command = command or PAL2NAL_BIN("pal2nal.pl")
 
         self.parameters = []
 
@@ -547,6 +554,14 @@ def calc(args):
         3. Convert the output to Fasta format.
         4. Use this alignment info to align gene sequences using PAL2NAL
         5. Run PAML yn00 to calculate synonymous mutation rates.
+
+    With --method=ng86, steps 4 and 5 are done in process: the CDS pair is
+    aligned following the protein alignment and Nei-Gojobori (1986) Ks/Ka are
+    computed from precomputed codon tables, without PAL2NAL or yn00.
+
+    With --cpus, pairs are computed by a pool of workers, each in its own
+    scratch folder under --workdir, and rows are written in input order.
+    With --resume, pairs already in the output file are skipped.
     """
     from jcvi.formats.fasta import translate
 
@@ -562,7 +577,19 @@ def calc(args):
         choices=("clustalw", "muscle"),
         help="software used to align the proteins",
     )
+    p.add_argument(
+        "--method",
+        default="yn00",
+        choices=("yn00", "ng86"),
+        help="Run PAML yn00, or compute NG86 Ks/Ka in process (no yn00 columns)",
+    )
     p.add_argument("--workdir", default=os.getcwd(), help="Work directory")
+    p.add_argument(
+        "--resume",
+        action="store_true",
+        help="Skip pairs already in the output file and append to it",
+    )
+    p.set_cpus(cpus=1)
     p.set_outfile()
 
     opts, args = p.parse_args(args)
@@ -575,8 +602,13 @@ def calc(args):
         print("Incorrect arguments", file=sys.stderr)
         sys.exit(not p.print_help())
 
-    output_h = must_open(opts.outfile, "w")
-    print(fields, file=output_h)
+    done = resume_pairs(opts.outfile) if opts.resume else None
+    if done is None:
+        output_h = must_open(opts.outfile, "w")
+        print(fields, file=output_h)
+    else:
+        logger.debug("Resume `%s` after %d pairs", opts.outfile, len(done))
+        output_h = open(opts.outfile, "a")
     work_dir = op.join(opts.workdir, "syn_analysis")
     mkdir(work_dir)
 
@@ -589,59 +621,123 @@ def calc(args):
 
     prot_iterator = SeqIO.parse(open(protein_file), "fasta")
     dna_iterator = SeqIO.parse(open(dna_file), "fasta")
-    for p_rec_1, p_rec_2, n_rec_1, n_rec_2 in zip(
-        prot_iterator, prot_iterator, dna_iterator, dna_iterator
-    ):
-
-        print("--------", p_rec_1.name, p_rec_2.name, file=sys.stderr)
-        if opts.msa == "clustalw":
-            align_fasta = clustal_align_protein((p_rec_1, p_rec_2), work_dir)
-        elif opts.msa == "muscle":
-            align_fasta = muscle_align_protein((p_rec_1, p_rec_2), work_dir)
-        mrtrans_fasta = run_mrtrans(align_fasta, (n_rec_1, n_rec_2), work_dir)
-        if mrtrans_fasta:
-            ds_subs_yn, dn_subs_yn, ds_subs_ng, dn_subs_ng = find_synonymous(
-                mrtrans_fasta, work_dir
-            )
-            if ds_subs_yn is not None:
-                pair_name = "%s;%s" % (p_rec_1.name, p_rec_2.name)
-                output_h.write(
-                    "%s\n"
-                    % (
-                        ",".join(
-                            str(x)
-                            for x in (
-                                pair_name,
-                                ds_subs_yn,
-                                dn_subs_yn,
-                                ds_subs_ng,
-                                dn_subs_ng,
-                            )
-                        )
-                    )
-                )
-                output_h.flush()
+    pairs = zip(prot_iterator, prot_iterator, dna_iterator, dna_iterator)
+    if done:
+        pairs = (x for x in pairs if pair_name(x) not in done)
+
+    data = dict(work_dir=work_dir, msa=opts.msa, method=opts.method)
+    try:
+        with WorkerPool(
+            "ks", data, cpus=opts.cpus, initializer=attach_worker_dir
+        ) as pool:
+            for row in pool.imap(calc_pair, pairs, chunksize=4):
+                if row is not None:
+                    output_h.write(row + "\n")
+                    output_h.flush()
+    finally:
+        output_h.close()
+        cleanup(glob(op.join(work_dir, "worker.*")))
 
     # Clean-up
     sh("rm -rf 2YN.t 2YN.dN 2YN.dS rst rub rst1 syn_analysis")
 
 
+def pair_name(recs):
+    p_rec_1, p_rec_2 = recs[:2]
+    return "%s;%s" % (p_rec_1.name, p_rec_2.name)
+
+
+def resume_pairs(ksfile):
+    """
+    Returns the names of the pairs in a partially written ksfile, or None if
+    there is nothing to resume. A trailing incomplete row, e.g. from an
+    interrupted run, is truncated so that the pair is computed again.
+    """
+    if ksfile in ("-", "stdout") or not op.exists(ksfile):
+        return None
+    with open(ksfile, "r+") as fp:
+        text = fp.read()
+        complete = text[: text.rfind("\n") + 1]
+        if len(complete) < len(text):
+            fp.seek(len(complete))
+            fp.truncate()
+    rows = complete.splitlines()
+    if not rows or rows[0] != fields:
+        return None
+    return set(row.split(",", 1)[0] for row in rows[1:])
+
+
+def attach_worker_dir(data):
+    """
+    Each worker of calc() gets its own scratch folder.
+    """
+    work_dir = op.join(data["work_dir"], "worker.{}".format(os.getpid()))
+    mkdir(work_dir)
+    return dict(data, work_dir=work_dir)
+
+
+def calc_pair(recs):
+    """
+    Returns the output row of a pair, see ks_pair().
+    """
+    d = worker_data("ks")
+    return ks_pair(recs, d["work_dir"], msa=d["msa"], method=d["method"])
+
+
+def ks_pair(recs, work_dir, msa="clustalw", method="yn00"):
+    """
+    Align the protein pair and then the CDS pair, and run yn00, or the built-in
+    NG86 estimator. All the intermediate files are in work_dir, so concurrent
+    calls need separate folders. Returns the output row, or None if any of
+    the steps failed.
+    """
+    p_rec_1, p_rec_2, n_rec_1, n_rec_2 = recs
+    print("--------", p_rec_1.name, p_rec_2.name, file=sys.stderr)
+    if msa == "clustalw":
+        align_fasta = clustal_align_protein((p_rec_1, p_rec_2), work_dir)
+    elif msa == "muscle":
+        align_fasta = muscle_align_protein((p_rec_1, p_rec_2), work_dir)
+
+    if method == "ng86":
+        aligned_proteins = [x.seq for x in SeqIO.parse(StringIO(align_fasta), "fasta")]
+        aligned = back_translate(aligned_proteins, (n_rec_1.seq, n_rec_2.seq))
+        if not aligned:
+            return None
+        ds_subs_ng, dn_subs_ng = ng86(*aligned)
+        # yn00 columns are left empty
+        return ",".join(
+            (pair_name(recs), "", "", "%.4f" % ds_subs_ng, "%.4f" % dn_subs_ng)
+        )
+
+    mrtrans_fasta = run_mrtrans(align_fasta, (n_rec_1, n_rec_2), work_dir)
+    if not mrtrans_fasta:
+        return None
+    ds_subs_yn, dn_subs_yn, ds_subs_ng, dn_subs_ng = find_synonymous(
+        mrtrans_fasta, work_dir
+    )
+    if ds_subs_yn is None:
+        return None
+    return ",".join(
+        str(x)
+        for x in (pair_name(recs), ds_subs_yn, dn_subs_yn, ds_subs_ng, dn_subs_ng)
+    )
+
+
 def find_synonymous(input_file, work_dir):
     """Run yn00 to find the synonymous subsitution rate for the alignment."""
-    cwd = os.getcwd()
-    os.chdir(work_dir)
     # create the .ctl file
-    ctl_file = "yn-input.ctl"
-    output_file = "nuc-subs.yn"
+    ctl_file = op.join(work_dir, "yn-input.ctl")
+    output_file = op.join(work_dir, "nuc-subs.yn")
     ctl_h = open(ctl_file, "w")
     ctl_h.write(
         "seqfile = %s\noutfile = %s\nverbose = 0\n"
-        % (op.basename(input_file), output_file)
+        % (op.basename(input_file), op.basename(output_file))
     )
     ctl_h.write("icode = 0\nweighting = 0\ncommonf3x4 = 0\n")
     ctl_h.close()
 
-    cl = YnCommandline(ctl_file)
+    # yn00 runs within work_dir, without changing the cwd of this process
+    cl = YnCommandline(op.basename(ctl_file), work_dir=work_dir)
     print("\tyn00:", cl, file=sys.stderr)
     r, e = cl.run()
     ds_value_yn = None
@@ -673,7 +769,6 @@ def find_synonymous(input_file, work_dir):
         h = open(output_file)
         print("yn00 didn't work: \n%s" % h.read(), file=sys.stderr)
 
-    os.chdir(cwd)
     return ds_value_yn, dn_value_yn, ds_value_ng, dn_value_ng
 
 
@@ -699,6 +794,131 @@ def extract_subs_value(text):
     return value
 
 
+@lru_cache(maxsize=None)
+def ng86_tables():
+    """
+    Lookup tables for Nei and Gojobori (1986) over the 64 codons indexed in
+    ACGT order (AAA=0, AAC=1, ..., TTT=63), using the standard code:
+
+    - sites: synonymous sites of each codon, nonsynonymous sites are 3 - sites
+    - sd, nd: synonymous and nonsynonymous differences between two codons,
+      averaged over the mutational pathways that avoid stop codons
+    - stop: whether the codon is a stop codon
+    """
+    from Bio.Data.CodonTable import standard_dna_table
+
+    codons = ["".join(x) for x in product("ACGT", repeat=3)]
+    aa = [standard_dna_table.forward_table.get(x) for x in codons]  # None = stop
+    stop = np.array([x is None for x in aa])
+    index = dict((x, i) for i, x in enumerate(codons))
+
+    sites = np.zeros(64)
+    for i, codon in enumerate(codons):
+        for pos in range(3):
+            for base in "ACGT":
+                if base == codon[pos]:
+                    continue
+                j = index[codon[:pos] + base + codon[pos + 1 :]]
+                if not stop[j] and aa[j] == aa[i]:
+                    sites[i] += 1 / 3
+
+    sd = np.zeros((64, 64))
+    nd = np.zeros((64, 64))
+    for i, j in product(range(64), repeat=2):
+        if i == j or stop[i] or stop[j]:
+            continue
+        a, b = codons[i], codons[j]
+        diff_pos = [k for k in range(3) if a[k] != b[k]]
+        paths = []
+        for order in permutations(diff_pos):
+            path = [a]
+            for k in order:
+                x = path[-1]
+                path.append(x[:k] + b[k] + x[k + 1 :])
+            path = [index[x] for x in path]
+            if not any(stop[x] for x in path[1:-1]):
+                paths.append(path)
+        for path in paths:
+            for x, y in zip(path[:-1], path[1:]):
+                if aa[x] == aa[y]:
+                    sd[i, j] += 1 / len(paths)
+                else:
+                    nd[i, j] += 1 / len(paths)
+
+    return sites, sd, nd, stop
+
+
+def codon_index(seq):
+    """
+    Convert a CDS into an array of codon indices as in ng86_tables(), codons
+    with gaps or ambiguous bases are -1.
+    """
+    lut = np.full(256, 4, dtype=np.int64)
+    for i, b in enumerate(b"ACGT"):
+        lut[b] = lut[b + 32] = i  # Upper and lower case
+    lut[ord("U")] = lut[ord("u")] = 3
+    seq = np.frombuffer(str(seq).encode("ascii"), dtype=np.uint8)
+    bases = lut[seq[: len(seq) // 3 * 3]].reshape(-1, 3)
+    index = bases[:, 0] * 16 + bases[:, 1] * 4 + bases[:, 2]
+    index[(bases == 4).any(axis=1)] = -1
+    return index
+
+
+def jukes_cantor(p):
+    """
+    Jukes-Cantor correction of the proportion of differences p, -1 when the
+    sites are saturated (p >= 3/4).
+    """
+    if p >= 0.75:
+        return -1
+    return abs(-0.75 * log(1 - 4 * p / 3))
+
+
+def ng86(seq1, seq2):
+    """
+    Nei and Gojobori (1986) estimates between two codon-aligned CDS, computed
+    in process as an alternative to yn00. Codons with gaps or ambiguous bases
+    and stop codons are skipped in both sequences. Returns (ks, ka), with -1
+    for the saturated values.
+    """
+    sites, sd, nd, stop = ng86_tables()
+    a, b = codon_index(seq1), codon_index(seq2)
+    assert len(a) == len(b), "Sequences must be codon-aligned"
+    keep = (a >= 0) & (b >= 0)
+    a, b = a[keep], b[keep]
+    keep = ~(stop[a] | stop[b])
+    a, b = a[keep], b[keep]
+    if len(a) == 0:
+        return -1, -1
+    S = (sites[a].sum() + sites[b].sum()) / 2
+    N = 3 * len(a) - S
+    ks = jukes_cantor(sd[a, b].sum() / S) if S else -1
+    ka = jukes_cantor(nd[a, b].sum() / N) if N else -1
+    return ks, ka
+
+
+def back_translate(aligned_proteins, cds):
+    """
+    Codon alignment of the CDS following the protein alignment, like pal2nal.
+    Returns None if a CDS is too short for its protein.
+    """
+    aligned = []
+    for prot, seq in zip(aligned_proteins, cds):
+        codons = []
+        i = 0
+        for aa in str(prot):
+            if aa == "-":
+                codons.append("---")
+                continue
+            codon = str(seq[i : i + 3])
+            if len(codon) < 3:
+                return None
+            codons.append(codon)
+            i += 3
+        aligned.append("".join(codons))
+    return aligned
+
+
 def run_mrtrans(align_fasta, recs, work_dir, outfmt="paml"):
     """Align nucleotide sequences with mrtrans and the protein alignment."""
     align_file = op.join(work_dir, "prot-align.fasta")
@@ -739,6 +959,8 @@ def clustal_align_protein(recs, work_dir, outfmt="fasta"):
     Align given proteins with clustalw.
     recs are iterable of Biopython SeqIO objects
     """
+    from Bio.Align.Applications import ClustalwCommandline
+
     fasta_file = op.join(work_dir, "prot-start.fasta")
     align_file = op.join(work_dir, "prot.aln")
     SeqIO.write(recs, open(fasta_file, "w"), "fasta")
@@ -766,6 +988,8 @@ def muscle_align_protein(recs, work_dir, outfmt="fasta", inputorder=True):
     Align given proteins with muscle.
     recs are iterable of Biopython SeqIO objects
     """
+    from Bio.Align.Applications import MuscleCommandline
+
     fasta_file = op.join(work_dir, "prot-start.fasta")
     align_file = op.join(work_dir, "prot.aln")
     SeqIO.write(recs, open(fasta_file, "w"), "fasta")
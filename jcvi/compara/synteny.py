@@ -1,8 +1,7 @@
 #!/usr/bin/env python
 # -*- coding: UTF-8 -*-
 
-"""Syntenty inference in comparative genomics
-"""
+"""Syntenty inference in comparative genomics"""
 
 import os.path as op
 import sys
@@ -16,9 +15,9 @@ from ..algorithms.lis import heaviest_increasing_subsequence as his
 from ..apps.base import ActionDispatcher, OptionParser, cleanup, logger
 from ..formats.base import BaseFile, SetFile, read_block, must_open
 from ..formats.bed import Bed, BedLine
-from ..formats.blast import Blast
+from ..formats.blast import BLAST_DTYPE, Blast, iter_blast_fields
 from ..utils.cbook import gene_name, human_size
-from ..utils.grouper import Grouper
+from ..utils.grouper import Grouper, IntGrouper
 from ..utils.range import range_chain
 
 from .base import AnchorFile
@@ -238,41 +237,65 @@ def group_hits(blasts):
 
 def read_blast(blast_file, qorder, sorder, is_self=False, ostrip=True):
     """Read the blast and convert name into coordinates"""
-    filtered_blast = []
-    seen = set()
     bl = Blast(blast_file)
-    for b in bl:
-        query, subject = b.query, b.subject
-        if is_self and query == subject:
-            continue
-        if ostrip:
-            query, subject = gene_name(query), gene_name(subject)
-        if query not in qorder or subject not in sorder:
-            continue
-
-        qi, q = qorder[query]
-        si, s = sorder[subject]
+    # Per-name lookups, extended as the shared name table grows
+    names_out, qis, sis, qseqids, sseqids = [], [], [], [], []
+    seqids = {}
+    kept = []
+    for records, names in bl.iter_chunks():
+        for name in names[len(names_out) :]:
+            if ostrip:
+                name = gene_name(name)
+            names_out.append(name.encode("utf-8"))
+            qi, q = qorder.get(name, (-1, None))
+            si, s = sorder.get(name, (-1, None))
+            qis.append(qi)
+            sis.append(si)
+            qseqids.append(seqids.setdefault(q.seqid, len(seqids)) if q else -1)
+            sseqids.append(seqids.setdefault(s.seqid, len(seqids)) if s else -1)
+        query, subject = records["query"], records["subject"]
+        qi, si = np.array(qis)[query], np.array(sis)[subject]
+        keep = (qi >= 0) & (si >= 0)
+        if is_self:
+            keep &= query != subject
+        records, query, subject = records[keep], query[keep], subject[keep]
+        qi, si = qi[keep], si[keep]
 
         if is_self:
             # remove redundant a<->b to one side when doing self-self BLAST
-            if qi > si:
-                query, subject = subject, query
-                qi, si = si, qi
-                q, s = s, q
+            swap = qi > si
+            query, subject = np.where(swap, subject, query), np.where(
+                swap, query, subject
+            )
+            qi, si = np.where(swap, si, qi), np.where(swap, qi, si)
             # Too close to diagonal! possible tandem repeats
-            if q.seqid == s.seqid and si - qi < 40:
-                continue
+            same_seqid = np.array(qseqids)[query] == np.array(sseqids)[subject]
+            keep = ~(same_seqid & (si - qi < 40))
+            records, query, subject = records[keep], query[keep], subject[keep]
+            qi, si = qi[keep], si[keep]
+            records["query"], records["subject"] = query, subject
 
-        key = query, subject
-        if key in seen:
-            continue
-        seen.add(key)
-
-        b.qseqid, b.sseqid = q.seqid, s.seqid
-        b.qi, b.si = qi, si
-        b.query, b.subject = query, subject
+        kept.append((records, qi, si))
 
-        filtered_blast.append(b)
+    if kept:
+        records, qi, si = [np.concatenate(x) for x in zip(*kept)]
+    else:
+        records = np.empty(0, dtype=BLAST_DTYPE)
+        qi = si = np.empty(0, dtype=int)
+    # Keep the first hit of each gene pair
+    _, first = np.unique(qi * len(sorder) + si, return_index=True)
+    first.sort()
+    records, qi, si = records[first], qi[first], si[first]
+
+    seqids = list(seqids)
+    qseqid = [seqids[x] for x in np.array(qseqids)[records["query"]].tolist()]
+    sseqid = [seqids[x] for x in np.array(sseqids)[records["subject"]].tolist()]
+    filtered_blast = list(
+        iter_blast_fields(names_out, *(records[x] for x in BLAST_DTYPE.names))
+    )
+    for b, q, s, i, j in zip(filtered_blast, qseqid, sseqid, qi.tolist(), si.tolist()):
+        b.qseqid, b.sseqid = q, s
+        b.qi, b.si = i, j
 
     logger.debug(
         "A total of %d BLAST imported from `%s`.", len(filtered_blast), blast_file
@@ -306,55 +329,113 @@ def read_anchors(ac, qorder, sorder, minsize=0):
     return all_anchors, anchor_to_block
 
 
+def _scan_links(x, y, xdist, ydist, is_self=False, intrabound=300):
+    """
+    Find all pairs of points (i, j), j < i, within `xdist` on the x-axis and
+    `ydist` on the y-axis. Points must be sorted by x. Instead of looking back
+    point by point, all the points are shifted by the same offset k at once,
+    for each k up to the widest look-back window.
+    """
+    n = len(x)
+    window = np.arange(n) - np.searchsorted(x, x - xdist, side="left")
+    order = np.argsort(-window, kind="stable")
+    sorted_window = window[order]
+    ii, jj = [], []
+    for k in range(1, int(window.max()) + 1 if n else 1):
+        # points that have at least k points to look back on
+        i = order[: np.searchsorted(-sorted_window, -k, side="right")]
+        j = i - k
+        ok = np.abs(y[i] - y[j]) <= ydist
+        # In self-comparison, ignore the anchors that are too close to the diagonal
+        if is_self:
+            intradist = np.minimum(np.abs(x[i] - y[i]), np.abs(x[j] - y[j]))
+            ok &= intradist >= intrabound
+        ii.append(i[ok])
+        jj.append(j[ok])
+
+    if not ii:
+        return np.empty(0, dtype=int), np.empty(0, dtype=int)
+    return np.concatenate(ii), np.concatenate(jj)
+
+
 def synteny_scan(points, xdist, ydist, N, is_self=False, intrabound=300):
     """
-    This is the core single linkage algorithm which behaves in O(n):
-    iterate through the pairs, foreach pair we look back on the
-    adjacent pairs to find links
+    This is the core single linkage algorithm: iterate through the pairs
+    sorted by x, foreach pair we look back on the adjacent pairs to find links.
+    Links are found with sorted-window searches on NumPy arrays and clustered
+    with an array-based union-find, which gives the same clusters (and the
+    same cluster order) as joining the links one by one in a Grouper.
     """
-    clusters = Grouper()
-    n = len(points)
     points.sort()
-    for i in range(n):
-        for j in range(i - 1, -1, -1):
-            # x-axis distance
-            del_x = points[i][0] - points[j][0]
-            if del_x > xdist:
-                break
-            # y-axis distance
-            del_y = points[i][1] - points[j][1]
-            if abs(del_y) > ydist:
-                continue
-            # In self-comparison, ignore the anchors that are too close to the diagonal
-            if is_self:
-                intradist = min(
-                    abs(points[i][0] - points[i][1]), abs(points[j][0] - points[j][1])
-                )
-                if intradist < intrabound:
-                    continue
-            # otherwise join
-            clusters.join(points[i], points[j])
-
-    # select clusters that are at least >=N
-    clusters = [sorted(cluster) for cluster in list(clusters) if _score(cluster) >= N]
+    # Identical points are the same member of a cluster
+    xy = np.array([p[:2] for p in points], dtype=float).reshape(-1, 2)
+    if len(points) > 1:
+        uniq = np.ones(len(points), dtype=bool)
+        uniq[1:] = [a != b for a, b in zip(points[1:], points[:-1])]
+        points = [p for p, u in zip(points, uniq) if u]
+        xy = xy[uniq]
+    n = len(points)
+    x, y = xy[:, 0], xy[:, 1]
+
+    ii, jj = _scan_links(x, y, xdist, ydist, is_self=is_self, intrabound=intrabound)
+    if not len(ii):
+        return []
+
+    g = IntGrouper(n)
+    g.join_pairs(ii, jj)
+    labels = g.labels()
+    ncomponents = n
+    members = np.unique(np.concatenate((ii, jj)))
+    mlabels = labels[members]
+
+    # score of the cluster is the number of non-repetitive matches
+    def nunique(v):
+        pairs = np.unique(np.stack((mlabels, v[members])), axis=1)
+        return np.bincount(pairs[0].astype(int), minlength=ncomponents)
+
+    score = np.minimum(nunique(x), nunique(y))
+    # clusters are reported in the order they were first linked
+    first = np.full(ncomponents, n)
+    np.minimum.at(first, labels[ii], ii)
+
+    o = np.lexsort((members, mlabels))
+    groups = np.split(members[o], np.flatnonzero(np.diff(mlabels[o])) + 1)
+    groups = dict((labels[g[0]], g) for g in groups)
+    clusters = [
+        [points[k] for k in groups[label]]
+        for label in sorted(groups, key=lambda x: first[x])
+        if score[label] >= N
+    ]
 
     return clusters
 
 
-def batch_scan(points, xdist=20, ydist=20, N=5, is_self=False, intrabound=300):
+def batch_scan(points, xdist=20, ydist=20, N=5, is_self=False, intrabound=300, cpus=1):
     """
-    runs synteny_scan() per chromosome pair
+    runs synteny_scan() per chromosome pair, optionally distributing the
+    chromosome pairs across `cpus` processes
     """
     chr_pair_points = group_hits(points)
+    chr_pairs = sorted(chr_pair_points.keys())
+    args = (xdist, ydist, N, is_self, intrabound)
+
+    if cpus > 1 and len(chr_pairs) > 1:
+        from multiprocessing import Pool
+
+        with Pool(processes=cpus) as pool:
+            # schedule the largest chromosome pairs first, collect in order
+            jobs = {}
+            for chr_pair in sorted(chr_pairs, key=lambda x: -len(chr_pair_points[x])):
+                jobs[chr_pair] = pool.apply_async(
+                    synteny_scan, (chr_pair_points[chr_pair],) + args
+                )
+            results = [jobs[x].get() for x in chr_pairs]
+    else:
+        results = [synteny_scan(chr_pair_points[x], *args) for x in chr_pairs]
 
     clusters = []
-    for chr_pair in sorted(chr_pair_points.keys()):
-        points = chr_pair_points[chr_pair]
-        clusters.extend(
-            synteny_scan(
-                points, xdist, ydist, N, is_self=is_self, intrabound=intrabound
-            )
-        )
+    for r in results:
+        clusters.extend(r)
 
     return clusters
 
@@ -1781,6 +1862,7 @@ def scan(args):
         help="Distance to extend from liftover. Defaults to half of --dist",
     )
     p.set_stripnames()
+    p.set_cpus(cpus=1)
 
     blast_file, anchor_file, dist, opts = add_arguments(p, args, dist=20)
     qbed, sbed, qorder, sorder, is_self = check_beds(blast_file, p, opts)
@@ -1800,6 +1882,7 @@ def scan(args):
         N=opts.n,
         is_self=is_self,
         intrabound=intrabound,
+        cpus=opts.cpus,
     )
     for cluster in clusters:
         print("###", file=fw)
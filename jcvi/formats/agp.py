@@ -9,7 +9,8 @@ import re
 import shutil
 import sys
 
-from collections import defaultdict
+from collections import defaultdict, deque
+from contextlib import contextmanager
 from copy import deepcopy
 from itertools import groupby, zip_longest
 
@@ -26,12 +27,13 @@ from ..apps.base import (
     logger,
     need_update,
 )
+from ..apps.grid import WorkerPool, worker_data
 from ..assembly.base import calculate_A50
 from ..utils.range import range_intersect
 
 from .base import LineFile, must_open
 from .bed import Bed
-from .fasta import Fasta
+from .fasta import Fasta, FastaIndex
 
 
 Supported_AGP_Version = "2.1"
@@ -284,7 +286,112 @@ class AGPLine(object):
         return AGPLine.agpline(line)
 
 
+class LinkedLines(object):
+    """
+    Doubly linked list of AGP lines, used by AGP.batch_edits(). Lines are
+    addressed by identity, so edits do not need positions in the list.
+    """
+
+    def __init__(self, lines):
+        n = len(lines)
+        self.lines = list(lines)  # node => line
+        self.prev = list(range(-1, n - 1))
+        self.next = list(range(1, n + 1))
+        if n:
+            self.next[-1] = -1
+        self.head = 0 if n else -1
+        self.node = dict((id(x), i) for i, x in enumerate(self.lines))
+
+    def __iter__(self):
+        i = self.head
+        while i != -1:
+            yield self.lines[i]
+            i = self.next[i]
+
+    def unlink(self, i):
+        p, q = self.prev[i], self.next[i]
+        if p == -1:
+            self.head = q
+        else:
+            self.next[p] = q
+        if q != -1:
+            self.prev[q] = p
+        del self.node[id(self.lines[i])]
+
+    def link_after(self, p, lines):
+        """
+        Insert lines after node p, or at the head if p is -1.
+        """
+        for x in lines:
+            i = len(self.lines)
+            q = self.head if p == -1 else self.next[p]
+            self.lines.append(x)
+            self.prev.append(p)
+            self.next.append(q)
+            if p == -1:
+                self.head = i
+            else:
+                self.next[p] = i
+            if q != -1:
+                self.prev[q] = i
+            self.node[id(x)] = i
+            p = i
+
+    def remove(self, x):
+        self.unlink(self.node[id(x)])
+
+    def insert(self, x, lines, after=False):
+        i = self.node[id(x)]
+        self.link_after(i if after else self.prev[i], lines)
+
+    def first(self, lines):
+        """
+        Returns the first of lines in list order, this walks the list from the
+        head so only use it when there is more than one line to choose from.
+        """
+        ids = set(id(x) for x in lines)
+        for x in self:
+            if id(x) in ids:
+                return x
+        return None
+
+    def replace(self, x, y):
+        i = self.node.pop(id(x))
+        self.lines[i] = y
+        self.node[id(y)] = i
+
+    def swap(self, x, y):
+        i, j = self.node[id(x)], self.node[id(y)]
+        self.lines[i], self.lines[j] = y, x
+        self.node[id(x)], self.node[id(y)] = j, i
+
+    def replace_between(self, x, y, lines):
+        """
+        Replace the lines between x and y, same as lines[xi + 1 : yi] = lines
+        when y follows x, otherwise lines are only inserted after x.
+        Returns the lines removed.
+        """
+        i, j = self.node[id(x)], self.node[id(y)]
+        between = []
+        k = self.next[i]
+        while k != -1 and k != j:
+            between.append(k)
+            k = self.next[k]
+        if k == -1:
+            between = []
+        removed = [self.lines[k] for k in between]
+        for k in between:
+            self.unlink(k)
+        self.link_after(i, lines)
+        return removed
+
+
 class AGP(LineFile):
+    # Edit index, see AGP._index()
+    _batch = None
+    _cids = None
+    _stale = 0
+
     def __init__(self, filename, nogaps=False, validate=True, sorted=True):
         super().__init__(filename)
 
@@ -325,6 +432,31 @@ class AGP(LineFile):
 
         return d
 
+    def _mutator(name):
+        method = getattr(list, name)
+
+        def mutate(self, *args, **kwargs):
+            self._cids = None
+            return method(self, *args, **kwargs)
+
+        mutate.__name__ = name
+        return mutate
+
+    # Changes to the list outside of the edit methods drop the edit index
+    append = _mutator("append")
+    extend = _mutator("extend")
+    insert = _mutator("insert")
+    remove = _mutator("remove")
+    pop = _mutator("pop")
+    clear = _mutator("clear")
+    sort = _mutator("sort")
+    reverse = _mutator("reverse")
+    __setitem__ = _mutator("__setitem__")
+    __delitem__ = _mutator("__delitem__")
+    __iadd__ = _mutator("__iadd__")
+    __imul__ = _mutator("__imul__")
+    del _mutator
+
     def getAdjacentClone(self, i, south=True):
         """
         Returns the adjacent clone name.
@@ -479,51 +611,44 @@ class AGP(LineFile):
         """
         Construct molecule using component fasta sequence
         """
-        components = []
-
-        total_bp = 0
-        for line in lines:
-
-            if line.is_gap:
-                seq = "N" * line.gap_length
-                if newagp:
-                    print(line, file=newagp)
-            else:
-                seq = fasta.sequence(
-                    dict(
-                        chr=line.component_id,
-                        start=line.component_beg,
-                        stop=line.component_end,
-                        strand=line.orientation,
-                    )
-                )
-                # Check for dangling N's
-                if newagp:
-                    trimNs(seq, line, newagp)
-
-            components.append(seq)
-            total_bp += len(seq)
-
-            if self.validate:
-                assert (
-                    total_bp == line.object_end
-                ), "cumulative base pairs (%d) does not match (%d)" % (
-                    total_bp,
-                    line.object_end,
-                )
-
+        seq = build_sequence(lines, fasta, validate=self.validate, newagp=newagp)
         if not newagp:
-            rec = SeqRecord(Seq("".join(components)), id=object, description="")
-            SeqIO.write([rec], fw, "fasta")
-            if len(rec) > 1000000:
-                logger.debug("Write object %s to `%s`", object, fw.name)
-
-    def build_all(self, componentfasta, targetfasta, newagp=None):
-        f = Fasta(componentfasta, index=False)
-        fw = open(targetfasta, "w")
+            write_object(fw, object, seq)
 
-        for ob, lines in self.iter_object():
-            self.build_one(ob, lines, f, fw, newagp=newagp)
+    def build_all(self, componentfasta, targetfasta, newagp=None, cpus=1):
+        """
+        Construct all molecules, components are read on demand through the
+        faidx index of the component fasta, so that only one object is held
+        in memory at a time (per CPU). Objects are written in AGP order, with
+        at most 2 * cpus objects submitted to the workers and not yet written.
+        """
+        try:
+            f = FastaIndex(componentfasta)
+        except (OSError, UnicodeDecodeError, ValueError) as e:
+            logger.debug("Cannot index `%s` (%s), load all", componentfasta, e)
+            f = Fasta(componentfasta, index=False)
+            cpus = 1
+        if newagp:
+            cpus = 1
+
+        with open(targetfasta, "w") as fw:
+            if cpus > 1:
+                data = dict(fasta=f, validate=self.validate)
+                with WorkerPool("build", data, cpus=cpus) as pool:
+                    inflight = deque()
+                    for ob, lines in self.iter_object():
+                        if len(inflight) >= 2 * cpus:
+                            pob, res = inflight.popleft()
+                            write_object(fw, pob, res.get())
+                        inflight.append(
+                            (ob, pool.apply_async(build_object, (lines,)))
+                        )
+                    while inflight:
+                        pob, res = inflight.popleft()
+                        write_object(fw, pob, res.get())
+            else:
+                for ob, lines in self.iter_object():
+                    self.build_one(ob, lines, f, fw, newagp=newagp)
 
     @property
     def graph(self):
@@ -547,23 +672,123 @@ class AGP(LineFile):
 
         return g
 
+    def _index(self):
+        """
+        Index component_id => lines and id(line) => position, the index is
+        kept up to date by the edit methods below. A component can be used
+        more than once, e.g. a contig split into pieces, so each component_id
+        maps to a list of lines. The edit methods change the list through
+        list methods to keep the index, any other change drops it.
+        """
+        if self._cids is not None:
+            return
+        self._cids = {}
+        self._positions = {}
+        for i, x in enumerate(self):
+            self._positions[id(x)] = i
+            if not x.is_gap:
+                self._cids.setdefault(x.component_id, []).append(x)
+        self._stale = len(self)
+
+    def _position(self, x):
+        """
+        Returns the index of line x. Positions are valid below self._stale,
+        beyond that they are refreshed on demand up to the line requested.
+        """
+        i = self._positions.get(id(x))
+        if i is not None and i < self._stale and self[i] is x:
+            return i
+        for i in range(self._stale, len(self)):
+            y = self[i]
+            self._positions[id(y)] = i
+            self._stale = i + 1
+            if y is x:
+                return i
+        return None
+
+    def _edited(self, i):
+        self._stale = min(self._stale, i)
+
+    def _add_cids(self, lines):
+        for x in lines:
+            if not x.is_gap:
+                self._cids.setdefault(x.component_id, []).append(x)
+
+    def _drop_cid(self, x):
+        if x.is_gap:
+            return
+        lines = self._cids.get(x.component_id, [])
+        for i, y in enumerate(lines):
+            if y is x:
+                del lines[i]
+                break
+        if not lines:
+            self._cids.pop(x.component_id, None)
+
+    def _find(self, cid):
+        """
+        Returns the first line of component cid in the current order.
+        """
+        self._index()
+        lines = self._cids.get(cid)
+        if not lines:
+            return None
+        if len(lines) == 1:
+            return lines[0]
+        if self._batch is not None:
+            return self._batch.first(lines)
+        return min(lines, key=self._position)
+
     def get_line(self, cid):
-        for i, a in enumerate(self):
-            if not a.is_gap and a.component_id == cid:
-                return i, a
-        return None, None
+        """
+        Returns (index, line) of component cid, or (None, None) if absent.
+        Within batch_edits() the index is None.
+        """
+        x = self._find(cid)
+        if x is None:
+            return None, None
+        i = None if self._batch is not None else self._position(x)
+        return i, x
+
+    @contextmanager
+    def batch_edits(self):
+        """
+        Edits within the context are applied on a linked list of the lines,
+        each in O(1) (update_between() walks the lines it replaces), and the
+        AGP is rewritten once on exit. The AGP itself is not updated until
+        then, so only use the edit methods inside the block, e.g.
+
+        >>> with agp.batch_edits():
+        ...     agp.delete_between("a", "b")
+        ...     agp.switch_between("c", "d")
+        """
+        self._index()
+        self._batch = LinkedLines(self)
+        try:
+            yield self
+        finally:
+            lines, self._batch = list(self._batch), None
+            self[:] = lines
+            self._index()
 
     # Update AGP on the fly
     def delete_line(self, a, verbose=False):
-        ai, ax = self.get_line(a)
-        if ai is None:
+        ax = self._find(a)
+        if ax is None:
             return
 
         if verbose:
             msg = "* Delete line:\n{0}".format(ax)
             print(msg, file=sys.stderr)
 
-        del self[ai]
+        if self._batch is not None:
+            self._batch.remove(ax)
+        else:
+            ai = self._position(ax)
+            list.__delitem__(self, ai)
+            self._edited(ai)
+            del self._positions[id(ax)]
+        self._drop_cid(ax)
 
     def delete_lines(self, lines, verbose=False):
         deleted = set()
@@ -576,14 +801,20 @@ class AGP(LineFile):
         return deleted
 
     def insert_lines(self, a, lines, after=False, delete=False, verbose=False):
+        deleted = set()
         if delete:
             deleted = self.delete_lines(lines, verbose=verbose)
 
-        ai, ax = self.get_line(a)
-        if after:
-            ai += 1
-        for i, x in enumerate(lines):
-            self.insert(ai + i, x)
+        ax = self._find(a)
+        if self._batch is not None:
+            self._batch.insert(ax, lines, after=after)
+        else:
+            ai = self._position(ax)
+            if after:
+                ai += 1
+            list.__setitem__(self, slice(ai, ai), lines)
+            self._edited(ai)
+        self._add_cids(lines)
         if verbose:
             tag = "after" if after else "before"
             msg = "* Insert {0} line:\n".format(tag)
@@ -593,13 +824,25 @@ class AGP(LineFile):
         return deleted
 
     def update_between(self, a, b, lines, delete=True, verbose=False):
+        deleted = set()
         if delete:
             deleted = self.delete_lines(lines, verbose=verbose)
 
-        ai, ax = self.get_line(a)
-        bi, bx = self.get_line(b)
+        ax = self._find(a)
+        bx = self._find(b)
         # Update
-        self[ai + 1 : bi] = lines
+        if self._batch is not None:
+            removed = self._batch.replace_between(ax, bx, lines)
+        else:
+            ai = self._position(ax)
+            bi = self._position(bx)
+            removed = self[ai + 1 : bi]
+            list.__setitem__(self, slice(ai + 1, bi), lines)
+            self._edited(ai + 1)
+        for x in removed:
+            self._positions.pop(id(x), None)
+            self._drop_cid(x)
+        self._add_cids(lines)
         if verbose:
             msg = "* Update between:\n"
             msg += "\n".join([str(ax), str(bx), "-" * 60]) + "\n"
@@ -608,9 +851,16 @@ class AGP(LineFile):
         return deleted
 
     def convert_to_gap(self, a, verbose=False):
-        ai, ax = self.get_line(a)
+        ax = self._find(a)
         gline = AGPLine.gline(ax.object, 100)
-        self[ai] = gline
+        if self._batch is not None:
+            self._batch.replace(ax, gline)
+        else:
+            ai = self._position(ax)
+            list.__setitem__(self, ai, gline)
+            del self._positions[id(ax)]
+            self._positions[id(gline)] = ai
+        self._drop_cid(ax)
         if verbose:
             msg = "* Convert from/to:\n"
             msg += "\n".join([str(ax), str(gline), "-" * 60]) + "\n"
@@ -620,16 +870,81 @@ class AGP(LineFile):
         return self.update_between(a, b, [], verbose=verbose)
 
     def switch_between(self, a, b, verbose=True):
-        ai, ax = self.get_line(a)
-        bi, bx = self.get_line(b)
-        self[ai] = bx
-        self[bi] = ax
+        ax = self._find(a)
+        bx = self._find(b)
+        if self._batch is not None:
+            self._batch.swap(ax, bx)
+        else:
+            ai = self._position(ax)
+            bi = self._position(bx)
+            list.__setitem__(self, ai, bx)
+            list.__setitem__(self, bi, ax)
+            self._positions[id(ax)] = bi
+            self._positions[id(bx)] = ai
         if verbose:
             msg = "* Switch between:\n"
             msg += "\n".join([str(ax), str(bx)])
             print(msg, file=sys.stderr)
 
 
+def build_object(lines):
+    """
+    Returns the molecule sequence, see AGP.build_all().
+    """
+    d = worker_data("build")
+    return build_sequence(lines, d["fasta"], validate=d["validate"])
+
+
+def build_sequence(lines, fasta, validate=True, newagp=None):
+    """
+    Returns the molecule sequence from the component fasta sequence
+    """
+    components = []
+
+    total_bp = 0
+    for line in lines:
+
+        if line.is_gap:
+            seq = "N" * line.gap_length
+            if newagp:
+                print(line, file=newagp)
+        else:
+            seq = fasta.sequence(
+                dict(
+                    chr=line.component_id,
+                    start=line.component_beg,
+                    stop=line.component_end,
+                    strand=line.orientation,
+                )
+            )
+            # Check for dangling N's
+            if newagp:
+                trimNs(seq, line, newagp)
+
+        components.append(seq)
+        total_bp += len(seq)
+
+        if validate:
+            assert (
+                total_bp == line.object_end
+            ), "cumulative base pairs (%d) does not match (%d)" % (
+                total_bp,
+                line.object_end,
+            )
+
+    return "".join(components)
+
+
+def write_object(fw, object, seq):
+    """
+    Write the molecule sequence to the output fasta.
+    """
+    rec = SeqRecord(Seq(seq), id=object, description="")
+    SeqIO.write([rec], fw, "fasta")
+    if len(rec) > 1000000:
+        logger.debug("Write object %s to `%s`", object, fw.name)
+
+
 class TPFLine(object):
     def __init__(self, line):
         args = line.split()
@@ -2111,6 +2426,7 @@ def build(args):
         action="store_true",
         help="Don't validate the agpfile",
     )
+    p.set_cpus(cpus=1)
     opts, args = p.parse_args(args)
 
     if len(args) != 3:
@@ -2128,7 +2444,12 @@ def build(args):
         newagp = None
 
     agp = AGP(agpfile, validate=validate, sorted=True)
-    agp.build_all(componentfasta=componentfasta, targetfasta=targetfasta, newagp=newagp)
+    agp.build_all(
+        componentfasta=componentfasta,
+        targetfasta=targetfasta,
+        newagp=newagp,
+        cpus=opts.cpus,
+    )
     logger.debug("Target fasta written to `%s`.", targetfasta)
 
     return newagpfile
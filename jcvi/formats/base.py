@@ -367,7 +367,7 @@ def must_open(
 
     if filename in ("-", "stdin"):
         assert "r" in mode
-        fp = sys.stdin
+        fp = sys.stdin.buffer if "b" in mode else sys.stdin
 
     elif filename == "stdout":
         assert "w" in mode
@@ -386,7 +386,7 @@ def must_open(
         import gzip
 
         if "r" in mode:
-            fp = gzip.open(filename, mode + "t")
+            fp = gzip.open(filename, mode if "b" in mode else mode + "t")
         elif "w" in mode:
             fp = gzip.open(filename, mode)
 
@@ -394,6 +394,10 @@ def must_open(
         if "r" in mode:
             cmd = f"bzcat {filename}"
             fp = popen(cmd, debug=False)
+            if "b" not in mode:
+                from io import TextIOWrapper
+
+                fp = TextIOWrapper(fp)
         elif "w" in mode:
             import bz2
 
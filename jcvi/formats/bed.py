@@ -10,6 +10,8 @@ import sys
 
 from collections import defaultdict, OrderedDict
 from itertools import groupby
+from operator import attrgetter
+from types import MappingProxyType
 from typing import Optional, Tuple
 
 import numpy as np
@@ -23,7 +25,6 @@ from ..apps.base import (
     cleanup,
     logger,
     need_update,
-    popen,
     sh,
 )
 from ..utils.cbook import SummaryStats, percentage, thousands
@@ -40,36 +41,57 @@ from .base import DictFile, LineFile, get_number, is_number, must_open
 from .sizes import Sizes
 
 
+def tracked(name):
+    # field stored in the slot _name, edits are counted in BedLine.edits
+    attr = "_" + name
+
+    def set_field(self, value):
+        setattr(self, attr, value)
+        BedLine.edits += 1
+
+    return property(attrgetter(attr), set_field)
+
+
 class BedLine(object):
     # the Bed format supports more columns. we only need
     # the first 4, but keep the information in 'extra'.
     __slots__ = (
-        "seqid",
-        "start",
-        "end",
-        "accn",
+        "_seqid",
+        "_start",
+        "_end",
+        "_accn",
         "extra",
         "score",
-        "strand",
+        "_strand",
         "args",
         "nargs",
     )
 
+    # number of edits of the fields that the Bed lookups depend on
+    edits = 0
+    seqid = tracked("seqid")
+    start = tracked("start")
+    end = tracked("end")
+    accn = tracked("accn")
+    strand = tracked("strand")
+
     def __init__(self, sline):
         args = sline.strip().split("\t")
         self.nargs = nargs = len(args)
-        self.seqid = args[0]
-        self.start = int(args[1]) + 1
-        self.end = int(args[2])
-        assert self.start <= self.end, "start={0} end={1}".format(self.start, self.end)
-        self.extra = self.accn = self.score = self.strand = None
+        self._seqid = args[0]
+        self._start = int(args[1]) + 1
+        self._end = int(args[2])
+        assert self._start <= self._end, "start={0} end={1}".format(
+            self._start, self._end
+        )
+        self.extra = self._accn = self.score = self._strand = None
 
         if nargs > 3:
-            self.accn = args[3]
+            self._accn = args[3]
         if nargs > 4:
             self.score = args[4]
         if nargs > 5:
-            self.strand = args[5]
+            self._strand = args[5]
         if nargs > 6:
             self.extra = args[6:]
 
@@ -141,7 +163,111 @@ class BedLine(object):
         return row
 
 
+class BedColumns(object):
+    """
+    Columnar view of a list of BedLine, with coordinates and strands held in
+    NumPy arrays and seqids interned into a table. Features are indexed per
+    seqid by start so that range queries take O(log n + k).
+    """
+
+    STRANDS = {"+": 1, "-": -1}
+
+    def __init__(self, bed):
+        n = len(bed)
+        self.seqids = []
+        self.seqid_ids = {}
+        self.seqid_idx = np.empty(n, dtype=np.int32)
+        self.starts = np.empty(n, dtype=np.int64)
+        self.ends = np.empty(n, dtype=np.int64)
+        self.strands = np.zeros(n, dtype=np.int8)
+        self.accns = [None] * n
+        for i, b in enumerate(bed):
+            sid = self.seqid_ids.get(b.seqid)
+            if sid is None:
+                sid = self.seqid_ids[b.seqid] = len(self.seqids)
+                self.seqids.append(b.seqid)
+            self.seqid_idx[i] = sid
+            self.starts[i] = b.start
+            self.ends[i] = b.end
+            self.strands[i] = self.STRANDS.get(b.strand, 0)
+            self.accns[i] = b.accn
+        self._accn_index = None
+        self._rows = None
+        self._intervals = {}
+
+    def __len__(self):
+        return len(self.starts)
+
+    @property
+    def accn_index(self):
+        # accn => row, last occurrence wins as in `Bed.order`
+        if self._accn_index is None:
+            self._accn_index = dict((a, i) for i, a in enumerate(self.accns))
+        return self._accn_index
+
+    def rows(self, seqid):
+        """
+        Rows on a given seqid, in the original order.
+        """
+        if self._rows is None:
+            o = np.argsort(self.seqid_idx, kind="stable")
+            breaks = np.flatnonzero(np.diff(self.seqid_idx[o])) + 1
+            self._rows = dict(
+                (self.seqids[self.seqid_idx[x[0]]], x) for x in np.split(o, breaks)
+            )
+        return self._rows.get(seqid, np.empty(0, dtype=int))
+
+    def intervals(self, stranded=False):
+        """
+        Per-seqid (or per seqid-strand) arrays of 0-based half-open starts and
+        ends sorted by start, along with the rows they come from and the
+        largest span, which bounds the search window of overlap queries.
+        """
+        if stranded in self._intervals:
+            return self._intervals[stranded]
+
+        starts = self.starts - 1
+        keys = (self.ends, starts, self.seqid_idx)
+        if stranded:
+            keys = (self.ends, starts, self.strands, self.seqid_idx)
+        o = np.lexsort(keys)
+        change = np.diff(self.seqid_idx[o]) != 0
+        if stranded:
+            change |= np.diff(self.strands[o]) != 0
+
+        res = {}
+        for rows in np.split(o, np.flatnonzero(change) + 1):
+            if not len(rows):
+                continue
+            seqid = self.seqids[self.seqid_idx[rows[0]]]
+            key = (seqid, self.strands[rows[0]]) if stranded else seqid
+            rstarts, rends = starts[rows], self.ends[rows]
+            res[key] = (rstarts, rends, rows, int((rends - rstarts).max()))
+        self._intervals[stranded] = res
+        return res
+
+    def extract(self, seqid, start, end):
+        """
+        Rows of features fully contained within [start, end], in the
+        original order.
+        """
+        intervals = self.intervals()
+        if seqid not in intervals:
+            return np.empty(0, dtype=int)
+        starts, ends, rows, maxspan = intervals[seqid]
+        lo = np.searchsorted(starts, start - 1, side="left")
+        hi = np.searchsorted(starts, end, side="left")
+        return np.sort(rows[lo:hi][ends[lo:hi] <= end])
+
+
 class Bed(LineFile):
+    """
+    List of BedLine. Derived lookups (`order`, `order_in_chr`, `columns`, etc.)
+    are cached and returned as read-only views. They are invalidated whenever
+    the list is mutated, or the seqid, coordinates, accn or strand of any
+    BedLine are edited.
+    """
+
     def __init__(self, filename=None, key=None, sorted=True, juncs=False, include=None):
         super().__init__(filename)
 
@@ -149,6 +275,8 @@ class Bed(LineFile):
         # for example, user might not like the lexico-order of seqid
         self.nullkey = lambda x: (natsort_key(x.seqid), x.start, x.accn)
         self.key = key or self.nullkey
+        self._cache = {}
+        self._edits = BedLine.edits
 
         if not filename:
             return
@@ -163,10 +291,55 @@ class Bed(LineFile):
             b = BedLine(line)
             if include and b.accn not in include:
                 continue
-            self.append(b)
+            list.append(self, b)
 
         if sorted:
             self.sort(key=self.key)
+            self._cache["sorted"] = key is None
+
+    def invalidate(self):
+        self._cache.clear()
+
+    def _mutator(name):
+        method = getattr(list, name)
+
+        def mutate(self, *args, **kwargs):
+            self._cache.clear()
+            return method(self, *args, **kwargs)
+
+        mutate.__name__ = name
+        return mutate
+
+    append = _mutator("append")
+    extend = _mutator("extend")
+    insert = _mutator("insert")
+    remove = _mutator("remove")
+    pop = _mutator("pop")
+    clear = _mutator("clear")
+    sort = _mutator("sort")
+    reverse = _mutator("reverse")
+    __setitem__ = _mutator("__setitem__")
+    __delitem__ = _mutator("__delitem__")
+    __iadd__ = _mutator("__iadd__")
+    __imul__ = _mutator("__imul__")
+    del _mutator
+
+    def _check_cache(self):
+        if self._edits != BedLine.edits:
+            self._cache.clear()
+            self._edits = BedLine.edits
+
+    def _cached(self, name, func):
+        self._check_cache()
+        if name not in self._cache:
+            self._cache[name] = func()
+        return self._cache[name]
+
+    def _sort_nullkey(self):
+        self._check_cache()
+        if not self._cache.get("sorted"):
+            self.sort(key=self.nullkey)
+            self._cache["sorted"] = True
 
     def add(self, row):
         self.append(BedLine(row))
@@ -186,9 +359,14 @@ class Bed(LineFile):
     def sum(self, seqid=None, unique=True):
         return bed_sum(self, seqid=seqid, unique=unique)
 
+    @property
+    def columns(self):
+        # columnar arrays and per-seqid interval index
+        return self._cached("columns", lambda: BedColumns(self))
+
     @property
     def seqids(self):
-        return natsorted(set(b.seqid for b in self))
+        return natsorted(self.columns.seqids)
 
     @property
     def accns(self):
@@ -197,36 +375,48 @@ class Bed(LineFile):
     @property
     def order(self):
         # get the gene order given a Bed object
-        return dict((f.accn, (i, f)) for (i, f) in enumerate(self))
+        return self._cached(
+            "order",
+            lambda: MappingProxyType(
+                dict((f.accn, (i, f)) for (i, f) in enumerate(self))
+            ),
+        )
+
+    def _in_chr(self, name, func):
+        # get a mapping on a particular seqid, requires sorting first
+        def in_chr():
+            self._sort_nullkey()
+            res = {}
+            for seqid, beds in groupby(self, key=lambda x: x.seqid):
+                for i, f in enumerate(beds):
+                    res[f.accn] = func(seqid, i, f)
+            return MappingProxyType(res)
+
+        return self._cached(name, in_chr)
 
     @property
     def order_in_chr(self):
         # get the gene order on a particular seqid
-        res = {}
-        self.sort(key=self.nullkey)
-        for seqid, beds in groupby(self, key=lambda x: x.seqid):
-            for i, f in enumerate(beds):
-                res[f.accn] = (seqid, i, f)
-        return res
+        return self._in_chr("order_in_chr", lambda seqid, i, f: (seqid, i, f))
 
     @property
     def bp_in_chr(self):
         # get the bp position on a particular seqid
-        res = {}
-        self.sort(key=self.nullkey)
-        for seqid, beds in groupby(self, key=lambda x: x.seqid):
-            for i, f in enumerate(beds):
-                res[f.accn] = (seqid, (f.start + f.end) / 2, f)
-        return res
+        return self._in_chr(
+            "bp_in_chr", lambda seqid, i, f: (seqid, (f.start + f.end) / 2, f)
+        )
 
     @property
     def max_bp_in_chr(self):
         # Get the maximum bp position on a particular seqid
-        res = OrderedDict()
-        self.sort(key=self.nullkey)
-        for seqid, beds in groupby(self, key=lambda x: x.seqid):
-            res[seqid] = max(x.end for x in beds)
-        return res
+        def max_bp_in_chr():
+            self._sort_nullkey()
+            res = OrderedDict()
+            for seqid, beds in groupby(self, key=lambda x: x.seqid):
+                res[seqid] = max(x.end for x in beds)
+            return MappingProxyType(res)
+
+        return self._cached("max_bp_in_chr", max_bp_in_chr)
 
     @property
     def simple_bed(self):
@@ -242,21 +432,16 @@ class Bed(LineFile):
 
     def extract(self, seqid, start, end):
         # get all features within certain range
-        for b in self:
-            if b.seqid != seqid:
-                continue
-            if b.start < start or b.end > end:
-                continue
-            yield b
+        for i in self.columns.extract(seqid, start, end):
+            yield self[i]
 
     def sub_bed(self, seqid):
         # get all the beds on one chromosome
-        for b in self:
-            if b.seqid == seqid:
-                yield b
+        for i in self.columns.rows(seqid):
+            yield self[i]
 
     def sub_beds(self):
-        self.sort(key=self.nullkey)
+        self._sort_nullkey()
         # get all the beds on all chromosomes, emitting one at a time
         for bs, sb in groupby(self, key=lambda x: x.seqid):
             yield bs, list(sb)
@@ -450,6 +635,273 @@ def bed_sum(beds, seqid=None, unique=True):
     return unique_sum if unique else raw_sum
 
 
+def _bedline(seqid, start, end, *extra):
+    # Build a BedLine from 0-based half-open coordinates
+    args = (seqid, start, end) + extra
+    return BedLine("\t".join(str(x) for x in args))
+
+
+def _interval_index(bed, stranded=False):
+    """
+    Per-seqid (or per seqid-strand) interval arrays, see `BedColumns.intervals()`.
+    Cached on Bed objects, built on the fly for plain lists of BedLine.
+    """
+    columns = bed.columns if isinstance(bed, Bed) else BedColumns(bed)
+    return columns.intervals(stranded=stranded)
+
+
+def _overlap_window(entry, qstarts, qends):
+    """
+    Return the [lo, hi) slices of candidate features in `entry` that may
+    overlap the 0-based half-open queries. Since no feature spans more than
+    `maxspan`, only features starting within (qstart - maxspan, qend) qualify.
+    """
+    starts, ends, idx, maxspan = entry
+    lo = np.searchsorted(starts, qstarts - maxspan, side="right")
+    hi = np.searchsorted(starts, qends, side="left")
+    return lo, hi
+
+
+def _merge_clusters(starts, ends, d=0):
+    """
+    Single sweep over start-sorted intervals, returns the offsets of the first
+    member of each cluster, along with the merged starts and ends.
+    """
+    reach = np.maximum.accumulate(ends)
+    breaks = np.flatnonzero(starts[1:] > reach[:-1] + d) + 1
+    first = np.concatenate(([0], breaks))
+    return first, starts[first], np.maximum.reduceat(ends, first)
+
+
+def _score_mode(scores, anti=False):
+    counts = defaultdict(int)
+    for x in scores:
+        counts[x] += 1
+    pick = min if anti else max
+    return pick(counts.items(), key=lambda x: x[1])[0]
+
+
+MERGE_SCORE_OPS = {
+    "sum": np.sum,
+    "min": np.min,
+    "max": np.max,
+    "mean": np.mean,
+    "median": np.median,
+    "mode": _score_mode,
+    "antimode": lambda x: _score_mode(x, anti=True),
+    "collapse": None,
+}
+
+
+def bed_merge(bed, d=0, nms=False, s=False, scores=None, delim=";"):
+    """
+    In-memory equivalent of `mergeBed`. Overlapping or book-ended features
+    (or features within distance `d`) are merged into a single feature.
+
+    Args:
+        bed: Bed or list of BedLine.
+        d: Maximum distance between features allowed to be merged.
+        nms: Report the names of the merged features, joined by `delim`.
+        s: Only merge features on the same strand.
+        scores: Summarize the scores of the merged features, one of
+            `MERGE_SCORE_OPS`.
+        delim: Delimiter used to join the names.
+
+    Returns:
+        Bed: Merged features, sorted by seqid and start.
+    """
+    if scores and scores not in MERGE_SCORE_OPS:
+        scores = "mean"
+    delim = delim or ","
+    merged = []
+    for key, entry in _interval_index(bed, stranded=s).items():
+        seqid = key[0] if s else key
+        starts, ends, idx, maxspan = entry
+        first, mstarts, mends = _merge_clusters(starts, ends, d=d)
+        last = np.append(first[1:], len(starts))
+        for i, j, mstart, mend in zip(first, last, mstarts, mends):
+            extra = ()
+            members = [bed[k] for k in idx[i:j]]
+            if nms:
+                extra += (delim.join(str(b.accn) for b in members),)
+            if scores:
+                values = [float(b.score) for b in members]
+                func = MERGE_SCORE_OPS[scores]
+                if func is None:
+                    value = ",".join("{0:g}".format(x) for x in values)
+                else:
+                    value = "{0:g}".format(func(values))
+                extra += (value,)
+            merged.append(((seqid, mstart, mend), extra))
+
+    res = Bed()
+    for (seqid, mstart, mend), extra in sorted(merged, key=lambda x: x[0]):
+        res.append(_bedline(seqid, mstart, mend, *extra))
+    return res
+
+
+def bed_complement(bed, sizes):
+    """
+    In-memory equivalent of `complementBed`. Report the intervals not covered
+    by any feature in `bed`.
+
+    Args:
+        bed: Bed or list of BedLine.
+        sizes: Dict of seqid => size, iterated in order.
+
+    Returns:
+        Bed: Uncovered intervals, in the order of `sizes`.
+    """
+    index = _interval_index(bed)
+    res = Bed()
+    for seqid, size in sizes.items():
+        if seqid not in index:
+            res.append(_bedline(seqid, 0, size))
+            continue
+        starts, ends, idx, maxspan = index[seqid]
+        first, mstarts, mends = _merge_clusters(starts, ends)
+        gap_starts = np.concatenate(([0], np.minimum(mends, size)))
+        gap_ends = np.concatenate((np.minimum(mstarts, size), [size]))
+        for gstart, gend in zip(gap_starts, gap_ends):
+            if gstart < gend:
+                res.append(_bedline(seqid, gstart, gend))
+    return res
+
+
+def bed_intersect_wao(abed, bbed, minOverlap=0):
+    """
+    In-memory equivalent of `intersectBed -wao`. For each feature in `abed`,
+    yield every overlapping feature in `bbed` (by increasing start), or None
+    if no feature overlaps.
+
+    Args:
+        abed: Bed or list of BedLine, iterated in order.
+        bbed: Bed or list of BedLine.
+        minOverlap: Minimum number of overlapping bases required.
+
+    Yields:
+        Tuple[BedLine, Optional[BedLine], int]: feature in `abed`, overlapping
+        feature in `bbed` and the number of overlapping bases.
+    """
+    index = _interval_index(bbed)
+    aindex = _interval_index(abed)
+    # Vectorize the binary searches per seqid, then walk `abed` in order
+    windows = {}
+    for seqid, (qstarts, qends, qidx, _) in aindex.items():
+        if seqid not in index:
+            continue
+        lo, hi = _overlap_window(index[seqid], qstarts, qends)
+        for k, i, j in zip(qidx, lo, hi):
+            windows[k] = (i, j)
+
+    for k, a in enumerate(abed):
+        astart, aend = a.start - 1, a.end
+        overlaps = []
+        if k in windows:
+            starts, ends, idx, maxspan = index[a.seqid]
+            i, j = windows[k]
+            ovl = np.minimum(ends[i:j], aend) - np.maximum(starts[i:j], astart)
+            for kb, c in zip(idx[i:j], ovl):
+                if c > 0:
+                    overlaps.append((bbed[kb], int(c)))
+        if not overlaps:
+            overlaps = [(None, 0)]
+        for b, c in overlaps:
+            if c < minOverlap:
+                continue
+            yield a, b, c
+
+
+def bed_intersect(abed, bbed):
+    """
+    In-memory equivalent of `intersectBed -a abed -b bbed`. Report the part of
+    features in `abed` that overlaps each feature in `bbed`.
+
+    Returns:
+        Bed: Clipped copies of the features in `abed`.
+    """
+    res = Bed()
+    for a, b, c in bed_intersect_wao(abed, bbed, minOverlap=1):
+        ia = BedLine(str(a))
+        ia.start, ia.end = max(a.start, b.start), min(a.end, b.end)
+        res.append(ia)
+    return res
+
+
+def bed_coverage(bed, sizes):
+    """
+    In-memory equivalent of `genomeCoverageBed -bga`. Report the depth of
+    every interval along the genome, including those with zero coverage.
+
+    Args:
+        bed: Bed or list of BedLine.
+        sizes: Dict of seqid => size, iterated in order.
+
+    Returns:
+        Bed: bedgraph features with depth in the fourth column.
+    """
+    index = _interval_index(bed)
+    res = Bed()
+    for seqid, size in sizes.items():
+        if seqid not in index:
+            res.append(_bedline(seqid, 0, size, 0))
+            continue
+        starts, ends, idx, maxspan = index[seqid]
+        ends = np.sort(ends)
+        bounds = np.unique(np.concatenate(([0, size], starts, ends)))
+        bounds = bounds[bounds <= size]
+        bstarts = bounds[:-1]
+        depth = np.searchsorted(starts, bstarts, side="right") - np.searchsorted(
+            ends, bstarts, side="right"
+        )
+        keep = np.concatenate(([True], depth[1:] != depth[:-1]))
+        bstarts, depth = bstarts[keep], depth[keep]
+        bends = np.append(bstarts[1:], size)
+        for bstart, bend, dp in zip(bstarts, bends, depth):
+            res.append(_bedline(seqid, bstart, bend, dp))
+    return res
+
+
+def _covered_bases(starts, ends, x):
+    """
+    Total bases covered by intervals within [0, x), counting multiplicity.
+    Each interval contributes max(0, x - start) - max(0, x - end), which are
+    evaluated for all `x` at once with prefix sums over sorted starts and ends.
+    """
+    res = np.zeros(len(x), dtype=np.int64)
+    for sign, pos in ((1, starts), (-1, ends)):
+        pos = np.sort(pos)
+        cumpos = np.concatenate(([0], np.cumsum(pos)))
+        n = np.searchsorted(pos, x, side="left")
+        res += sign * (n * x - cumpos[n])
+    return res
+
+
+def bed_depth(readsbed, featsbed):
+    """
+    In-memory equivalent of `coverageBed -d | groupBy -o mean`. Compute the
+    average per-base depth of reads over each feature.
+
+    Yields:
+        Tuple[BedLine, float]: feature in `featsbed` (in order), mean depth.
+    """
+    index = _interval_index(readsbed)
+    fstarts = np.array([f.start - 1 for f in featsbed], dtype=np.int64)
+    fends = np.array([f.end for f in featsbed], dtype=np.int64)
+    covered = np.zeros(len(featsbed), dtype=np.int64)
+    seqids = np.array([f.seqid for f in featsbed], dtype=object)
+    for seqid, (starts, ends, idx, maxspan) in index.items():
+        mask = seqids == seqid
+        if not mask.any():
+            continue
+        covered[mask] = _covered_bases(starts, ends, fends[mask]) - _covered_bases(
+            starts, ends, fstarts[mask]
+        )
+
+    for f, c, span in zip(featsbed, covered, fends - fstarts):
+        yield f, c / span
+
+
 def main():
     actions = (
         ("bedpe", "convert to bedpe format"),
@@ -457,7 +909,7 @@ def main():
         ("chain", "chain bed segments together"),
         ("closest", "find closest BED feature"),
         ("density", "calculates density of features per seqid"),
-        ("depth", "calculate average depth per feature using coverageBed"),
+        ("depth", "calculate average depth per feature"),
         ("distance", "calculate distance between bed features"),
         ("evaluate", "make truth table and calculate sensitivity and specificity"),
         ("filter", "filter bedfile to retain records between size range"),
@@ -1041,14 +1493,11 @@ def filter(args):
 
 
 def make_bedgraph(bedfile, fastafile):
-    sizesfile = Sizes(fastafile).filename
+    sizes = Sizes(fastafile).mapping
     pf = bedfile.rsplit(".", 1)[0]
-    bedfile = sort([bedfile])
     bedgraph = pf + ".bedgraph"
     if need_update(bedfile, bedgraph):
-        cmd = "genomeCoverageBed"
-        cmd += " -i {0} -g {1} -bga".format(bedfile, sizesfile)
-        sh(cmd, outfile=bedgraph)
+        bed_coverage(Bed(bedfile, sorted=False), sizes).print_to_file(bedgraph)
 
     return bedgraph
 
@@ -1089,7 +1538,8 @@ def depth(args):
     """
     %prog depth reads.bed features.bed
 
-    Calculate depth depth per feature using coverageBed.
+    Calculate average per-base depth per feature, similar to `coverageBed -d`
+    followed by `groupBy -o mean`.
     """
     p = OptionParser(depth.__doc__)
     p.set_outfile()
@@ -1099,12 +1549,12 @@ def depth(args):
         sys.exit(not p.print_help())
 
     readsbed, featsbed = args
-    fp = open(featsbed)
-    nargs = len(fp.readline().split("\t"))
-    keepcols = ",".join(str(x) for x in range(1, nargs + 1))
-    cmd = "coverageBed -a {0} -b {1} -d".format(readsbed, featsbed)
-    cmd += " | groupBy -g {0} -c {1} -o mean".format(keepcols, nargs + 2)
-    sh(cmd, outfile=opts.outfile)
+    reads = Bed(readsbed, sorted=False)
+    feats = Bed(featsbed, sorted=False)
+    fw = must_open(opts.outfile, "w")
+    for f, d in bed_depth(reads, feats):
+        print("{0}\t{1:.5g}".format(f, d), file=fw)
+    fw.close()
 
 
 def remove_isoforms(ids):
@@ -1598,42 +2048,20 @@ def mergeBed(
     delim: str = ";",
     inplace: bool = False,
 ):
-    if not sorted:
-        bedfile = sort([bedfile, "-i"])
-    cmd = "mergeBed -i {0}".format(bedfile)
-    if d:
-        cmd += " -d {0}".format(d)
-    if nms:
-        nargs = len(open(bedfile).readline().split())
-        if nargs <= 3:
-            logger.debug("Only %d columns detected... set nms=True", nargs)
-        else:
-            cmd += " -c 4 -o collapse"
-    if s:
-        cmd += " -s"
-    if scores:
-        valid_opts = (
-            "sum",
-            "min",
-            "max",
-            "mean",
-            "median",
-            "mode",
-            "antimode",
-            "collapse",
-        )
-        if scores not in valid_opts:
-            scores = "mean"
-        cmd += " -scores {0}".format(scores)
-
-    if nms and delim:
-        cmd += ' -delim "{0}"'.format(delim)
-
+    """
+    File-based wrapper of `bed_merge()`. The input need not be sorted, `sorted`
+    is kept for backward compatibility.
+    """
     pf = bedfile.rsplit(".", 1)[0] if bedfile.endswith(".bed") else bedfile
     mergebedfile = op.basename(pf) + ".merge.bed"
 
     if need_update(bedfile, mergebedfile):
-        sh(cmd, outfile=mergebedfile)
+        bed = Bed(bedfile, sorted=False)
+        if nms and bed and bed[0].nargs <= 3:
+            logger.debug("Only %d columns detected... set nms=False", bed[0].nargs)
+            nms = False
+        merged = bed_merge(bed, d=d, nms=nms, s=s, scores=scores, delim=delim)
+        merged.print_to_file(mergebedfile)
 
     if inplace:
         shutil.move(mergebedfile, bedfile)
@@ -1641,18 +2069,16 @@ def mergeBed(
 
 
 def complementBed(bedfile, sizesfile):
-    cmd = "complementBed"
-    cmd += " -i {0} -g {1}".format(bedfile, sizesfile)
     complementbedfile = "complement_" + op.basename(bedfile)
 
     if need_update([bedfile, sizesfile], complementbedfile):
-        sh(cmd, outfile=complementbedfile)
+        sizes = Sizes(sizesfile).mapping
+        bed = Bed(bedfile, sorted=False)
+        bed_complement(bed, sizes).print_to_file(complementbedfile)
     return complementbedfile
 
 
 def intersectBed(bedfile1, bedfile2):
-    cmd = "intersectBed"
-    cmd += " -a {0} -b {1}".format(bedfile1, bedfile2)
     suffix = ".intersect.bed"
 
     intersectbedfile = (
@@ -1663,7 +2089,9 @@ def intersectBed(bedfile1, bedfile2):
     )
 
     if need_update([bedfile1, bedfile2], intersectbedfile):
-        sh(cmd, outfile=intersectbedfile)
+        abed = Bed(bedfile1, sorted=False)
+        bbed = Bed(bedfile2, sorted=False)
+        bed_intersect(abed, bbed).print_to_file(intersectbedfile)
     return intersectbedfile
 
 
@@ -1722,11 +2150,10 @@ def evaluate(args):
     if query:
         subbeds = []
         rr = query_to_range(query, sizes)
-        ce = 'echo "{0}"'.format("\t".join(str(x) for x in rr))
+        qbed = [_bedline(*rr)]
         for b in beds:
             subbed = ".".join((b, query))
-            cmd = ce + " | intersectBed -a stdin -b {0}".format(b)
-            sh(cmd, outfile=subbed)
+            bed_intersect(qbed, Bed(b, sorted=False)).print_to_file(subbed)
             subbeds.append(subbed)
         beds = subbeds
 
@@ -1740,29 +2167,14 @@ def evaluate(args):
 
 
 def intersectBed_wao(abedfile, bbedfile, minOverlap=0):
-    abed = Bed(abedfile)
-    bbed = Bed(bbedfile)
+    abed = Bed(abedfile, sorted=False)
+    bbed = Bed(bbedfile, sorted=False)
     print("`{0}` has {1} features.".format(abedfile, len(abed)), file=sys.stderr)
     print("`{0}` has {1} features.".format(bbedfile, len(bbed)), file=sys.stderr)
 
-    cmd = "intersectBed -wao -a {0} -b {1}".format(abedfile, bbedfile)
-    acols = abed[0].nargs
-    bcols = bbed[0].nargs
-    fp = popen(cmd)
-    for row in fp:
-        atoms = row.split()
-        aline = "\t".join(atoms[:acols])
-        bline = "\t".join(atoms[acols : acols + bcols])
-        c = int(atoms[-1])
-        if c < minOverlap:
-            continue
-        a = BedLine(aline)
-        try:
-            b = BedLine(bline)
-        except AssertionError:
-            b = None
-
-        yield a, b
+    for a, b, c in bed_intersect_wao(abed, bbed, minOverlap=minOverlap):
+        # Callers may modify the features, hence yield independent copies
+        yield BedLine(str(a)), b
 
 
 def refine(args):
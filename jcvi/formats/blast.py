@@ -8,7 +8,9 @@ import sys
 from itertools import groupby
 from collections import defaultdict
 
-from ..apps.base import ActionDispatcher, OptionParser, logger, popen, sh
+import numpy as np
+
+from ..apps.base import ActionDispatcher, OptionParser, logger, need_update, popen, sh
 from ..assembly.base import calculate_A50
 from ..compara.base import AnchorFile
 from ..utils.cbook import percentage
@@ -18,15 +20,16 @@ from ..utils.range import range_distance
 
 from .base import LineFile, BaseFile, must_open
 from .bed import Bed
+from .pyblast import BLAST_DTYPE, iter_blast_chunks
 from .sizes import Sizes
 
-
 try:
-    from .cblast import BlastLine
+    from .cblast import Blast as CBlast, BlastLine, iter_blast_fields
 except:
-    from .pyblast import BlastLine
+    from .pyblast import BlastLine, iter_blast_fields
 
     logger.error("Fall back to Python implementation of BlastLine")
+    CBlast = None
 
 
 class BlastSlow(LineFile):
@@ -72,6 +75,9 @@ class Blast(BaseFile):
     We can have a Blast class that loads entire file into memory, this is
     not very efficient for big files (BlastSlow); when the BLAST file is
     generated by BLAST/BLAT, the file is already sorted
+
+    If a binary cache (see `build_cache()`) newer than the BLAST file exists,
+    the hits are read from the memory-mapped cache instead of the text.
     """
 
     def __init__(self, filename):
@@ -79,6 +85,11 @@ class Blast(BaseFile):
         self.fp = must_open(filename)
 
     def __iter__(self):
+        if self.has_cache:
+            for b in self.iter_cache():
+                yield b
+            return
+
         self.fp.seek(0)
         for row in self.fp:
             if row[0] == "#":
@@ -86,8 +97,8 @@ class Blast(BaseFile):
             yield BlastLine(row)
 
     def iter_hits(self):
-        for query, blines in groupby(self.fp, key=lambda x: BlastLine(x).query):
-            blines = [BlastLine(x) for x in blines]
+        for query, blines in groupby(self, key=lambda x: x.query):
+            blines = list(blines)
             blines.sort(key=lambda x: -x.score)  # descending score
             yield query, blines
 
@@ -99,8 +110,8 @@ class Blast(BaseFile):
         else:
             sys.exit("`ref` must be either `query` or `subject`.")
 
-        for bref, blines in groupby(self.fp, key=lambda x: getattr(BlastLine(x), ref)):
-            blines = [BlastLine(x) for x in blines]
+        for bref, blines in groupby(self, key=lambda x: getattr(x, ref)):
+            blines = list(blines)
             blines.sort(key=lambda x: -x.score)
             counter = 0
             selected = set()
@@ -132,6 +143,96 @@ class Blast(BaseFile):
         """
         return dict(self.iter_best_hit())
 
+    @property
+    def cachefiles(self):
+        return self.filename + ".npy", self.filename + ".names.npy"
+
+    @property
+    def has_cache(self):
+        return not need_update(self.filename, list(self.cachefiles))
+
+    def build_cache(self, chunksize=1000000):
+        """
+        Write the hits into a structured array `.npy` and the query/subject
+        names into a name table `.names.npy`, both can be memory-mapped.
+        """
+        recordsfile, namesfile = self.cachefiles
+        self.fp.seek(0)
+        nrecords = sum(1 for row in self.fp if row[0] not in "#\n")
+        records = np.lib.format.open_memmap(
+            recordsfile, mode="w+", dtype=BLAST_DTYPE, shape=(nrecords,)
+        )
+        names = []
+        i = 0
+        for chunk, names in self.iter_text_chunks(chunksize):
+            records[i : i + len(chunk)] = chunk
+            i += len(chunk)
+        records.flush()
+        del records
+
+        np.save(namesfile, np.array(names, dtype=str))
+        logger.debug(
+            "Cached %d hits (%d names) in `%s`", nrecords, len(names), recordsfile
+        )
+        return recordsfile
+
+    def iter_text_chunks(self, n=100000):
+        """
+        Parse the BLAST file into (records, names) for every `n` hits, see
+        iter_chunks().
+        """
+        if (
+            CBlast is not None
+            and op.isfile(self.filename)
+            and not self.filename.endswith((".gz", ".bz2"))
+        ):
+            for chunk in CBlast(self.filename).iter_chunks(n):
+                yield chunk
+            return
+
+        self.fp.seek(0)
+        for chunk in iter_blast_chunks(self.fp, n):
+            yield chunk
+
+    def iter_chunks(self, n=100000):
+        """
+        Yield (records, names) for every `n` hits, `records` is a structured
+        array (BLAST_DTYPE) where query and subject are ids into the list
+        `names`, so that callers can work on the hits vectorially. Read from
+        the binary cache when it is up to date.
+        """
+        if not self.has_cache:
+            for chunk in self.iter_text_chunks(n):
+                yield chunk
+            return
+
+        records, names = self.load_cache()
+        names = names.tolist()
+        for i in range(0, len(records), n):
+            yield records[i : i + n], names
+
+    def load_cache(self, mmap_mode="r"):
+        """
+        Returns the records and the name table from the binary cache, memory
+        mapped by default so that they can be shared by worker processes.
+        """
+        recordsfile, namesfile = self.cachefiles
+        records = np.load(recordsfile, mmap_mode=mmap_mode)
+        names = np.load(namesfile, mmap_mode=mmap_mode)
+        return records, names
+
+    def iter_cache(self, chunksize=100000):
+        """
+        Yield BlastLine from the binary cache, with identical values as when
+        parsed from the text.
+        """
+        records, names = self.load_cache()
+        names = [x.encode("utf-8") for x in names.tolist()]
+        for i in range(0, len(records), chunksize):
+            chunk = records[i : i + chunksize]
+            for b in iter_blast_fields(names, *(chunk[x] for x in BLAST_DTYPE.names)):
+                yield b
+
 
 class BlastLineByConversion(BlastLine):
     """
@@ -395,11 +496,30 @@ def main():
         ("score", "add up the scores for each query seq"),
         ("rbbh", "find reciprocal-best blast hits"),
         ("gaps", "find distribution of gap sizes between adjacent HSPs"),
+        ("cache", "build binary cache of BLAST tabular file for faster reads"),
     )
     p = ActionDispatcher(actions)
     p.dispatch(globals())
 
 
+def cache(args):
+    """
+    %prog cache blastfile
+
+    Build binary cache `blastfile.npy` and `blastfile.names.npy`, which are
+    used in place of the BLAST file when reading it, as long as the cache is
+    newer.
+    """
+    p = OptionParser(cache.__doc__)
+    opts, args = p.parse_args(args)
+
+    if len(args) != 1:
+        sys.exit(not p.print_help())
+
+    (blastfile,) = args
+    return Blast(blastfile).build_cache()
+
+
 def collect_gaps(blast, use_subject=False):
     """
     Collect the gaps between adjacent HSPs in the BLAST file.
@@ -757,6 +877,111 @@ def sort(args):
     sh(cmd)
 
 
+def best_scores(query, subject, score, n):
+    """
+    Best score of each gene as either query or subject, where `query` and
+    `subject` are arrays of gene ids within 0..n-1.
+    """
+    best = np.zeros(n)
+    np.maximum.at(best, query, score)
+    np.maximum.at(best, subject, score)
+    return best
+
+
+def cscores(query, subject, score, best):
+    """
+    C-score of each hit given the best scores of the genes, see cscore().
+    """
+    return score / np.maximum(best[query], best[subject])
+
+
+def cscore_columns(chunks, ostrip=True):
+    """
+    Collect the columns needed for C-score from the (records, names) chunks
+    of a BLAST file, with names interned into gene ids. Returns the list of
+    gene names, and arrays of query and subject ids, score and pctid (as
+    single precision, same as BlastLine).
+    """
+    from jcvi.utils.cbook import gene_name
+
+    genes = []
+    gene_ids = {}
+    name_to_gene = np.empty(0, dtype=int)
+    nnames = 0
+    columns = []
+    for records, names in chunks:
+        if len(names) > nnames:
+            new = []
+            for name in names[nnames:]:
+                gene = gene_name(name) if ostrip else name
+                gi = gene_ids.get(gene)
+                if gi is None:
+                    gi = gene_ids[gene] = len(genes)
+                    genes.append(gene)
+                new.append(gi)
+            if len(names) > len(name_to_gene):  # Grow geometrically
+                grown = np.empty(max(len(names), 2 * len(name_to_gene)), dtype=int)
+                grown[:nnames] = name_to_gene[:nnames]
+                name_to_gene = grown
+            name_to_gene[nnames : len(names)] = new
+            nnames = len(names)
+        columns.append(
+            (
+                name_to_gene[records["query"]],
+                name_to_gene[records["subject"]],
+                records["score"].astype(np.float32),
+                records["pctid"].astype(np.float32),
+            )
+        )
+
+    if not columns:
+        empty = np.empty(0, dtype=int)
+        return genes, empty, empty, np.empty(0, dtype=np.float32), empty
+    return (genes,) + tuple(np.concatenate(x) for x in zip(*columns))
+
+
+def cscore_shard(arg):
+    """
+    Worker for cscore(), collect the columns for the hits within a byte range
+    of the BLAST file.
+    """
+    blastfile, start, end, ostrip, chunksize = arg
+    return cscore_columns(CBlast(blastfile).iter_chunks(chunksize, start, end), ostrip)
+
+
+def blast_shards(blastfile, n):
+    """
+    Split the BLAST file into `n` byte ranges that start at line boundaries.
+    """
+    filesize = op.getsize(blastfile)
+    starts = [0]
+    with open(blastfile, "rb") as fp:
+        for i in range(1, n):
+            fp.seek(max(filesize * i // n, starts[-1]))
+            if fp.tell() > 0:
+                fp.seek(fp.tell() - 1)
+                fp.readline()  # Move to the start of next line
+            starts.append(fp.tell())
+    ends = starts[1:] + [filesize]
+    return [(a, b) for a, b in zip(starts, ends) if a < b]
+
+
+def merge_cscore_columns(shards):
+    """
+    Merge the columns from cscore_shard(), with the gene ids of each shard
+    converted to the ids in the merged list of genes.
+    """
+    gene_ids = {}
+    columns = []
+    for sgenes, query, subject, score, pctid in shards:
+        remap = np.array(
+            [gene_ids.setdefault(x, len(gene_ids)) for x in sgenes], dtype=int
+        )
+        columns.append((remap[query], remap[subject], score, pctid))
+    genes = list(gene_ids)  # Insertion ordered
+    return (genes,) + tuple(np.concatenate(x) for x in zip(*columns))
+
+
 def cscore(args):
     """
     %prog cscore blastfile > cscoreOut
@@ -771,8 +996,6 @@ def cscore(args):
     Output file will be 3-column (query, subject, cscore). Use --cutoff to
     select a different cutoff.
     """
-    from jcvi.utils.cbook import gene_name
-
     p = OptionParser(cscore.__doc__)
     p.add_argument(
         "--cutoff",
@@ -792,8 +1015,15 @@ def cscore(args):
         action="store_true",
         help="Also write filtered blast file",
     )
+    p.add_argument(
+        "--chunksize",
+        default=100000,
+        type=int,
+        help="Number of BLAST hits to parse at a time",
+    )
     p.set_stripnames()
     p.set_outfile()
+    p.set_cpus(cpus=1)
 
     opts, args = p.parse_args(args)
     ostrip = opts.strip_names
@@ -806,48 +1036,77 @@ def cscore(args):
     (blastfile,) = args
 
     blast = Blast(blastfile)
-    logger.debug("Register best scores ..")
-    best_score = defaultdict(float)
-    for b in blast:
-        query, subject = b.query, b.subject
-        if ostrip:
-            query, subject = gene_name(query), gene_name(subject)
-
-        score = b.score
-        if score > best_score[query]:
-            best_score[query] = score
-        if score > best_score[subject]:
-            best_score[subject] = score
-
-    blast = Blast(blastfile)
-    pairs = {}
-    cutoff = opts.cutoff
-    for b in blast:
-        query, subject = b.query, b.subject
-        if ostrip:
-            query, subject = gene_name(query), gene_name(subject)
+    chunksize = opts.chunksize
+    if (
+        opts.cpus > 1
+        and CBlast is not None
+        and not blast.has_cache
+        and not blastfile.endswith((".gz", ".bz2"))
+    ):
+        from multiprocessing import Pool
+
+        shards = blast_shards(blastfile, opts.cpus)
+        logger.debug("Parse %d shards of `%s` ..", len(shards), blastfile)
+        with Pool(processes=opts.cpus) as pool:
+            shards = pool.map(
+                cscore_shard,
+                [(blastfile, a, b, ostrip, chunksize) for a, b in shards],
+            )
+        genes, query, subject, score, pctid = merge_cscore_columns(shards)
+    else:
+        genes, query, subject, score, pctid = cscore_columns(
+            blast.iter_chunks(chunksize), ostrip
+        )
 
-        score = b.score
-        pctid = b.pctid
-        s = score / max(best_score[query], best_score[subject])
-        if s > cutoff:
-            pair = (query, subject)
-            if pair not in pairs or s > pairs[pair][0]:
-                pairs[pair] = (s, pctid, b)
+    logger.debug("Register best scores ..")
+    best = best_scores(query, subject, score, len(genes))
+    s = cscores(query, subject, score, best)
+
+    # Keep the hit with the best C-score for each gene pair, the first one
+    # if tied
+    (rows,) = np.nonzero(s > opts.cutoff)
+    key = query[rows] * len(genes) + subject[rows]
+    order = np.lexsort((rows, -s[rows], key))
+    key = key[order]
+    first = np.ones(len(key), dtype=bool)
+    first[1:] = key[1:] != key[:-1]
+    rows = rows[order[first]]
+    pairs = sorted(
+        zip(
+            [genes[x] for x in query[rows].tolist()],
+            [genes[x] for x in subject[rows].tolist()],
+            rows.tolist(),
+        )
+    )
 
     fw = must_open(outfile, "w")
-    if writeblast:
-        fwb = must_open(outfile + ".filtered.blast", "w")
     pct = opts.pct
-    for (query, subject), (s, pctid, b) in sorted(pairs.items()):
-        args = [query, subject, "{0:.2f}".format(s)]
+    for query, subject, row in pairs:
+        args = [query, subject, "{0:.2f}".format(s[row])]
         if pct:
-            args.append("{0:.1f}".format(pctid))
+            args.append("{0:.1f}".format(pctid[row]))
         print("\t".join(args), file=fw)
-        if writeblast:
-            print(b, file=fwb)
     fw.close()
+
     if writeblast:
+        # Fetch the selected hits in another pass
+        selected = np.zeros(len(s), dtype=bool)
+        selected[rows] = True
+        hits = {}
+        i = 0
+        for records, names in blast.iter_chunks(chunksize):
+            (idx,) = np.nonzero(selected[i : i + len(records)])
+            if len(idx):
+                bnames = [x.encode("utf-8") for x in names]
+                chunk = records[idx]
+                blines = iter_blast_fields(
+                    bnames, *(chunk[x] for x in BLAST_DTYPE.names)
+                )
+                hits.update(zip((idx + i).tolist(), blines))
+            i += len(records)
+        fwb = must_open(outfile + ".filtered.blast", "w")
+        for query, subject, row in pairs:
+            print(hits[row], file=fwb)
         fwb.close()
 
 
@@ -7,13 +7,22 @@ Stolen from brentp's biostuff (thanks):
 <https://github.com/brentp/bpbio/blob/master/biostuff/biostuff/cblastline.pyx>
 """
 import sys
+import numpy as np
 from libc.stdio cimport FILE, EOF, fopen, fscanf, rewind, fclose, sscanf, \
-            fgets, sprintf
-from libc.string cimport strcpy
+            fgets, sprintf, snprintf, fseek, ftell, SEEK_SET
+from libc.stdlib cimport malloc, realloc, free
+from libc.string cimport strcpy, strlen
+
+from jcvi.formats.pyblast import BLAST_DTYPE
+
+
+cdef extern from "stdio.h":
+    ssize_t getline(char **lineptr, size_t *n, FILE *stream)
 
 
 cdef const char *blast_format = "%s\t%s\t%f\t%d\t%d\t%d\t%d\t%d\t%d\t%d\t%lf\t%f"
 cdef const char *blast_format_line = "%s\t%s\t%f\t%d\t%d\t%d\t%d\t%d\t%d\t%d\t%lf\t%f\n"
+cdef const char *blast_format_double = "%s\t%s\t%lf\t%d\t%d\t%d\t%d\t%d\t%d\t%d\t%lf\t%lf"
 cdef const char *blast_output = "%s\t%s\t%.2f\t%d\t%d\t%d\t%d\t%d\t%d\t%d\t%.2g\t%.3g"
 cdef const char *bed_output = "%s\t%d\t%d\t%s:%d-%d\t%.2g\t%c"
 
@@ -22,34 +31,143 @@ cdef class Blast:
     cdef:
         FILE* fh
         object filename
+        char *line
+        size_t linecap
+        char *qname
+        char *sname
+        size_t namecap
 
-    def __cinit__(self, char* filename):
-        self.fh = fopen(filename, 'r')
+    def __cinit__(self, filename):
         self.filename = filename
+        if isinstance(filename, str):
+            filename = c_str(filename)
+        self.fh = fopen(filename, 'r')
+        if self.fh == NULL:
+            raise IOError("Cannot open `%s`" % (self.filename, ))
 
     def __iter__(self):
         rewind(self.fh)
         return self
 
+    cdef ssize_t next_line(self, long end=-1):
+        """
+        Read the next non-comment line (that starts before `end`), and make
+        sure the name buffers can hold any field on it, so names are not
+        limited in length.
+        """
+        cdef ssize_t nread
+        while True:
+            if end >= 0 and ftell(self.fh) >= end:
+                return -1
+            nread = getline(&self.line, &self.linecap, self.fh)
+            if nread < 0:
+                return nread
+            if self.line[0] != c'#' and self.line[0] != c'\n':
+                break
+        if <size_t> nread >= self.namecap:
+            self.namecap = nread + 1
+            self.qname = <char *> realloc(self.qname, self.namecap)
+            self.sname = <char *> realloc(self.sname, self.namecap)
+        return nread
+
     def __next__(self):
         cdef:
-            float pct = 0.0, evalue = 0.0, bit = 0.0
-            char qname[128]
-            char sname[128]
+            float pct = 0.0, bit = 0.0
+            double evalue = 0.0
             int hlen, nmiss, ngap, qstart, qstop, sstart, sstop
-            char *tmp
-            int success
 
-        success = fscanf(self.fh, blast_format_line, qname, sname, \
-                         &pct, &hlen, &nmiss, &ngap, &qstart, &qstop,\
-                         &sstart, &sstop, &evalue, &bit )
-        if success == EOF:
+        if self.next_line() < 0:
             raise StopIteration
-        return create_blast_line(qname, sname, pct, hlen, nmiss, ngap,
+        sscanf(self.line, blast_format, self.qname, self.sname, \
+               &pct, &hlen, &nmiss, &ngap, &qstart, &qstop,\
+               &sstart, &sstop, &evalue, &bit )
+        return create_blast_line(self.qname, self.sname, pct, hlen, nmiss, ngap,
                         qstart, qstop, sstart, sstop, evalue, bit)
 
+    def iter_chunks(self, int n=100000, long start=0, long end=-1):
+        """
+        Yield (records, names) for every `n` hits, `records` is a structured
+        array (see BLAST_DTYPE) where query and subject are ids into `names`.
+        The `names` list is shared and grows across chunks. Coordinates are
+        normalized as in BlastLine.
+
+        Only the lines starting within the byte range [start, end) are read,
+        `start` must be at the beginning of a line.
+        """
+        cdef:
+            Py_ssize_t i
+            int qi, si
+            double pct, evalue, bit
+            int hlen, nmiss, ngap, qstart, qstop, sstart, sstop
+            signed char orientation
+            int[:] query, subject, hitlen, nmismatch, ngaps
+            int[:] qstarts, qstops, sstarts, sstops
+            double[:] pctid, evalues, score
+            signed char[:] orientations
+
+        names = []
+        ids = {}
+        fseek(self.fh, start, SEEK_SET)
+        while True:
+            records = np.empty(n, dtype=BLAST_DTYPE)
+            query, subject = records["query"], records["subject"]
+            pctid, hitlen = records["pctid"], records["hitlen"]
+            nmismatch, ngaps = records["nmismatch"], records["ngaps"]
+            qstarts, qstops = records["qstart"], records["qstop"]
+            sstarts, sstops = records["sstart"], records["sstop"]
+            evalues, score = records["evalue"], records["score"]
+            orientations = records["orientation"]
+            i = 0
+            while i < n and self.next_line(end) >= 0:
+                sscanf(self.line, blast_format_double, self.qname, self.sname,
+                       &pct, &hlen, &nmiss, &ngap, &qstart, &qstop,
+                       &sstart, &sstop, &evalue, &bit)
+                qb = <bytes> self.qname
+                qi = ids.get(qb, -1)
+                if qi < 0:
+                    qi = ids[qb] = len(names)
+                    names.append(py_str(qb))
+                sb = <bytes> self.sname
+                si = ids.get(sb, -1)
+                if si < 0:
+                    si = ids[sb] = len(names)
+                    names.append(py_str(sb))
+
+                orientation = 1
+                if qstart > qstop:
+                    qstart, qstop = qstop, qstart
+                    orientation = -1
+                if sstart > sstop:
+                    sstart, sstop = sstop, sstart
+                    orientation = -1
+
+                query[i] = qi
+                subject[i] = si
+                pctid[i] = pct
+                hitlen[i] = hlen
+                nmismatch[i] = nmiss
+                ngaps[i] = ngap
+                qstarts[i] = qstart
+                qstops[i] = qstop
+                sstarts[i] = sstart
+                sstops[i] = sstop
+                evalues[i] = evalue
+                score[i] = bit
+                orientations[i] = orientation
+                i += 1
+
+            if i == 0:
+                break
+            yield records[:i], names
+            if i < n:
+                break
+
     def __dealloc__(self):
-        fclose(self.fh)
+        if self.fh != NULL:
+            fclose(self.fh)
+        free(self.line)
+        free(self.qname)
+        free(self.sname)
 
     def __repr__(self):
         return "Blast('%s')" % (self.filename, )
@@ -82,8 +200,8 @@ cdef class BlastLine:
                  'qseqid', 'sseqid', 'qi', 'si', 'orientation')
 
     cdef public:
-        char _query[128]
-        char _subject[128]
+        bytes _query
+        bytes _subject
         int hitlen, nmismatch, ngaps, qstart, qstop, sstart, sstop
         float pctid, score
         double evalue
@@ -95,21 +213,30 @@ cdef class BlastLine:
         def __get__(self):
             return py_str(self._query)
         def __set__(self, val: str):
-            strcpy(self._query, c_str(val))
+            self._query = c_str(val)
 
     property subject:
         def __get__(self):
             return py_str(self._subject)
         def __set__(self, val: str):
-            strcpy(self._subject, c_str(val))
+            self._subject = c_str(val)
 
     def __init__(self, s):
         sline = c_str(s)
-        sscanf(sline, blast_format, self._query, self._subject,
+        # Names cannot be longer than the line itself
+        cdef size_t size = len(sline) + 1
+        cdef char *query = <char *> malloc(size)
+        cdef char *subject = <char *> malloc(size)
+        query[0] = subject[0] = 0
+        sscanf(sline, blast_format, query, subject,
                 &self.pctid, &self.hitlen, &self.nmismatch, &self.ngaps,
                 &self.qstart, &self.qstop,
                 &self.sstart, &self.sstop,
                 &self.evalue, &self.score)
+        self._query = query
+        self._subject = subject
+        free(query)
+        free(subject)
 
         self.orientation = '+'
         if self.qstart > self.qstop:
@@ -146,14 +273,18 @@ cdef class BlastLine:
         if self.orientation == '-':
             args[8], args[9] = args[9], args[8]
 
-        cdef char result[512]
-        sprintf(result, blast_output, self._query, self._subject,
+        cdef size_t size = len(self._query) + len(self._subject) + 256
+        cdef char *result = <char *> malloc(size)
+        snprintf(result, size, blast_output, <char *> self._query,
+            <char *> self._subject,
             self.pctid, self.hitlen, self.nmismatch, self.ngaps,
             self.qstart, self.qstop,
             self.sstart, self.sstop,
             self.evalue, self.score)
-
-        return py_str(result)
+        try:
+            return py_str(result)
+        finally:
+            free(result)
 
     @property
     def has_score(self):
@@ -174,13 +305,16 @@ cdef class BlastLine:
 
     @property
     def bedline(self):
-        cdef char result[512]
-        sprintf(result, bed_output,
-                self._subject, self.sstart - 1, self.sstop,
-                self._query, self.qstart, self.qstop,
+        cdef size_t size = len(self._query) + len(self._subject) + 256
+        cdef char *result = <char *> malloc(size)
+        snprintf(result, size, bed_output,
+                <char *> self._subject, self.sstart - 1, self.sstop,
+                <char *> self._query, self.qstart, self.qstop,
                 self.score, self.orientation)
-
-        return py_str(result)
+        try:
+            return py_str(result)
+        finally:
+            free(result)
 
     def __reduce__(self):
         return create_blast_line, (
@@ -189,14 +323,46 @@ cdef class BlastLine:
             self.evalue, self.score)
 
 
+def iter_blast_fields(list names, const int[:] query, const int[:] subject,
+                      const double[:] pctid, const int[:] hitlen,
+                      const int[:] nmismatch, const int[:] ngaps,
+                      const int[:] qstart, const int[:] qstop,
+                      const int[:] sstart, const int[:] sstop,
+                      const double[:] evalue, const double[:] score,
+                      const signed char[:] orientation):
+    """
+    Yield BlastLine from columns of parsed fields (e.g. the binary cache, see
+    jcvi.formats.blast.Blast.iter_cache()), `names` are UTF-8 encoded.
+    """
+    cdef:
+        Py_ssize_t i
+        BlastLine b
+    for i in range(query.shape[0]):
+        b = BlastLine.__new__(BlastLine)
+        b._query = names[query[i]]
+        b._subject = names[subject[i]]
+        b.pctid = pctid[i]
+        b.hitlen = hitlen[i]
+        b.nmismatch = nmismatch[i]
+        b.ngaps = ngaps[i]
+        b.qstart = qstart[i]
+        b.qstop = qstop[i]
+        b.sstart = sstart[i]
+        b.sstop = sstop[i]
+        b.evalue = evalue[i]
+        b.score = score[i]
+        b.orientation = '-' if orientation[i] < 0 else '+'
+        yield b
+
+
 cdef BlastLine create_blast_line(char *query, char *subject, float pctid, int hitlen,
                        int nmismatch, int ngaps, int qstart, int qstop,
-                       int sstart, int sstop, float evalue, float score):
+                       int sstart, int sstop, double evalue, float score):
     """ Factory method.
     """
     cdef BlastLine b = BlastLine.__new__(BlastLine)
-    b.query = query
-    b.subject = subject
+    b._query = query
+    b._subject = subject
     b.pctid = pctid
     b.hitlen = hitlen
     b.nmismatch = nmismatch
@@ -3,6 +3,7 @@ Wrapper for biopython Fasta, add option to parse sequence headers
 """
 
 import hashlib
+import mmap
 import os.path as op
 import re
 import shutil
@@ -12,13 +13,16 @@ import sys
 from itertools import groupby, zip_longest
 from random import choice
 
+import numpy as np
+
 from Bio import SeqIO
-from Bio.Seq import Seq
+from Bio.Seq import Seq, SequenceDataAbstractBaseClass, reverse_complement
 from Bio.SeqRecord import SeqRecord
 from Bio.SeqUtils.CheckSum import seguid
 from more_itertools import grouper, pairwise
 
 from ..apps.base import ActionDispatcher, OptionParser, cleanup, logger, need_update
+from ..apps.grid import WorkerPool, worker_data
 from ..utils.cbook import percentage
 from ..utils.console import printf
 from ..utils.table import write_csv
@@ -35,6 +39,17 @@ class Fasta(BaseFile, dict):
         if lazy:  # do not incur the overhead
             return
 
+        # Records are read on demand through the .fai index when one is there,
+        # or when an index is asked for, then the .fai is saved for next time
+        if not key_function and (
+            index or not need_update(filename, filename + ".fai", warn=False)
+        ):
+            try:
+                self.index = FastaIndex(filename, write=index)
+                return
+            except (OSError, UnicodeDecodeError, ValueError) as e:
+                logger.debug("Cannot index `%s` (%s), parse all", filename, e)
+
         if index:
             self.index = SeqIO.index(filename, "fasta", key_function=key_function)
         else:
@@ -166,6 +181,410 @@ class Fasta(BaseFile, dict):
         return seq
 
 
+class FastaSequenceData(SequenceDataAbstractBaseClass):
+    """
+    Sequence of a record in FastaIndex, bases are only read from the memory
+    map for the slices requested. See Bio.Seq.SequenceDataAbstractBaseClass.
+    """
+
+    __slots__ = ("fasta", "key", "length")
+
+    def __init__(self, fasta, key):
+        self.fasta = fasta
+        self.key = key
+        self.length = fasta.size(key)
+        super().__init__()
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            start, stop, step = key.indices(self.length)
+            if step == 1:
+                return self.fasta.fetch_bytes(self.key, start, stop)
+            return self.fasta.fetch_bytes(self.key)[key]
+        if key < 0:
+            key += self.length
+        if not 0 <= key < self.length:
+            raise IndexError("sequence index out of range")
+        return self.fasta.fetch_bytes(self.key, key, key + 1)[0]
+
+
+# Magic numbers of the gzip and bzip2 files that must_open() reads
+COMPRESSED_MAGIC = (b"\x1f\x8b", b"BZh")
+
+
+class FastaIndex(object):
+    """
+    Random access to the sequences in a FASTA file through a samtools faidx
+    compatible index (.fai). An up-to-date .fai is read, otherwise the index
+    is built in memory, and only written to the .fai with `write=True`. The
+    file is memory-mapped and slices are read at their byte offsets without
+    parsing the rest of the file, so memory use does not depend on the genome
+    size. The mapped pages are shared by the processes reading the same file,
+    and the index can be pickled to worker processes, which map the file again.
+
+    Records are returned as SeqRecords whose sequence is read on demand, e.g.
+    fasta["chr1"].seq[1000:2000].reverse_complement() only reads 1000 bases.
+    """
+
+    def __init__(self, filename, write=False):
+        self.filename = filename
+        self.faifile = filename + ".fai"
+        self.open()
+        if need_update(filename, self.faifile, warn=False):
+            # The map is closed once the arrays on it are released
+            try:
+                records, error = self.build(write=write), None
+            except ValueError as e:
+                error = str(e)
+            if error:
+                self.close()
+                raise ValueError(error)
+        else:
+            with open(self.faifile) as fp:
+                records = [row.split()[:5] for row in fp]
+        self.index = {}
+        for name, length, offset, linebases, linewidth in records:
+            if name in self.index:
+                self.close()
+                raise ValueError("Duplicate name `{}` in `{}`".format(name, filename))
+            self.index[name] = (
+                int(length),
+                int(offset),
+                int(linebases),
+                int(linewidth),
+            )
+        self.records = {}
+
+    def __getstate__(self):
+        return self.filename, self.index
+
+    def __setstate__(self, state):
+        self.filename, self.index = state
+        self.faifile = self.filename + ".fai"
+        self.open()
+        self.records = {}
+
+    def open(self):
+        self.fp = open(self.filename, "rb")
+        if self.fp.read(3).startswith(COMPRESSED_MAGIC):
+            self.fp.close()
+            raise ValueError("Cannot index compressed `{}`".format(self.filename))
+        try:
+            self.mm = mmap.mmap(self.fp.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:  # Empty file
+            self.fp.close()
+            raise
+
+    def build(self, write=False):
+        """
+        Returns the rows of the .fai index, also written to the .fai with
+        `write=True`. Every line in a record except the last must have the
+        same length, otherwise raise ValueError, as well as when the file has
+        content but no FASTA header.
+        Lines are found with mmap.find() and checked with NumPy, without
+        iterating over the lines in Python. If the .fai cannot be written, the
+        index is only kept in memory.
+        """
+        mm = self.mm
+        data = np.frombuffer(mm, dtype=np.uint8)
+        records = []
+        size = len(mm)
+        header = 0 if mm[:1] == b">" else mm.find(b"\n>") + 1
+        while header < size and mm[header : header + 1] == b">":
+            eol = mm.find(b"\n", header)
+            start = size if eol < 0 else eol + 1
+            words = mm[header + 1 : start].split()
+            name = words[0].decode() if words else ""
+            end = mm.find(b"\n>", start - 1) + 1 if start < size else size
+            end = end or size
+            length, linebases, linewidth = self.index_lines(data, start, end, name)
+            records.append((name, length, start, linebases, linewidth))
+            header = end
+
+        if not records and not np.isin(data, (9, 10, 13, 32)).all():
+            raise ValueError("No FASTA header in `{}`".format(self.filename))
+
+        if not write:
+            return records
+        try:
+            with open(self.faifile, "w") as fw:
+                for record in records:
+                    print("\t".join(str(x) for x in record), file=fw)
+            logger.debug("Index for `%s` written to `%s`", self.filename, self.faifile)
+        except OSError as e:
+            logger.debug("Cannot write `%s` (%s), index in memory", self.faifile, e)
+        return records
+
+    def index_lines(self, data, start, end, name, chunksize=1 << 24):
+        """
+        Returns (length, linebases, linewidth) of the sequence in data[start:end].
+        """
+        # Trailing blank lines
+        stop = end
+        while stop > start and data[stop - 1] in (10, 13):
+            stop -= 1
+        if stop == start:
+            return 0, 0, 0
+        eol = self.mm.find(b"\n", start, stop)
+        if eol < 0:  # Single line
+            eol = min(stop + (data[stop] == 13), end - 1) if stop < end else stop - 1
+            return stop - start, stop - start, eol + 1 - start
+        linewidth = eol + 1 - start
+        linebases = linewidth - (2 if data[eol - 1] == 13 else 1)
+        nlines = (stop - start - 1) // linewidth + 1
+        lastbases = stop - start - (nlines - 1) * linewidth
+        # All the line breaks must be at the multiples of linewidth
+        breaks = start + np.arange(1, nlines) * linewidth - 1
+        nbreaks = sum(
+            np.count_nonzero(data[i : min(i + chunksize, stop)] == 10)
+            for i in range(start, stop, chunksize)
+        )
+        if (
+            lastbases > linebases
+            or nbreaks != nlines - 1
+            or not (data[breaks] == 10).all()
+        ):
+            raise ValueError(
+                "Uneven line lengths in `{}` of `{}`".format(name, self.filename)
+            )
+        return (nlines - 1) * linebases + lastbases, linebases, linewidth
+
+    def __contains__(self, key):
+        return key in self.index
+
+    def __len__(self):
+        return len(self.index)
+
+    def __getitem__(self, key):
+        if key not in self.records:
+            self.records[key] = SeqRecord(
+                Seq(FastaSequenceData(self, key)),
+                id=key,
+                name=key,
+                description=self.description(key),
+            )
+        return self.records[key]
+
+    def keys(self):
+        return self.index.keys()
+
+    def size(self, key):
+        return self.index[key][0]
+
+    def description(self, key):
+        """
+        Returns the header line of the record, without the leading `>`.
+        """
+        offset = self.index[key][1]
+        header = self.mm.rfind(b">", 0, offset)
+        return self.mm[header + 1 : offset].rstrip(b"\r\n").decode()
+
+    def fetch_bytes(self, key, start=0, stop=None):
+        """
+        Returns the sequence at 0-based, half-open [start, stop) as bytes.
+        """
+        length, offset, linebases, linewidth = self.index[key]
+        stop = length if stop is None else stop
+        if start >= stop:
+            return b""
+        a = offset + start // linebases * linewidth + start % linebases
+        b = offset + (stop - 1) // linebases * linewidth + (stop - 1) % linebases
+        seq = self.mm[a : b + 1]
+        if linewidth > linebases:
+            seq = seq.replace(b"\n", b"").replace(b"\r", b"")
+        return seq
+
+    def fetch(self, key, start=0, stop=None):
+        """
+        Returns the sequence at 0-based, half-open [start, stop) as string.
+        """
+        return self.fetch_bytes(key, start, stop).decode()
+
+    def sequence(self, f, asstring=True):
+        """
+        Same as Fasta.sequence(), with the slice read from disk.
+        """
+        assert "chr" in f, "`chr` field required"
+        name = f["chr"]
+
+        assert name in self, "feature: %s not in `%s`" % (f, self.filename)
+
+        length = self.size(name)
+        start, stop = f.get("start"), f.get("stop")
+        start = start - 1 if start is not None else 0
+        stop = stop if stop is not None else length
+
+        if start < 0:
+            msg = "start ({0}) must > 0 of `{1}`. Reset to 1".format(start + 1, name)
+            logger.error(msg)
+            start = 0
+
+        if stop > length:
+            msg = "stop ({0}) must be <= length of `{1}` ({2}). Reset to {2}.".format(
+                stop, name, length
+            )
+            logger.error(msg)
+            stop = length
+
+        seq = self.fetch(name, start, stop)
+
+        if f.get("strand") in (-1, "-1", "-"):
+            seq = reverse_complement(seq)
+
+        return seq if asstring else Seq(seq)
+
+    def close(self):
+        self.mm.close()
+        self.fp.close()
+
+
+class FastaStats(object):
+    """
+    Base composition of one sequence, as computed by scan_fasta(). Bases are
+    counted regardless of case, `real` are the A, C, G, T bases and `nn` the
+    N's. `gaps` lists the runs of N's as 0-based, half-open (start, end).
+    """
+
+    __slots__ = ("name", "size", "real", "gc", "nn", "gaps")
+
+    def __init__(self, name, size, real=None, gc=None, nn=None, gaps=None):
+        self.name = name
+        self.size = size
+        self.real = real
+        self.gc = gc
+        self.nn = nn
+        self.gaps = gaps
+
+
+# Byte values for the counts of a 256-bin histogram
+REAL_BYTES = np.frombuffer(b"ACGTacgt", dtype=np.uint8)
+GC_BYTES = np.frombuffer(b"CGcg", dtype=np.uint8)
+N_BYTES = np.frombuffer(b"Nn", dtype=np.uint8)
+
+
+def scan_blocks(name, blocks, gaps=False):
+    """
+    Summarize a sequence given as blocks of bytes (NumPy uint8 arrays,
+    without line breaks), returns FastaStats.
+    """
+    counts = np.zeros(256, dtype=np.int64)
+    runs = [] if gaps else None
+    size = 0
+    for block in blocks:
+        counts += np.bincount(block, minlength=256)
+        if gaps:
+            edges = np.diff((block | 32) == ord("n"), prepend=False, append=False)
+            starts, ends = np.flatnonzero(edges).reshape(-1, 2).T + size
+            for start, end in zip(starts.tolist(), ends.tolist()):
+                if runs and runs[-1][1] == start:  # Gap spans two blocks
+                    start = runs.pop()[0]
+                runs.append((start, end))
+        size += len(block)
+    return FastaStats(
+        name,
+        size,
+        real=int(counts[REAL_BYTES].sum()),
+        gc=int(counts[GC_BYTES].sum()),
+        nn=int(counts[N_BYTES].sum()),
+        gaps=runs,
+    )
+
+
+def iter_index_blocks(fasta, key, blocksize=1 << 24):
+    """
+    Read a record of FastaIndex from the memory map in blocks of whole lines.
+    """
+    length, offset, linebases, linewidth = fasta.index[key]
+    if not length:
+        return
+    end = offset + (length - 1) // linebases * linewidth + (length - 1) % linebases
+    step = max(blocksize // linewidth, 1) * linewidth
+    for start in range(offset, end + 1, step):
+        block = np.frombuffer(
+            fasta.mm, dtype=np.uint8, count=min(step, end + 1 - start), offset=start
+        )
+        if linewidth > linebases:
+            block = block[(block != 10) & (block != 13)]
+        yield block
+
+
+def scan_record(fasta, key, bases=True, gaps=False):
+    """
+    Summarize a record of FastaIndex, only the size in the .fai is used unless
+    `bases` or `gaps` are asked for.
+    """
+    if not (bases or gaps):
+        return FastaStats(key, fasta.size(key))
+    return scan_blocks(key, iter_index_blocks(fasta, key), gaps=gaps)
+
+
+def scan_fasta(filename, bases=True, gaps=False):
+    """
+    Iterate over the sequences in the FASTA file in their order and yield
+    FastaStats. Files that cannot be indexed, e.g. compressed ones, are parsed
+    with SeqIO instead.
+    """
+    try:
+        fasta = FastaIndex(filename)
+    except (OSError, UnicodeDecodeError, ValueError) as e:
+        logger.debug("Cannot index `%s` (%s), parse all", filename, e)
+        for rec in SeqIO.parse(must_open(filename), "fasta"):
+            if not (bases or gaps):
+                yield FastaStats(rec.id, len(rec))
+                continue
+            block = np.frombuffer(bytes(rec.seq), dtype=np.uint8)
+            yield scan_blocks(rec.id, [block], gaps=gaps)
+        return
+
+    for key in fasta.keys():
+        yield scan_record(fasta, key, bases=bases, gaps=gaps)
+    fasta.close()
+
+
+def scan_job(job):
+    filename, key, bases, gaps = job
+    if key is None:
+        return list(scan_fasta(filename, bases=bases, gaps=gaps))
+    fasta = worker_data("scan")[filename]
+    return [scan_record(fasta, key, bases=bases, gaps=gaps)]
+
+
+def scan_fasta_files(filenames, bases=True, gaps=False, cpus=1):
+    """
+    Run scan_fasta() on a list of files, returns a list of FastaStats per file.
+    With multiple cpus, the records of the indexed files and the files that
+    need to be parsed are scanned in parallel.
+    """
+    indexes = {}  # FastaIndex of each file, each worker maps the files again
+    jobs, ids = [], []
+    for i, filename in enumerate(filenames):
+        try:
+            if filename not in indexes:  # Index each file once
+                indexes[filename] = FastaIndex(filename)
+            keys = list(indexes[filename].keys())
+        except (OSError, UnicodeDecodeError, ValueError):
+            keys = [None]
+        jobs += [(filename, key, bases, gaps) for key in keys]
+        ids += [i] * len(keys)
+
+    cpus = max(cpus, 1) if len(jobs) > 1 else 1
+    try:
+        with WorkerPool("scan", indexes, cpus=cpus) as pool:
+            chunksize = max(len(jobs) // cpus, 1)
+            results = pool.map(scan_job, jobs, chunksize=chunksize)
+    finally:
+        for fasta in indexes.values():
+            fasta.close()
+
+    stats = [[] for x in filenames]
+    for i, result in zip(ids, results):
+        stats[i] += result
+    return stats
+
+
 class ORFFinder(object):
     """
     Class derived from https://gist.github.com/933737
@@ -289,33 +708,23 @@ class SequenceInfo(object):
       N50                                4791
     """
 
-    def __init__(self, filename, gapstats=False):
+    def __init__(self, filename, gapstats=False, stats=None):
         from jcvi.utils.cbook import SummaryStats
         from jcvi.assembly.base import calculate_A50
 
-        f = Fasta(filename)
+        if stats is None:
+            stats = list(scan_fasta(filename, gaps=gapstats))
         self.filename = filename
         self.header = "File|#_seqs|#_reals|#_Ns|Total|Min|Max|N50".split("|")
         if gapstats:
             self.header += ["Gaps"]
-        self.nseqs = len(f)
-        sizes = []
-        gaps = []
-        na = nc = ng = nt = 0
-        for k, s in f.iteritems():
-            s = str(s.seq).upper()
-            sizes.append(len(s))
-            na += s.count("A")
-            nc += s.count("C")
-            ng += s.count("G")
-            nt += s.count("T")
-            if gapstats:
-                gaps += list(self.iter_gap_len(s))
-        self.real = real = na + nc + ng + nt
+        self.nseqs = len(stats)
+        sizes = [x.size for x in stats]
+        self.real = real = sum(x.real for x in stats)
         s = SummaryStats(sizes)
         self.sum = s.sum
         if gapstats:
-            self.gaps = len(gaps)
+            self.gaps = sum(len(list(self.iter_gap_len(x.gaps))) for x in stats)
         self.nn = self.sum - real
         a50, l50, nn50 = calculate_A50(sizes)
         self.min = s.min
@@ -336,13 +745,10 @@ class SequenceInfo(object):
             self.data += [self.gaps]
         assert len(self.header) == len(self.data)
 
-    def iter_gap_len(self, seq, mingap=10):
-        for gap, seq in groupby(seq, lambda x: x == "N"):
-            if not gap:
-                continue
-            gap_len = len(list(seq))
-            if gap_len >= mingap:
-                yield len(list(seq))
+    def iter_gap_len(self, gaps, mingap=10):
+        for start, end in gaps:
+            if end - start >= mingap:
+                yield end - start
 
 
 def rc(s):
@@ -572,6 +978,7 @@ def info(args):
     )
     p.set_table()
     p.set_outfile()
+    p.set_cpus(cpus=1)
     opts, args = p.parse_args(args)
 
     if len(args) == 0:
@@ -579,8 +986,9 @@ def info(args):
 
     fastafiles = args
     data = []
-    for f in fastafiles:
-        s = SequenceInfo(f, gapstats=opts.gaps)
+    stats = scan_fasta_files(fastafiles, gaps=opts.gaps, cpus=opts.cpus)
+    for f, fstats in zip(fastafiles, stats):
+        s = SequenceInfo(f, gapstats=opts.gaps, stats=fstats)
         data.append(s.data)
     write_csv(s.header, data, sep=opts.sep, filename=opts.outfile, align=opts.align)
 
@@ -1225,6 +1633,7 @@ def summary(args):
     )
     p.add_argument("--ids", help="write the ids that have >= 50% N's")
     p.set_outfile()
+    p.set_cpus(cpus=1)
 
     opts, args = p.parse_args(args)
 
@@ -1238,18 +1647,18 @@ def summary(args):
         nids = 0
 
     data = []
-    for fastafile in args:
-        for rec in SeqIO.parse(fastafile, "fasta"):
-            seqlen = len(rec)
-            nns = rec.seq.count("n") + rec.seq.count("N")
+    for fstats in scan_fasta_files(args, cpus=opts.cpus):
+        for s in fstats:
+            seqlen = s.size
+            nns = s.nn
             reals = seqlen - nns
             pct = reals * 100.0 / seqlen
             pctreal = "{0:.1f}%".format(pct)
             if idsfile and pct < 50:
                 nids += 1
-                print(rec.id, file=idsfile)
+                print(s.name, file=idsfile)
 
-            data.append((rec.id, reals, nns, seqlen, pctreal))
+            data.append((s.name, reals, nns, seqlen, pctreal))
 
     data.sort(key=natsort_key)
     ids, reals, nns, seqlen, pctreal = zip(*data)
@@ -2541,32 +2950,15 @@ def tidy(args):
     return tidyfastafile
 
 
-def write_gaps_worker(rec):
-    start = 0
-    seq = rec.seq.upper()
-    output = []
-    for gap, seq in groupby(seq, lambda x: x == "N"):
-        seq = "".join(seq)
-        current_length = len(seq)
-        object_beg = start + 1
-        object_end = start + current_length
-        if gap:
-            s = "\t".join(str(x) for x in (rec.id, object_beg - 1, object_end))
-            output.append(s)
-        start += current_length
-
-    return "\n".join(output)
-
-
 def write_gaps_bed(inputfasta, prefix, mingap, cpus):
-    from jcvi.apps.grid import WriteJobs
     from jcvi.formats.bed import sort
 
     bedfile = prefix + ".gaps.bed"
-    f = Fasta(inputfasta)
-    recs = list(rec for k, rec in f.iteritems())
-    pool = WriteJobs(write_gaps_worker, recs, bedfile, cpus=cpus)
-    pool.run()
+    (stats,) = scan_fasta_files([inputfasta], bases=False, gaps=True, cpus=cpus)
+    with open(bedfile, "w") as fw:
+        for s in stats:
+            for start, end in s.gaps:
+                print("\t".join(str(x) for x in (s.name, start, end)), file=fw)
 
     sort([bedfile, "-i"])
 
@@ -11,8 +11,9 @@ import json
 
 from itertools import islice
 
+import numpy as np
+
 from Bio import SeqIO
-from Bio.SeqIO.QualityIO import FastqGeneralIterator
 
 from ..apps.base import (
     ActionDispatcher,
@@ -30,6 +31,10 @@ from .fasta import must_open, rc
 
 
 qual_offset = lambda x: 33 if x == "sanger" else 64
+complement_table = np.arange(256, dtype=np.uint8)
+complement_table[np.frombuffer(b"ATCGatcg", dtype=np.uint8)] = np.frombuffer(
+    b"TAGCtagc", dtype=np.uint8
+)
 allowed_dialect_conversions = {
     ">=1.8": "<1.8",
     "sra": "<1.8",
@@ -79,6 +84,214 @@ class FastqRecord(object):
         return [ord(x) for x in self.qual]
 
 
+def ranges(starts, lengths):
+    """
+    Concatenated indices of the ranges `starts[i]:starts[i] + lengths[i]`.
+    """
+    offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    return np.repeat(starts - offsets[:-1], lengths) + np.arange(offsets[-1])
+
+
+class FastqBatch(object):
+    """
+    A batch of FASTQ records kept in uint8 arrays: the headers, sequences and
+    quality strings of all the records are concatenated in `headers`, `seq`
+    and `qual`. Record i is `seq[offsets[i]:offsets[i + 1]]`, with the same
+    slice in `qual` and `headers[header_offsets[i]:header_offsets[i + 1]]`.
+
+    Selecting, trimming the records and changing the quality offset are done
+    on the whole batch with numpy.
+    """
+
+    __slots__ = ("headers", "header_offsets", "seq", "qual", "offsets")
+
+    def __init__(self, headers, header_offsets, seq, qual, offsets):
+        self.headers = headers
+        self.header_offsets = header_offsets
+        self.seq = seq
+        self.qual = qual
+        self.offsets = offsets
+
+    @classmethod
+    def from_buffer(cls, buffer, lines, start=0):
+        """
+        Parse the records in the uint8 `buffer` starting at `start`, `lines`
+        are the positions of the newlines that end their lines (4 per record).
+        """
+        ends = lines.reshape(-1, 4)
+        starts = np.empty_like(ends)
+        starts.flat[0] = start
+        starts.flat[1:] = ends.flat[:-1] + 1
+        # Drop the carriage returns of DOS line endings
+        ends = ends - (buffer[np.maximum(ends - 1, 0)] == ord("\r"))
+        lengths = ends - starts
+        if not (buffer[starts[:, 0]] == ord("@")).all():
+            raise ValueError("FASTQ header does not start with `@`")
+
+        header_offsets = np.zeros(len(ends) + 1, dtype=np.int64)
+        np.cumsum(lengths[:, 0], out=header_offsets[1:])
+        offsets = np.zeros(len(ends) + 1, dtype=np.int64)
+        np.cumsum(lengths[:, 1], out=offsets[1:])
+        batch = cls(
+            buffer[ranges(starts[:, 0], lengths[:, 0])],
+            header_offsets,
+            buffer[ranges(starts[:, 1], lengths[:, 1])],
+            buffer[ranges(starts[:, 3], lengths[:, 3])],
+            offsets,
+        )
+        mismatch = np.flatnonzero(lengths[:, 1] != lengths[:, 3])
+        if len(mismatch):
+            raise ValueError(
+                "length mismatch: seq and qual of {0}".format(batch.names[mismatch[0]])
+            )
+        return batch
+
+    @classmethod
+    def concatenate(cls, batches):
+        def stack(offsets):
+            shifts = np.cumsum([0] + [x[-1] for x in offsets[:-1]])
+            return np.concatenate(
+                [offsets[0][:1]] + [x[1:] + s for x, s in zip(offsets, shifts)]
+            )
+
+        return cls(
+            np.concatenate([x.headers for x in batches]),
+            stack([x.header_offsets for x in batches]),
+            np.concatenate([x.seq for x in batches]),
+            np.concatenate([x.qual for x in batches]),
+            stack([x.offsets for x in batches]),
+        )
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    @property
+    def lengths(self):
+        return np.diff(self.offsets)
+
+    @property
+    def header_lines(self):
+        headers = self.headers.tobytes()
+        bounds = self.header_offsets.tolist()
+        return [headers[a:b].decode() for a, b in zip(bounds[:-1], bounds[1:])]
+
+    @property
+    def names(self):
+        """
+        First word of the headers, like FastqRecord.name.
+        """
+        return [x.split()[0] for x in self.header_lines]
+
+    def select(self, idx):
+        """
+        Returns a batch with the records `idx`, a boolean mask or indices.
+        """
+        idx = np.asarray(idx)
+        if idx.dtype == bool:
+            idx = np.flatnonzero(idx)
+        hstarts = self.header_offsets[idx]
+        hlengths = self.header_offsets[idx + 1] - hstarts
+        starts = self.offsets[idx]
+        lengths = self.offsets[idx + 1] - starts
+        header_offsets = np.zeros(len(idx) + 1, dtype=np.int64)
+        np.cumsum(hlengths, out=header_offsets[1:])
+        offsets = np.zeros(len(idx) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        bases = ranges(starts, lengths)
+        return FastqBatch(
+            self.headers[ranges(hstarts, hlengths)],
+            header_offsets,
+            self.seq[bases],
+            self.qual[bases],
+            offsets,
+        )
+
+    def slice(self, start=0, end=None):
+        """
+        Returns a batch with the bases `start:end` of each record, with the
+        same semantics as the str slice for positive `start` and `end`.
+        """
+        lengths = self.lengths
+        ends = lengths if end is None else np.minimum(lengths, end)
+        starts = np.minimum(ends, start)
+        offsets = np.zeros(len(self) + 1, dtype=np.int64)
+        np.cumsum(ends - starts, out=offsets[1:])
+        bases = ranges(self.offsets[:-1] + starts, ends - starts)
+        return FastqBatch(
+            self.headers,
+            self.header_offsets,
+            self.seq[bases],
+            self.qual[bases],
+            offsets,
+        )
+
+    def reverse_complement(self):
+        lengths = self.lengths
+        # Position i of a record is read from position length - 1 - i
+        bases = ranges(self.offsets[:-1], lengths)
+        bases = np.repeat(self.offsets[:-1] + self.offsets[1:] - 1, lengths) - bases
+        return FastqBatch(
+            self.headers,
+            self.header_offsets,
+            complement_table[self.seq[bases]],
+            self.qual[bases],
+            self.offsets,
+        )
+
+    def count(self, mask):
+        """
+        Number of bases in each record where the per-base `mask` is True,
+        e.g. `batch.count(batch.qual >= ord("5"))`.
+        """
+        counts = np.zeros(len(mask) + 1, dtype=np.int64)
+        np.cumsum(mask, out=counts[1:])
+        return counts[self.offsets[1:]] - counts[self.offsets[:-1]]
+
+    def high_quality(self, qvchar, pct=90):
+        """
+        Mask of the records with at least `pct`% of bases with quality >= qvchar,
+        like isHighQv().
+        """
+        highs = self.count(self.qual >= ord(qvchar))
+        return highs >= self.lengths * pct / 100
+
+    def shift_quality(self, offset, minqv="!", maxqv="~"):
+        """
+        Returns a batch with `offset` added to the quality characters, capped
+        to the range `minqv` to `maxqv`.
+        """
+        qual = self.qual.astype(np.int16) + offset
+        qual = np.clip(qual, ord(minqv), ord(maxqv)).astype(np.uint8)
+        return FastqBatch(
+            self.headers, self.header_offsets, self.seq, qual, self.offsets
+        )
+
+    def tobytes(self):
+        """
+        The records in FASTQ format, with `+` as the third line.
+        """
+        hlengths = np.diff(self.header_offsets)
+        lengths = self.lengths
+        # header\nseq\n+\nqual\n
+        sizes = hlengths + 2 * lengths + 5
+        starts = np.zeros(len(self) + 1, dtype=np.int64)
+        np.cumsum(sizes, out=starts[1:])
+        buffer = np.empty(starts[-1], dtype=np.uint8)
+        starts = starts[:-1]
+        buffer[ranges(starts, hlengths)] = self.headers
+        starts = starts + hlengths
+        buffer[starts] = ord("\n")
+        buffer[ranges(starts + 1, lengths)] = self.seq
+        starts = starts + lengths
+        buffer[starts + 1] = ord("\n")
+        buffer[starts + 2] = ord("+")
+        buffer[starts + 3] = ord("\n")
+        buffer[ranges(starts + 4, lengths)] = self.qual
+        buffer[starts + lengths + 4] = ord("\n")
+        return buffer.tobytes()
+
+
 class FastqHeader(object):
     def __init__(self, row):
         header = row.strip().split(" ")
@@ -246,6 +459,43 @@ def iter_fastq(filename, offset=0, key=None):
     yield None  # sentinel
 
 
+def iter_fastq_batches(filename, batchsize=10000, blocksize=1 << 22):
+    """
+    Iterate over the FASTQ file in FastqBatch of `batchsize` records (fewer in
+    the last batch), so that the batches of paired files stay in sync. The
+    file is read in binary blocks of `blocksize` bytes, and the records must
+    have 4 lines, as in iter_fastq().
+    """
+    if isinstance(filename, str):
+        logger.debug("Read file `{0}`".format(filename))
+        fh = must_open(filename, "rb")
+    else:
+        fh = filename
+
+    pending = b""
+    while True:
+        block = fh.read(blocksize)
+        buffer = np.frombuffer(pending + block, dtype=np.uint8)
+        lines = np.flatnonzero(buffer == ord("\n"))
+        if not block and len(buffer) and buffer[-1] != ord("\n"):
+            lines = np.append(lines, len(buffer))  # Last line without newline
+        nrecords = len(lines) // 4
+        if block:
+            nrecords -= nrecords % batchsize
+
+        start = 0
+        for i in range(0, nrecords, batchsize):
+            batch_lines = lines[4 * i : 4 * min(i + batchsize, nrecords)]
+            yield FastqBatch.from_buffer(buffer, batch_lines, start=start)
+            start = batch_lines[-1] + 1
+
+        if not block:
+            if buffer[start:].tobytes().strip():
+                raise ValueError("Truncated FASTQ record at the end of file")
+            break
+        pending = buffer[start:].tobytes()
+
+
 def main():
 
     actions = (
@@ -338,13 +588,10 @@ def calc_readlen(f, first):
     from jcvi.utils.cbook import SummaryStats
 
     L = []
-    ai = iter_fastq(f)
-    rec = next(ai)
-    while rec:
-        L.append(rec.length)
+    for batch in iter_fastq_batches(f):
+        L.extend(batch.lengths[: first + 1 - len(L)].tolist())
         if len(L) > first:
             break
-        rec = next(ai)
     s = SummaryStats(L)
 
     return s
@@ -536,21 +783,29 @@ def filter(args):
     qvchar = chr(offset + qv)
     logger.debug("Call base qv >= {0} as good.".format(qvchar))
     outfile = r1.rsplit(".", 1)[0] + ".q{0}.paired.fastq".format(qv)
-    fw = open(outfile, "w")
-
-    p1fp, p2fp = FastqPairedIterator(r1, r2)
-    while True:
-        a = list(islice(p1fp, 4))
-        if not a:
-            break
-
-        b = list(islice(p2fp, 4))
-        q1 = a[-1].rstrip()
-        q2 = b[-1].rstrip()
-
-        if isHighQv(q1, qvchar, pct=pct) and isHighQv(q2, qvchar, pct=pct):
-            fw.writelines(a)
-            fw.writelines(b)
+    fw = open(outfile, "wb")
+
+    if r1 == r2:
+        # Interleaved pairs, batches have an even number of reads
+        for batch in iter_fastq_batches(r1):
+            good = batch.high_quality(qvchar, pct=pct)
+            npairs = len(batch) // 2
+            good = good[0 : 2 * npairs : 2] & good[1 : 2 * npairs : 2]
+            fw.write(batch.select(np.repeat(good, 2)).tobytes())
+    else:
+        for a, b in zip(iter_fastq_batches(r1), iter_fastq_batches(r2)):
+            assert len(a) == len(b), "Reads in {0} and {1} are not paired".format(
+                r1, r2
+            )
+            good = np.flatnonzero(
+                a.high_quality(qvchar, pct=pct) & b.high_quality(qvchar, pct=pct)
+            )
+            # Reads of `b` follow those of `a` in the concatenated batch
+            ab = FastqBatch.concatenate((a, b))
+            fw.write(
+                ab.select(np.column_stack((good, good + len(a))).ravel()).tobytes()
+            )
+    fw.close()
 
 
 def checkShuffleSizes(p1, p2, pairsfastq, extra=0):
@@ -685,20 +940,17 @@ def guessoffset(args):
         sys.exit(not p.print_help())
 
     (fastqfile,) = args
-    ai = iter_fastq(fastqfile)
-    rec = next(ai)
     offset = 64
-    while rec:
-        quality = rec.quality
-        lowcounts = len([x for x in quality if x < 59])
-        highcounts = len([x for x in quality if x > 74])
+    for batch in iter_fastq_batches(fastqfile):
+        lowcounts = batch.count(batch.qual < 59)
+        highcounts = batch.count(batch.qual > 74)
         diff = highcounts - lowcounts
-        if diff > 10:
+        # The first read with a clear bias decides
+        decided = np.flatnonzero(np.abs(diff) > 10)
+        if len(decided):
+            if diff[decided[0]] < -10:
+                offset = 33
             break
-        elif diff < -10:
-            offset = 33
-            break
-        rec = next(ai)
 
     if offset == 33:
         print("Sanger encoding (offset=33)", file=sys.stderr)
@@ -892,26 +1144,26 @@ def splitread(args):
     base = op.basename(pairsfastq).split(".")[0]
     fq1 = base + ".1.fastq"
     fq2 = base + ".2.fastq"
-    fw1 = must_open(fq1, "w")
-    fw2 = must_open(fq2, "w")
+    fw1 = must_open(fq1, "wb")
+    fw2 = must_open(fq2, "wb")
 
-    fp = must_open(pairsfastq)
     n = opts.n
     minsize = n * 8 / 5
 
-    for name, seq, qual in FastqGeneralIterator(fp):
-        if len(seq) < minsize:
-            logger.error("Skipping read {0}, length={1}".format(name, len(seq)))
-            continue
+    for batch in iter_fastq_batches(pairsfastq):
+        short = batch.lengths < minsize
+        if short.any():
+            skipped = batch.select(short)
+            for name, length in zip(skipped.header_lines, skipped.lengths):
+                logger.error("Skipping read {0}, length={1}".format(name[1:], length))
+            batch = batch.select(~short)
 
-        name = "@" + name
-        rec1 = FastqLite(name, seq[:n], qual[:n])
-        rec2 = FastqLite(name, seq[n:], qual[n:])
+        read2 = batch.slice(n)
         if opts.rc:
-            rec2.rc()
+            read2 = read2.reverse_complement()
 
-        print(rec1, file=fw1)
-        print(rec2, file=fw2)
+        fw1.write(batch.slice(0, n).tobytes())
+        fw2.write(read2.tobytes())
 
     logger.debug("Reads split into `{0},{1}`".format(fq1, fq2))
     fw1.close()
@@ -933,11 +1185,9 @@ def size(args):
     total_size = total_numrecords = 0
     for f in args:
         cur_size = cur_numrecords = 0
-        for rec in iter_fastq(f):
-            if not rec:
-                break
-            cur_numrecords += 1
-            cur_size += len(rec)
+        for batch in iter_fastq_batches(f):
+            cur_numrecords += len(batch)
+            cur_size += int(batch.lengths.sum())
 
         print(" ".join(str(x) for x in (op.basename(f), cur_numrecords, cur_size)))
         total_numrecords += cur_numrecords
@@ -973,17 +1223,12 @@ def convert(args):
     if gz:
         outfastq += ".gz"
 
-    fin = "illumina" if phred == "64" else "sanger"
-    fout = "sanger" if phred == "64" else "illumina"
-
-    seqret = "seqret"
-    if infastq.endswith(".gz"):
-        cmd = "zcat {0} | ".format(infastq)
-        cmd += seqret + " fastq-{0}::stdin fastq-{1}::stdout".format(fin, fout)
-    else:
-        cmd = seqret + " fastq-{0}::{1} fastq-{2}::stdout".format(fin, infastq, fout)
-
-    sh(cmd, outfile=outfastq)
+    # Scores that do not fit the output encoding are capped, as seqret does
+    shift = int(ophred) - int(phred)
+    fw = must_open(outfastq, "wb")
+    for batch in iter_fastq_batches(infastq):
+        fw.write(batch.shift_quality(shift, minqv=chr(int(ophred))).tobytes())
+    fw.close()
 
     return outfastq
 
@@ -9,6 +9,8 @@ import sys
 from collections import defaultdict
 from urllib.parse import quote, unquote
 
+import numpy as np
+
 from ..annotation.reformat import atg_name
 from ..apps.base import (
     ActionDispatcher,
@@ -76,8 +78,31 @@ VALID_HUMAN_CHROMOSMES = set([str(x) for x in range(1, 23)] + ["X", "Y"])
 class GffLine(object):
     """
     Specification here (http://www.sequenceontology.org/gff3.shtml)
+
+    The attributes column is only parsed on the first access to `attributes`
+    (or to the properties that use it, e.g. `accn`), so that callers that only
+    need the coordinates do not pay for it.
     """
 
+    __slots__ = (
+        "seqid",
+        "source",
+        "type",
+        "start",
+        "end",
+        "score",
+        "strand",
+        "phase",
+        "attributes_text",
+        "_attributes",
+        "key",
+        "parent_key",
+        "gff3",
+        "keep_attr_order",
+        "idx",
+        "sign",
+    )
+
     def __init__(
         self,
         sline,
@@ -116,13 +141,12 @@ class GffLine(object):
             Valid_phases
         )
         self.attributes_text = "" if len(args) <= 8 else args[8].strip()
-        self.attributes = make_attributes(
-            self.attributes_text, gff3=gff3, keep_attr_order=keep_attr_order
-        )
+        self._attributes = None  # parsed on demand
         # key is not in the gff3 field, this indicates the conversion to accn
         self.key = key  # usually it's `ID=xxxxx;`
         self.parent_key = parent_key  # usually it's `Parent=xxxxx;`
         self.gff3 = gff3
+        self.keep_attr_order = keep_attr_order
 
         if append_ftype and self.key in self.attributes:
             # if `append_ftype` is True, append the gff `self.type`
@@ -168,6 +192,20 @@ class GffLine(object):
     def __getitem__(self, key):
         return getattr(self, key)
 
+    @property
+    def attributes(self):
+        if self._attributes is None:
+            self._attributes = make_attributes(
+                self.attributes_text,
+                gff3=self.gff3,
+                keep_attr_order=self.keep_attr_order,
+            )
+        return self._attributes
+
+    @attributes.setter
+    def attributes(self, attributes):
+        self._attributes = attributes
+
     def __str__(self):
         return "\t".join(
             str(x)
@@ -374,8 +412,17 @@ class Gff(LineFile):
         self.fp.seek(0)
 
     def __iter__(self):
+        return self.iter_lines()
+
+    def iter_lines(self, types=None):
+        """
+        Iterate over the GffLines. If `types` (a collection of feature types)
+        is given, the lines of other types are skipped before being parsed.
+        """
         if self.make_gff_store:
             for row in self.gffstore:
+                if types and row.type not in types:
+                    continue
                 yield row
         else:
             self.fp = must_open(self.filename)
@@ -387,6 +434,12 @@ class Gff(LineFile):
                     if row == FastaTag:
                         break
                     continue
+                if types:
+                    atoms = row.split("\t", 3)
+                    if len(atoms) < 4:
+                        atoms = row.split(None, 3)
+                    if len(atoms) < 3 or atoms[2] not in types:
+                        continue
                 yield GffLine(
                     row,
                     key=self.key,
@@ -444,6 +497,509 @@ class GffFeatureTracker(object):
         return self.symbolstore[parent]
 
 
+def tiebreak(order_by):
+    """
+    gffutils returns the children that are tied on `order_by` sorted by ID.
+    """
+    if not order_by:
+        return order_by
+    if isinstance(order_by, str):
+        order_by = [order_by]
+    return list(order_by) + ["id"]
+
+
+class FeatureNotFoundError(KeyError):
+    """
+    Raised by GffIndex when a feature ID is not in the index.
+    """
+
+
+class GffFeature(GffLine):
+    """
+    Feature returned by GffIndex, a GffLine with the aliases of gffutils.Feature
+    (chrom, stop, featuretype, frame, f["Parent"]) and an ID that is unique in
+    the index. When the attributes are changed, the line is printed with the
+    updated attributes. With `keep_order`, the attributes are printed in the
+    order of `attributes_order`, like gffutils does with the dialect order.
+    """
+
+    __slots__ = ("id", "keep_order", "attributes_order")
+
+    def __init__(self, sline, id, attributes_order=None):
+        super().__init__(sline, strict=False)
+        self.id = id
+        self.keep_order = False
+        self.attributes_order = attributes_order
+
+    def __getitem__(self, key):
+        if isinstance(key, int):
+            return str(self).split("\t")[key]
+        return self.attributes[key]
+
+    def __setitem__(self, key, value):
+        self.attributes[key] = value
+
+    def __len__(self):
+        return self.end - self.start + 1
+
+    def __eq__(self, other):
+        return str(self) == str(other)
+
+    def __hash__(self):
+        return hash(str(self))
+
+    def __str__(self):
+        if self.keep_order and self.attributes_order:
+            rank = dict((x, i) for i, x in enumerate(self.attributes_order))
+            for key in sorted(self.attributes, key=lambda x: rank.get(x, len(rank))):
+                self.attributes[key] = self.attributes.pop(key)
+        if self._attributes is not None:
+            attributes = make_attributes(
+                self.attributes_text,
+                gff3=self.gff3,
+                keep_attr_order=self.keep_attr_order,
+            )
+            if list(self._attributes.items()) != list(attributes.items()):
+                self.update_attributes(gff3=self.gff3)
+        return super().__str__()
+
+    def __repr__(self):
+        return "<GffFeature {0} ({1}:{2}-{3}[{4}])>".format(
+            self.type, self.seqid, self.start, self.end, self.strand
+        )
+
+    @property
+    def chrom(self):
+        return self.seqid
+
+    @chrom.setter
+    def chrom(self, seqid):
+        self.seqid = seqid
+
+    @property
+    def stop(self):
+        return self.end
+
+    @stop.setter
+    def stop(self, end):
+        self.end = end
+
+    @property
+    def featuretype(self):
+        return self.type
+
+    @featuretype.setter
+    def featuretype(self, type):
+        self.type = type
+
+    @property
+    def frame(self):
+        return self.phase
+
+    @frame.setter
+    def frame(self, phase):
+        self.phase = phase
+
+
+class GffIndex(object):
+    """
+    In-memory index of the features in a GFF3 file and of their Parent
+    relationships, built in one pass over the file and cached in a binary
+    `.index.npz` next to it. It implements the part of gffutils.FeatureDB that
+    is used in jcvi: features_of_type(), all_features(), children(), parents(),
+    children_bp(), region(), iter_by_parent_childs() and index[id].
+
+    Features are numbered in the file order and the coordinates are kept in
+    arrays, parents and children are looked up in CSR arrays, so the queries do
+    not touch the file. Only the features returned are read from the file.
+
+    IDs follow gffutils with merge_strategy="create_unique", i.e. the features
+    without ID are named `exon_1`, `exon_2`, ... and duplicated IDs become
+    `cds1_1`, `cds1_2`, ... Parents that are referred to but not defined in
+    the file can still be queried for their children. Level 2 relationships
+    are the grandchildren, level None returns both levels.
+
+    Without `order_by`, features are returned in the file order. gffutils
+    leaves that order to the SQLite query plan (e.g. the children at all
+    levels come in ID order, those at one level in the order they were
+    linked), so pass `order_by` where the order matters.
+
+    The file is opened when the first feature is read, call close() or use the
+    index as a context manager to release it.
+    """
+
+    # Bump when the arrays in the cache change, older caches are rebuilt
+    FORMAT_VERSION = 1
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.cachefile = filename + ".index.npz"
+        arrays = None
+        if not need_update(filename, self.cachefile, warn=False):
+            arrays = self.load_cache()
+        if arrays is None:
+            logger.debug("Indexing `%s`", filename)
+            arrays = self.build()
+            try:
+                np.savez(self.cachefile, **arrays)
+            except OSError as e:
+                logger.debug("Cannot write `%s` (%s)", self.cachefile, e)
+
+        self.offsets = arrays["offsets"]
+        self.seqid = arrays["seqid"]
+        self.type = arrays["type"]
+        self.start = arrays["start"]
+        self.end = arrays["end"]
+        self.strand = arrays["strand"]
+        self.seqids = arrays["seqids"].tobytes().decode().split("\n")
+        self.types = arrays["types"].tobytes().decode().split("\n")
+        self.ids = arrays["ids"].tobytes().decode().split("\n")
+        self.attributes_order = arrays["attributes_order"].tobytes().decode()
+        self.attributes_order = self.attributes_order.split("\n")
+        self.nfeatures = len(self.offsets)
+        self.id_index = dict((x, i) for i, x in enumerate(self.ids))
+        self.type_index = dict((x, i) for i, x in enumerate(self.types))
+
+        # Level 1 relationships as CSR arrays, in both directions
+        parent, child = arrays["parent"], arrays["child"]
+        nnodes = len(self.ids)
+        order = np.argsort(parent, kind="stable")
+        self.children_ptr = np.searchsorted(parent[order], np.arange(nnodes + 1))
+        self.children_idx = child[order]
+        order = np.argsort(child, kind="stable")
+        self.parents_ptr = np.searchsorted(child[order], np.arange(nnodes + 1))
+        self.parents_idx = parent[order]
+
+        self.order_keys = {}
+        self.bystart = None
+        self.fp = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self.fp is not None:
+            self.fp.close()
+            self.fp = None
+
+    def load_cache(self):
+        """
+        Returns the arrays in the cache, or None if it is from another version
+        of the index or cannot be read.
+        """
+        try:
+            with np.load(self.cachefile) as data:
+                arrays = dict(data)
+        except (OSError, ValueError) as e:
+            logger.debug("Cannot read `%s` (%s)", self.cachefile, e)
+            return None
+        version = arrays.get("version")
+        if version is None or int(version) != self.FORMAT_VERSION:
+            logger.debug("Outdated index `%s`", self.cachefile)
+            return None
+        logger.debug("Load index `%s`", self.cachefile)
+        return arrays
+
+    def build(self):
+        """
+        Read the GFF3 file once and return the arrays of the index.
+        """
+        offsets, seqid, type, start, end, strand = [], [], [], [], [], []
+        seqids, types, ids, attributes_order = {}, {}, {}, {}
+        autoincrements = defaultdict(int)
+        relations = []
+
+        def autoincrement(key):
+            autoincrements[key] += 1
+            return "{0}_{1}".format(key, autoincrements[key])
+
+        offset = 0
+        with open(self.filename, "rb") as fp:
+            for row in fp:
+                sline = row.decode().strip()
+                rowoffset, offset = offset, offset + len(row)
+                if not sline or sline[0] == "#":
+                    if sline == FastaTag:
+                        break
+                    continue
+                atoms = sline.split("\t")
+                if len(atoms) != 9:
+                    atoms = sline.split()
+                # Only ID and Parent are needed to build the hierarchy
+                id, parents = None, []
+                for keyval in ("" if len(atoms) <= 8 else atoms[8]).split(";"):
+                    keyval = keyval.strip()
+                    if keyval.startswith("ID="):
+                        id = unquote(keyval[3:].split(",")[0])
+                    elif keyval.startswith("Parent="):
+                        parents += [unquote(x) for x in keyval[7:].split(",")]
+                if id is None:
+                    id = autoincrement(atoms[2])
+                uid = id
+                while uid in ids:
+                    uid = autoincrement(id)
+                ids[uid] = i = len(ids)
+                for p in parents:
+                    relations.append((p, i))
+
+                if len(offsets) < 10:
+                    # gffutils infers the attribute order from the first lines
+                    for key in make_attributes(atoms[8] if len(atoms) > 8 else ""):
+                        attributes_order.setdefault(key)
+
+                offsets.append(rowoffset)
+                seqid.append(seqids.setdefault(atoms[0], len(seqids)))
+                type.append(types.setdefault(atoms[2], len(types)))
+                start.append(int(atoms[3]))
+                end.append(int(atoms[4]))
+                strand.append(ord(atoms[6]))
+
+        # Parents that are not features in the file are added after them
+        parent, child = [], []
+        for p, i in dict.fromkeys(relations):
+            if p not in ids:
+                ids[p] = len(ids)
+            parent.append(ids[p])
+            child.append(i)
+
+        def encode(names):
+            return np.frombuffer("\n".join(names).encode(), dtype=np.uint8)
+
+        return dict(
+            version=np.array(self.FORMAT_VERSION),
+            offsets=np.array(offsets, dtype=np.int64),
+            seqid=np.array(seqid, dtype=np.int32),
+            type=np.array(type, dtype=np.int32),
+            start=np.array(start, dtype=np.int64),
+            end=np.array(end, dtype=np.int64),
+            strand=np.array(strand, dtype=np.uint8),
+            seqids=encode(seqids),
+            types=encode(types),
+            ids=encode(ids),
+            attributes_order=encode(attributes_order),
+            parent=np.array(parent, dtype=np.int64),
+            child=np.array(child, dtype=np.int64),
+        )
+
+    def __len__(self):
+        return self.nfeatures
+
+    def __contains__(self, key):
+        return self.id_index.get(key, self.nfeatures) < self.nfeatures
+
+    def __getitem__(self, key):
+        if isinstance(key, GffLine):
+            key = key.id
+        i = self.id_index.get(key, self.nfeatures)
+        if i >= self.nfeatures:
+            raise FeatureNotFoundError(key)
+        return self.feature(i)
+
+    def feature(self, i):
+        if self.fp is None:
+            self.fp = open(self.filename, "rb")
+        self.fp.seek(self.offsets[i])
+        return GffFeature(
+            self.fp.readline().decode(), self.ids[i], self.attributes_order
+        )
+
+    def iter_features(self, idx):
+        for i in idx.tolist():
+            yield self.feature(i)
+
+    def order_key(self, key):
+        """
+        Returns an array to sort the features by the gffutils `order_by` key.
+        """
+        if key not in self.order_keys:
+            self.order_keys[key] = self.make_order_key(key)
+        return self.order_keys[key]
+
+    def make_order_key(self, key):
+        if key in ("seqid", "chrom"):
+            return np.argsort(np.argsort(self.seqids))[self.seqid]
+        if key == "featuretype":
+            return np.argsort(np.argsort(self.types))[self.type]
+        if key in ("start", "end", "strand"):
+            return getattr(self, key)
+        if key == "stop":
+            return self.end
+        if key == "length":
+            return self.end - self.start + 1
+        if key == "file_order":
+            return np.arange(self.nfeatures)
+        if key == "id":
+            return np.argsort(np.argsort(self.ids[: self.nfeatures]))
+        raise ValueError("Cannot order features by `{}`".format(key))
+
+    def select(self, idx, featuretype=None, strand=None, order_by=None, reverse=False):
+        """
+        Filter and sort the features in `idx` (in the file order by default).
+        """
+        if featuretype is not None:
+            if isinstance(featuretype, str):
+                featuretype = [featuretype]
+            codes = [self.type_index[x] for x in featuretype if x in self.type_index]
+            idx = idx[np.isin(self.type[idx], codes)]
+        if strand:
+            idx = idx[self.strand[idx] == ord(strand)]
+        if order_by:
+            if isinstance(order_by, str):
+                order_by = [order_by]
+            keys = [self.order_key(x)[idx] for x in reversed(order_by)]
+            idx = idx[np.lexsort(keys)]
+            if reverse:
+                idx = idx[::-1]
+        return idx
+
+    def features_of_type(self, featuretype, strand=None, order_by=None, reverse=False):
+        idx = self.select(
+            np.arange(self.nfeatures),
+            featuretype=featuretype,
+            strand=strand,
+            order_by=order_by,
+            reverse=reverse,
+        )
+        return self.iter_features(idx)
+
+    def all_features(self, strand=None, featuretype=None, order_by=None, reverse=False):
+        return self.features_of_type(
+            featuretype, strand=strand, order_by=order_by, reverse=reverse
+        )
+
+    def node(self, id):
+        if isinstance(id, GffLine):
+            id = id.id
+        return self.id_index.get(id)
+
+    def relatives(self, i, ptr, idx, level=None):
+        """
+        Returns the relatives of node `i` at level 1, 2 or both (level=None),
+        following the `ptr` and `idx` CSR arrays of level 1, in the file order.
+        """
+        if i is None:
+            return np.zeros(0, dtype=np.int64)
+        first = idx[ptr[i] : ptr[i + 1]]
+        if level == 1:
+            return np.unique(first)
+        second = [idx[ptr[j] : ptr[j + 1]] for j in first.tolist()]
+        second = np.concatenate(second) if second else first[:0]
+        return np.unique(second if level == 2 else np.concatenate((first, second)))
+
+    def children_idx_of(self, id, level=None, featuretype=None):
+        i = self.node(id)
+        if i is not None and i >= self.nfeatures and level != 1:
+            level = 1  # Parents not in the file have no grandchildren
+        idx = self.relatives(i, self.children_ptr, self.children_idx, level=level)
+        return self.select(idx, featuretype=featuretype)
+
+    def children(self, id, level=None, featuretype=None, order_by=None, reverse=False):
+        idx = self.children_idx_of(id, level=level, featuretype=featuretype)
+        idx = self.select(idx, order_by=tiebreak(order_by), reverse=reverse)
+        return self.iter_features(idx)
+
+    def parents(self, id, level=None, featuretype=None, order_by=None, reverse=False):
+        idx = self.relatives(
+            self.node(id), self.parents_ptr, self.parents_idx, level=level
+        )
+        idx = idx[idx < self.nfeatures]
+        idx = self.select(
+            idx, featuretype=featuretype, order_by=order_by, reverse=reverse
+        )
+        return self.iter_features(idx)
+
+    def children_bp(self, feature, child_featuretype="exon"):
+        """
+        Total bp of all children of a featuretype, e.g. the exonic bp of an mRNA.
+        """
+        idx = self.children_idx_of(feature, featuretype=child_featuretype)
+        return int((self.end[idx] - self.start[idx] + 1).sum())
+
+    def iter_by_parent_childs(self, featuretype="gene", level=None, order_by=None):
+        """
+        For each feature of `featuretype`, yield [feature] + its children.
+        """
+        for f in self.features_of_type(featuretype, order_by=order_by):
+            yield [f] + list(self.children(f.id, level=level, order_by=order_by))
+
+    def region(
+        self,
+        region=None,
+        seqid=None,
+        start=None,
+        end=None,
+        strand=None,
+        featuretype=None,
+        completely_within=False,
+    ):
+        """
+        Features overlapping, or completely within, the region given as
+        "seqid:start-end", (seqid, start, end), a feature (whose strand is also
+        used) or with the seqid, start and end arguments.
+        """
+        if isinstance(region, str):
+            seqid, _, coords = region.partition(":")
+            if coords:
+                start, end = coords.split("-")
+        elif isinstance(region, GffLine):
+            seqid, start, end = region.seqid, region.start, region.end
+            strand = region.strand
+        elif region is not None:
+            seqid, start, end = region[:3]
+        start = None if start is None else int(start)
+        end = None if end is None else int(end)
+
+        if self.bystart is None:
+            # Features sorted by seqid and start, with the longest feature span
+            # on each seqid to bound the overlap search
+            order = np.lexsort((self.start, self.seqid))
+            bounds = np.searchsorted(self.seqid[order], np.arange(len(self.seqids) + 1))
+            spans = self.end - self.start
+            maxspans = [
+                int(spans[order[a:b]].max()) if b > a else 0
+                for a, b in zip(bounds[:-1], bounds[1:])
+            ]
+            self.bystart = order, bounds, maxspans
+
+        order, bounds, maxspans = self.bystart
+        if seqid is None:
+            codes = range(len(self.seqids))
+        elif seqid in self.seqids:
+            codes = [self.seqids.index(seqid)]
+        else:
+            codes = []
+        idx = []
+        for code in codes:
+            a, b = bounds[code], bounds[code + 1]
+            starts = self.start[order[a:b]]
+            lo, hi = 0, b - a
+            if completely_within:
+                if start:
+                    lo = np.searchsorted(starts, start, side="left")
+                if end:
+                    hi = np.searchsorted(starts, end, side="right")
+                found = order[a + lo : a + hi]
+                if end:
+                    found = found[self.end[found] <= end]
+            else:
+                if start and end:
+                    lo = np.searchsorted(starts, start - maxspans[code], side="left")
+                    hi = np.searchsorted(starts, end, side="right")
+                elif end:
+                    hi = np.searchsorted(starts, end, side="left")
+                found = order[a + lo : a + hi]
+                if start:
+                    ends = self.end[found]
+                    found = found[ends >= start if end else ends > start]
+            idx.append(found)
+        idx = np.sort(np.concatenate(idx)) if idx else np.zeros(0, dtype=np.int64)
+        idx = self.select(idx, featuretype=featuretype, strand=strand)
+        return self.iter_features(idx)
+
+
 def make_attributes(s, gff3=True, keep_attr_order=True):
     """
     In GFF3, the last column is typically:
@@ -990,9 +1546,7 @@ def summary(args):
         if opts.isoform:
             pids = set()
             gff = Gff(gff_file)
-            for g in gff:
-                if g.type != "mRNA":
-                    continue
+            for g in gff.iter_lines(types={"mRNA"}):
                 if g.parent not in ids:
                     continue
                 if "longest" not in g.attributes:
@@ -3062,9 +3616,7 @@ def bed(args):
     skipped_identical_range = 0
     skipped_non_primary = 0
 
-    for g in gff:
-        if type and g.type not in type:
-            continue
+    for g in gff.iter_lines(types=type):
         if source and g.source not in source:
             continue
         if primary_only:
@@ -3112,10 +3664,30 @@ def bed(args):
         logger.debug("Skipped due to identical range: %d", skipped_identical_range)
 
 
+def is_gff3(gff_file):
+    """
+    Returns whether the first feature has GFF3 `key=value` attributes, same as
+    Gff.set_gff_type(), without reading the rest of the file.
+    """
+    with open(gff_file) as fp:
+        for row in fp:
+            row = row.strip()
+            if row == FastaTag:
+                break
+            if row and row[0] != "#":
+                return "=" in GffLine(row).attributes_text
+    return False
+
+
 def make_index(gff_file):
     """
-    Make a sqlite database for fast retrieval of features.
+    Make an index for fast retrieval of features and of their parents and
+    children. GFF3 files are indexed with GffIndex, other files (GTF, gzipped
+    files) are loaded into a gffutils sqlite database.
     """
+    if not gff_file.endswith(".gz") and is_gff3(gff_file):
+        return GffIndex(gff_file)
+
     import gffutils
 
     db_file = gff_file + ".db"
@@ -3132,9 +3704,7 @@ def make_index(gff_file):
 
 def get_parents(gff_file, parents):
     gff = Gff(gff_file)
-    for g in gff:
-        if g.type not in parents:
-            continue
+    for g in gff.iter_lines(types=parents):
         yield g
 
 
@@ -3323,7 +3893,10 @@ def load(args):
             if fparent:
                 try:
                     g_fparent = g[fparent]
-                except gffutils.exceptions.FeatureNotFoundError:
+                except (
+                    FeatureNotFoundError,
+                    gffutils.exceptions.FeatureNotFoundError,
+                ):
                     logger.error("%s not found in index .. skipped", fparent)
                     continue
                 if desc_attr in g_fparent.attributes:
@@ -6,6 +6,29 @@ Python implementation of BlastLine, an alternative Cython implementation is
 available in .cblast.BlastLine, which may be up to 2x faster
 """
 
+import numpy as np
+
+# Columns of parsed BLAST hits (see Blast.iter_chunks() and the binary cache),
+# query and subject are ids into a name table, coordinates are normalized as
+# in BlastLine
+BLAST_DTYPE = np.dtype(
+    [
+        ("query", "i4"),
+        ("subject", "i4"),
+        ("pctid", "f8"),
+        ("hitlen", "i4"),
+        ("nmismatch", "i4"),
+        ("ngaps", "i4"),
+        ("qstart", "i4"),
+        ("qstop", "i4"),
+        ("sstart", "i4"),
+        ("sstop", "i4"),
+        ("evalue", "f8"),
+        ("score", "f8"),
+        ("orientation", "i1"),
+    ]
+)
+
 
 class BlastLine(object):
     __slots__ = (
@@ -99,3 +122,102 @@ class BlastLine(object):
                 self.orientation,
             )
         )
+
+
+def iter_blast_fields(
+    names,
+    query,
+    subject,
+    pctid,
+    hitlen,
+    nmismatch,
+    ngaps,
+    qstart,
+    qstop,
+    sstart,
+    sstop,
+    evalue,
+    score,
+    orientation,
+):
+    """
+    Yield BlastLine from columns of parsed fields (e.g. the binary cache, see
+    jcvi.formats.blast.Blast.iter_cache()), `names` are UTF-8 encoded.
+    """
+    columns = (
+        query,
+        subject,
+        pctid,
+        hitlen,
+        nmismatch,
+        ngaps,
+        qstart,
+        qstop,
+        sstart,
+        sstop,
+        evalue,
+        score,
+        orientation,
+    )
+    for row in zip(*(x.tolist() for x in columns)):
+        b = BlastLine.__new__(BlastLine)
+        b.query = names[row[0]].decode("utf-8")
+        b.subject = names[row[1]].decode("utf-8")
+        b.pctid, b.hitlen, b.nmismatch, b.ngaps = row[2:6]
+        b.qstart, b.qstop, b.sstart, b.sstop = row[6:10]
+        b.evalue, b.score = row[10:12]
+        b.orientation = "-" if row[12] < 0 else "+"
+        yield b
+
+
+def iter_blast_chunks(fp, n=100000):
+    """
+    Yield (records, names) for every `n` hits in the BLAST file handle, same as
+    .cblast.Blast.iter_chunks().
+    """
+    names = []
+    ids = {}
+    chunk = []
+    for row in fp:
+        if row[0] in "#\n":
+            continue
+        args = row.split("\t")
+        qstart, qstop, sstart, sstop = [int(x) for x in args[6:10]]
+        orientation = 1
+        if qstart > qstop:
+            qstart, qstop = qstop, qstart
+            orientation = -1
+        if sstart > sstop:
+            sstart, sstop = sstop, sstart
+            orientation = -1
+        query, subject = args[:2]
+        qi = ids.get(query)
+        if qi is None:
+            qi = ids[query] = len(names)
+            names.append(query)
+        si = ids.get(subject)
+        if si is None:
+            si = ids[subject] = len(names)
+            names.append(subject)
+        chunk.append(
+            (
+                qi,
+                si,
+                float(args[2]),
+                int(args[3]),
+                int(args[4]),
+                int(args[5]),
+                qstart,
+                qstop,
+                sstart,
+                sstop,
+                float(args[10]),
+                float(args[11]),
+                orientation,
+            )
+        )
+        if len(chunk) >= n:
+            yield np.array(chunk, dtype=BLAST_DTYPE), names
+            chunk = []
+    if chunk:
+        yield np.array(chunk, dtype=BLAST_DTYPE), names
@@ -33,12 +33,13 @@ class Sizes(LineFile):
             sizesname = filename + ".sizes"
             filename = get_abs_path(filename)
             if need_update(filename, sizesname):
-                from jcvi.formats.fasta import Fasta
+                from jcvi.formats.fasta import scan_fasta
 
-                f = Fasta(filename)
+                # Sizes are read from an existing .fai or an index built in
+                # memory, without parsing the sequences
                 with open(sizesname, "w") as fw:
-                    for k, size in f.itersizes_ordered():
-                        print("\t".join((k, str(size))), file=fw)
+                    for s in scan_fasta(filename, bases=False):
+                        print("\t".join((s.name, str(s.size))), file=fw)
 
             filename = sizesname
 
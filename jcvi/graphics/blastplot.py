@@ -26,9 +26,10 @@ from ..formats.blast import BlastLine
 from ..formats.sizes import Sizes
 
 from .base import Rectangle, plt, savefig, set_human_base_axis
+from .dotplot import draw_raster
 
 
-DotStyles = ("line", "circle", "dot")
+DotStyles = ("line", "circle", "dot", "raster")
 
 
 def rename_seqid(seqid):
@@ -117,6 +118,8 @@ def blastplot(
             ax.plot(x, y, "mo", mfc="w", mec="m", ms=3)
         elif style == "dot":
             ax.scatter(x, y, s=3, lw=0)
+        elif style == "raster":
+            draw_raster(ax, x, y, xsize, ysize, color="C0")
 
     xlim = (0, xsize)
     ylim = (ysize, 0)  # invert the y-axis
@@ -256,7 +259,7 @@ if __name__ == "__main__":
         "--dotstyle",
         default="dot",
         choices=DotStyles,
-        help="Style of the dots",
+        help="Style of the dots, raster draws all hits as a density image",
     )
     p.add_argument(
         "--proportional",
@@ -32,7 +32,11 @@ import sys
 
 from copy import deepcopy
 from random import sample
-from typing import Optional
+from typing import Optional, Tuple
+
+import numpy as np
+
+from matplotlib.colors import Normalize, to_rgba, to_rgba_array
 
 from ..apps.base import OptionParser, logger, need_update
 from ..compara.base import AnchorFile
@@ -239,6 +243,166 @@ def downsample(data, sample_number: int = 10000):
     return data
 
 
+def density_raster(x, y, xsize, ysize, bins=(1000, 1000), weights=None):
+    """
+    Bin the points into a grid of bins=(nx, ny) cells spanning xsize and ysize.
+    Returns the counts as a (ny, nx) array, and the sums of each column of
+    weights as a (ny, nx, ncols) array if weights are given.
+    """
+    nx, ny = bins
+    xi = np.clip((np.asarray(x) * nx / xsize).astype(int), 0, nx - 1)
+    yi = np.clip((np.asarray(y) * ny / ysize).astype(int), 0, ny - 1)
+    cells = yi * nx + xi
+    counts = np.bincount(cells, minlength=nx * ny).reshape(ny, nx)
+    if weights is None:
+        return counts
+    sums = np.stack(
+        [np.bincount(cells, weights=w, minlength=nx * ny) for w in weights.T], axis=-1
+    )
+    return counts, sums.reshape(ny, nx, -1)
+
+
+def draw_raster(
+    ax,
+    x,
+    y,
+    xsize: int,
+    ysize: int,
+    c=None,
+    cmap="copper",
+    vmin: float = 0,
+    vmax: float = 1,
+    color: str = "k",
+    bins: Optional[Tuple[int, int]] = None,
+):
+    """
+    Draw all the points as a density raster with imshow(), which scales to
+    millions of points unlike scatter(). Each cell is colored by the mean of c
+    over its points, c being either values mapped through cmap or colors
+    (single color if c is None), and more opaque as the points get denser.
+    By default there is one cell per pixel of the axes.
+    """
+    if bins is None:
+        bbox = ax.get_window_extent()
+        bins = (max(int(bbox.width), 1), max(int(bbox.height), 1))
+    if c is None:
+        rgba = np.tile(to_rgba(color), (len(x), 1))
+    else:
+        c = np.asarray(c)
+        if c.dtype.kind in "biuf":
+            norm = Normalize(vmin=vmin, vmax=vmax, clip=True)
+            rgba = plt.get_cmap(cmap)(norm(c))
+        else:
+            colors, index = np.unique(c, return_inverse=True)
+            rgba = to_rgba_array(colors)[index]
+    counts, sums = density_raster(x, y, xsize, ysize, bins=bins, weights=rgba[:, :3])
+    image = np.zeros(counts.shape + (4,))
+    filled = counts > 0
+    image[filled, :3] = sums[filled] / counts[filled, None]
+    if filled.any():
+        density = np.log1p(counts[filled]) / np.log1p(counts.max())
+        image[filled, 3] = 0.4 + 0.6 * density
+    ax.imshow(
+        image,
+        extent=(0, xsize, 0, ysize),
+        origin="lower",
+        aspect="auto",
+        interpolation="nearest",
+    )
+
+
+def to_ranks(names, order):
+    """
+    Map the names to their ranks in the bed order, -1 if absent. Only the
+    distinct names are looked up.
+    """
+    if not len(names):
+        return np.zeros(0, dtype=int)
+    names, inverse = np.unique(names, return_inverse=True)
+    ranks = np.array(
+        [order[x][0] if x in order else -1 for x in names.tolist()], dtype=int
+    )
+    return ranks[inverse.ravel()]
+
+
+def to_values(values, default: float):
+    """
+    Convert the values to floats, those that are not numbers become default.
+    """
+    try:
+        return values.astype(float)
+    except ValueError:
+        pass
+
+    def to_float(x):
+        try:
+            return float(x)
+        except ValueError:
+            return default
+
+    return np.array([to_float(x) for x in values.tolist()], dtype=float)
+
+
+def read_anchors(
+    anchorfile: str,
+    qorder,
+    sorder,
+    vmin: float = 0,
+    vmax: float = 1,
+    is_self: bool = False,
+    cmap_text: Optional[str] = None,
+    palette: Optional[Palette] = None,
+):
+    """
+    Returns the query ranks, subject ranks and colors of the anchors as arrays.
+    The colors are the block colors from palette, otherwise the values in the
+    last column (capped within [vmin, vmax]) with cmap_text, or 0. The gene
+    names are looked up in bulk with to_ranks().
+    """
+    queries, subjects, values, block_ids = [], [], [], []
+    block_id = 0
+    with open(anchorfile, encoding="utf-8") as fp:
+        for row in fp:
+            if row[0] == "#":
+                block_id += 1
+                continue
+            atoms = row.split()
+            # first two columns are query and subject, and an optional third column
+            if len(atoms) < 2:
+                continue
+            queries.append(atoms[0])
+            subjects.append(atoms[1])
+            values.append(atoms[-1])
+            block_ids.append(block_id)
+
+    xs = to_ranks(np.array(queries), qorder)
+    ys = to_ranks(np.array(subjects), sorder)
+    keep = (xs >= 0) & (ys >= 0)
+    if cmap_text:
+        cs = to_values(np.array(values), vmax)
+        keep &= ~((cs < vmin) | (cs > vmax))
+    else:
+        cs = np.zeros(len(values), dtype=int)
+    xs, ys, cs = xs[keep], ys[keep], cs[keep]
+    block_ids = np.array(block_ids, dtype=int)[keep]
+
+    # Anchors before the first block header are black
+    block_ids, inverse = np.unique(block_ids, return_inverse=True)
+    block_colors = [
+        "k" if x == 0 else (palette.get(x, "k") if palette else None)
+        for x in block_ids.tolist()
+    ]
+    colored = np.array([x is not None for x in block_colors], dtype=bool)[inverse]
+    if colored.any():
+        colors = np.array([x or "" for x in block_colors])[inverse]
+        cs = colors if colored.all() else np.where(colored, colors, cs.astype(object))
+
+    if is_self:  # Mirror image
+        xs, ys = np.column_stack((xs, ys)).ravel(), np.column_stack((ys, xs)).ravel()
+        cs = np.repeat(cs, 2)
+    return xs, ys, cs
+
+
 def dotplot(
     anchorfile: str,
     qbed,
@@ -263,11 +427,13 @@ def dotplot(
     stdpf: bool = True,
     chpf: bool = True,
     usetex: bool = True,
+    raster: bool = False,
 ):
     """
-    Draw a dotplot from an anchor file.
+    Draw a dotplot from an anchor file. With raster, all the anchors are drawn
+    as a density raster, otherwise a random subset of sample_number anchors is
+    drawn as dots.
     """
-    fp = open(anchorfile, encoding="utf-8")
     # add genome names
     if genomenames:
         gx, gy = genomenames.split("_")
@@ -278,74 +444,62 @@ def dotplot(
     # Stylize the axis labels
     gx, gy = markup(gx), markup(gy)
 
-    qorder = qbed.order
-    sorder = sbed.order
-
-    data = []
     if cmap_text:
         logger.debug("Capping values within [%.1f, %.1f]", vmin, vmax)
 
-    block_id = 0
-    block_color = "k"
-    for row in fp:
-        atoms = row.split()
-        if row[0] == "#":
-            block_id += 1
-            block_color = palette.get(block_id, "k") if palette else None
-            continue
-
-        # first two columns are query and subject, and an optional third column
-        if len(atoms) < 2:
-            continue
-
-        query, subject = atoms[:2]
-        value = atoms[-1]
+    xs, ys, cs = read_anchors(
+        anchorfile,
+        qbed.order,
+        sbed.order,
+        vmin=vmin,
+        vmax=vmax,
+        is_self=is_self,
+        cmap_text=cmap_text,
+        palette=palette,
+    )
 
-        if cmap_text:
-            try:
-                value = float(value)
-            except ValueError:
-                value = vmax
+    npairs = len(xs)
+    xsize, ysize = len(qbed), len(sbed)
+    if raster:
+        logger.debug("Showing all %d data points as density raster", npairs)
+        draw_raster(
+            ax,
+            xs,
+            ys,
+            xsize,
+            ysize,
+            c=cs,
+            cmap=cmap,
+            vmin=vmin,
+            vmax=vmax,
+        )
+    else:
+        index = downsample(range(npairs), sample_number=sample_number)
+        xs, ys, cs = xs[index], ys[index], cs[index]
 
-            if value < vmin:
-                continue
-            if value > vmax:
-                continue
+        if palette:
+            ax.scatter(xs, ys, c=cs, edgecolors="none", s=2, lw=0)
         else:
-            value = 0
-
-        if query not in qorder:
-            continue
-        if subject not in sorder:
-            continue
-
-        qi, q = qorder[query]
-        si, s = sorder[subject]
-
-        nv = block_color or value
-        data.append((qi, si, nv))
-        if is_self:  # Mirror image
-            data.append((si, qi, nv))
-
-    npairs = len(data)
-    data = downsample(data, sample_number=sample_number)
-    x, y, c = zip(*data)
-
-    if palette:
-        ax.scatter(x, y, c=c, edgecolors="none", s=2, lw=0)
-    else:
-        ax.scatter(
-            x, y, c=c, edgecolors="none", s=2, lw=0, cmap=cmap, vmin=vmin, vmax=vmax
-        )
+            ax.scatter(
+                xs,
+                ys,
+                c=cs,
+                edgecolors="none",
+                s=2,
+                lw=0,
+                cmap=cmap,
+                vmin=vmin,
+                vmax=vmax,
+            )
 
     if synteny:
+        data = list(zip(xs.tolist(), ys.tolist(), cs.tolist()))
         clusters = batch_scan(data, qbed, sbed)
         draw_box(clusters, ax)
 
     if cmap_text:
         draw_cmap(root, cmap_text, vmin, vmax, cmap=cmap)
 
-    xsize, ysize = len(qbed), len(sbed)
     logger.debug("xsize=%d ysize=%d", xsize, ysize)
     qbreaks = qbed.get_breaks()
     sbreaks = sbed.get_breaks()
@@ -434,7 +588,7 @@ def dotplot_main(args):
         dest="sample_number",
         type=int,
         default=10000,
-        help="Maximum number of data points to plot",
+        help="Maximum number of data points to plot, unless --raster",
     )
     p.add_argument(
         "--minfont",
@@ -538,6 +692,7 @@ def dotplot_main(args):
         stdpf=(not opts.nostdpf),
         chpf=(not opts.nochpf),
         usetex=iopts.usetex,
+        raster=opts.raster,
     )
 
     image_name = opts.outfile or (op.splitext(anchorfile)[0] + "." + opts.format)
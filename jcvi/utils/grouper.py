@@ -6,6 +6,8 @@ Disjoint set data structure <http://code.activestate.com/recipes/387776/>
 Author: Michael Droettboom
 """
 
+import numpy as np
+
 
 class Grouper(object):
     """
@@ -90,10 +92,8 @@ class Grouper(object):
         return key in self._mapping
 
     def __len__(self):
-        group = set()
-        for v in self._mapping.values():
-            group.update([tuple(v)])
-        return len(group)
+        # members of the same set share the same list
+        return len(set(id(v) for v in self._mapping.values()))
 
     def __delitem__(self, key):
         group = self._mapping[key]
@@ -108,6 +108,157 @@ class Grouper(object):
         return self._mapping.keys()
 
 
+class IntGrouper(object):
+    """
+    Disjoint sets of non-negative integer keys (e.g. gene ranks), backed by
+    NumPy arrays with path compression and union by rank. Use .join_pairs()
+    to merge many pairs at once. Sets are listed by their smallest member,
+    members sorted.
+
+    >>> g = IntGrouper()
+    >>> g.join(1, 2)
+    >>> g.join_pairs([2, 5], [3, 6])
+    >>> list(g)
+    [[1, 2, 3], [5, 6]]
+    >>> g.joined(1, 3)
+    True
+    >>> g.joined(1, 5)
+    False
+    >>> 4 in g
+    False
+    >>> len(g), g.num_members
+    (2, 5)
+    """
+
+    def __init__(self, size=0):
+        self.parent = np.arange(size)
+        self.rank = np.zeros(size, dtype=np.int32)
+        self.member = np.zeros(size, dtype=bool)
+
+    def _grow(self, size):
+        n = len(self.parent)
+        if size <= n:
+            return
+        size = max(size, 2 * n)
+        self.parent = np.concatenate((self.parent, np.arange(n, size)))
+        self.rank = np.concatenate((self.rank, np.zeros(size - n, dtype=np.int32)))
+        self.member = np.concatenate((self.member, np.zeros(size - n, dtype=bool)))
+
+    def find(self, a):
+        """
+        Returns the representative of the set that a belongs, compressing the
+        path along the way.
+        """
+        parent = self.parent
+        root = a
+        while parent[root] != root:
+            root = parent[root]
+        while parent[a] != root:
+            parent[a], a = root, parent[a]
+        return int(root)
+
+    def _union(self, a, b):
+        ra, rb = self.find(a), self.find(b)
+        if ra == rb:
+            return
+        rank = self.rank
+        if rank[ra] < rank[rb]:
+            ra, rb = rb, ra
+        self.parent[rb] = ra
+        if rank[ra] == rank[rb]:
+            rank[ra] += 1
+
+    def join(self, a, *args):
+        """
+        Join given arguments into the same set. Accepts one or more arguments.
+        """
+        self._grow(max((a,) + args) + 1)
+        self.member[a] = True
+        for arg in args:
+            self.member[arg] = True
+            self._union(a, arg)
+
+    def _flatten(self):
+        # pointer jumping until every key points directly to its root
+        parent = self.parent
+        while True:
+            grandparent = parent[parent]
+            if (grandparent == parent).all():
+                break
+            parent = grandparent
+        self.parent = parent
+
+    def join_pairs(self, a, b):
+        """
+        Join a[i] and b[i] for all i. Roots are hooked onto the smallest root
+        they are linked to, then paths are flattened, until all pairs agree.
+        """
+        a = np.asarray(a, dtype=int)
+        b = np.asarray(b, dtype=int)
+        if not len(a):
+            return
+        self._grow(int(max(a.max(), b.max())) + 1)
+        self.member[a] = True
+        self.member[b] = True
+        while True:
+            self._flatten()
+            ra, rb = self.parent[a], self.parent[b]
+            diff = ra != rb
+            if not diff.any():
+                break
+            ra, rb = ra[diff], rb[diff]
+            np.minimum.at(self.parent, np.maximum(ra, rb), np.minimum(ra, rb))
+
+    def labels(self):
+        """
+        Returns the representative of every key, non-members are their own.
+        """
+        self._flatten()
+        return self.parent
+
+    def joined(self, a, b):
+        """
+        Returns True if a and b are members of the same set.
+        """
+        if a not in self or b not in self:
+            return False
+        return self.find(a) == self.find(b)
+
+    def __iter__(self):
+        """
+        Returns an iterator returning each of the disjoint sets as a list.
+        """
+        keys = np.flatnonzero(self.member)
+        labels = self.labels()[keys]
+        o = np.argsort(labels, kind="stable")
+        breaks = np.flatnonzero(np.diff(labels[o])) + 1
+        groups = np.split(keys[o], breaks) if len(keys) else []
+        for group in sorted(groups, key=lambda x: x[0]):
+            yield group.tolist()
+
+    def __getitem__(self, key):
+        """
+        Returns the set that a certain key belongs.
+        """
+        if key not in self:
+            raise KeyError(key)
+        keys = np.flatnonzero(self.member)
+        return tuple(keys[self.labels()[keys] == self.find(key)].tolist())
+
+    def __contains__(self, key):
+        return 0 <= key < len(self.member) and bool(self.member[key])
+
+    def __len__(self):
+        return len(np.unique(self.labels()[self.member]))
+
+    @property
+    def num_members(self):
+        return int(self.member.sum())
+
+    def keys(self):
+        return np.flatnonzero(self.member).tolist()
+
+
 if __name__ == "__main__":
     import doctest
 
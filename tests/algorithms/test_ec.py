@@ -31,3 +31,30 @@ def test_ec(input_array, expected):
 
     assert list(tour) == expected
     assert tour.fitness == creator.FitnessMax((200.0,))
+
+
+def test_ec_rescore():
+    from jcvi.algorithms.ec import (
+        GA_setup,
+        GA_run,
+        colinear_evaluate,
+        make_data,
+        mutation_parent,
+    )
+
+    scaffolds = make_data(200, 20)
+    evaluations = []
+
+    def drifting_evaluate(tour):
+        # Fitness updated from the parent gains a small error
+        parent = mutation_parent(tour)
+        evaluations.append(parent is None)
+        (score,) = colinear_evaluate(tour, scaffolds)
+        return (score + 0.001,) if parent else (score,)
+
+    toolbox = GA_setup(list(range(20))[::-1])
+    toolbox.register("evaluate", drifting_evaluate)
+    tour, fitness = GA_run(toolbox, ngen=40, npop=20)
+    assert fitness.values == colinear_evaluate(tour, scaffolds)
+    # The whole population is evaluated from scratch every 20 generations
+    assert evaluations.count(True) >= 20 * 2
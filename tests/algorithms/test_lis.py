@@ -46,3 +46,29 @@ def test_heaviest_increasing_subsequence(input_array, expected):
     from jcvi.algorithms.lis import heaviest_increasing_subsequence
 
     assert heaviest_increasing_subsequence(input_array) == expected
+
+
+@pytest.mark.parametrize(
+    "input_array,loose,decreasing,expected",
+    [
+        ([(1, 1), (1, 2), (2, 1)], False, False, ([(1, 2), (2, 1)], 3)),
+        ([(1, 1), (1, 2), (2, 1)], True, False, ([(1, 1), (1, 2), (2, 1)], 4)),
+        (
+            [(3, 3), (2, 2), (1, 1), (0, 5)],
+            False,
+            True,
+            ([(3, 3), (2, 2), (1, 1), (0, 5)], 11),
+        ),
+        ([(2, 1), (2, 1), (1, 3)], True, True, ([(2, 1), (2, 1), (1, 3)], 5)),
+        ([], False, False, ([], 0)),
+    ],
+)
+def test_heaviest_subsequence(input_array, loose, decreasing, expected):
+    from jcvi.algorithms.lis import heaviest_subsequence, heaviest_subsequence_weights
+
+    assert heaviest_subsequence(input_array, loose, decreasing) == expected
+    if input_array:
+        keys, weights = zip(*input_array)
+        assert list(
+            heaviest_subsequence_weights([keys], [weights], loose, decreasing)
+        ) == [expected[1]]
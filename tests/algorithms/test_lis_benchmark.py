@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+import time
+
+import numpy as np
+import pytest
+
+
+def make_series(n, seed=666):
+    rng = np.random.default_rng(seed)
+    keys = rng.integers(0, n, size=n).tolist()
+    weights = rng.integers(1, 20, size=n).tolist()
+    return list(zip(keys, weights))
+
+
+def quadratic_heaviest_increasing_subsequence(a):
+    """Previous implementation, scans all weights seen for every element"""
+    L = {0: -1}
+    bestsofar = [(0, -1)] * len(a)
+    for i, (key, weight) in enumerate(a):
+        for w, j in list(L.items()):
+            if j != -1 and a[j][0] >= key:
+                continue
+            new_weight = w + weight
+            if new_weight in L and a[L[new_weight]][0] <= key:
+                continue
+            L[new_weight] = i
+            newbest = (new_weight, j)
+            if newbest > bestsofar[i]:
+                bestsofar[i] = newbest
+
+    w, j = max(L.items())
+    tb = []
+    while j != -1:
+        tb.append(j)
+        w, j = bestsofar[j]
+    return [a[x] for x in reversed(tb)], max(L.items())[0]
+
+
+# Benchmark heaviest increasing subsequence, quadratic vs Fenwick tree
+@pytest.mark.benchmark(group="HIS", timer=time.time, disable_gc=True, warmup=False)
+def test_his_quadratic(benchmark):
+    from jcvi.algorithms.lis import heaviest_increasing_subsequence
+
+    a = make_series(10000)
+    result = benchmark(quadratic_heaviest_increasing_subsequence, a)
+    assert result == heaviest_increasing_subsequence(a)
+
+
+@pytest.mark.benchmark(group="HIS", timer=time.time, disable_gc=True, warmup=False)
+@pytest.mark.parametrize("n", [10000, 100000, 1000000])
+def test_his_fenwick(benchmark, n):
+    from jcvi.algorithms.lis import heaviest_increasing_subsequence
+
+    a = make_series(n)
+    lis, weight = benchmark.pedantic(
+        heaviest_increasing_subsequence, args=(a,), rounds=1, iterations=1
+    )
+    assert sum(w for k, w in lis) == weight
+
+
+@pytest.mark.benchmark(group="HIS", timer=time.time, disable_gc=True, warmup=False)
+def test_his_batch(benchmark):
+    from jcvi.algorithms.lis import (
+        heaviest_increasing_subsequence,
+        heaviest_subsequence_weights,
+    )
+
+    rng = np.random.default_rng(666)
+    keys = rng.integers(0, 100, size=(1000, 100))
+    weights = rng.integers(1, 20, size=(1000, 100))
+    result = benchmark(heaviest_subsequence_weights, keys, weights)
+    assert (
+        result[0] == heaviest_increasing_subsequence(list(zip(keys[0], weights[0])))[1]
+    )
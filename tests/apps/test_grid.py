@@ -0,0 +1,35 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+import pytest
+
+
+def add_offset(x):
+    from jcvi.apps.grid import worker_data
+
+    return x + worker_data("offset")["offset"]
+
+
+def double_offset(data):
+    return dict(offset=2 * data["offset"])
+
+
+@pytest.mark.parametrize("cpus", [1, 2])
+def test_worker_pool(cpus):
+    from jcvi.apps.grid import WORKER_DATA, WorkerPool
+
+    with WorkerPool("offset", dict(offset=10), cpus=cpus) as pool:
+        assert pool.map(add_offset, range(5)) == [10, 11, 12, 13, 14]
+        assert list(pool.imap(add_offset, range(3))) == [10, 11, 12]
+        assert pool.apply_async(add_offset, (5,)).get() == 15
+    assert "offset" not in WORKER_DATA
+
+    data = dict(offset=10)
+    with WorkerPool("offset", data, cpus=cpus, initializer=double_offset) as pool:
+        assert pool.map(add_offset, [1]) == [21]
+
+    # Workers are stopped when a task fails
+    with pytest.raises(KeyError):
+        with WorkerPool("other", {}, cpus=cpus) as pool:
+            pool.map(add_offset, range(5))
+    assert pool.pool is None
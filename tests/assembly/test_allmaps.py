@@ -56,3 +56,71 @@ def test_path():
     assert op.exists(output_image)
     os.chdir(cwd)
     cleanup(testdir)
+
+
+def test_path_partition_cpus(tmp_path):
+    import random
+
+    random.seed(666)
+    length, nscaffolds = 2000, 6
+    with open(tmp_path / "scaffolds.fasta", "w") as fa, open(
+        tmp_path / "maps.bed", "w"
+    ) as bed:
+        for lg in range(1, 4):
+            for i in range(nscaffolds):
+                seqid = "scaffold_{}_{}".format(lg, i)
+                print(">{}\n{}".format(seqid, "ACGT" * (length // 4)), file=fa)
+                for mapname in ("JMMale", "JMFemale"):
+                    for pos in sorted(random.sample(range(1, length), 5)):
+                        cm = (i * length + pos) * 100.0 / (nscaffolds * length)
+                        marker = "{}-{}:{:.6f}".format(mapname, lg, cm)
+                        print(
+                            "\t".join(
+                                str(x)
+                                for x in (seqid, pos - 1, pos, marker, f"{seqid}:{pos}")
+                            ),
+                            file=bed,
+                        )
+    with open(tmp_path / "weights.txt", "w") as fw:
+        print("JMMale 2\nJMFemale 1", file=fw)
+
+    cwd = os.getcwd()
+    os.chdir(tmp_path)
+    tours = []
+    for partition_cpus in (1, 2):
+        path(
+            [
+                "maps.bed",
+                "scaffolds.fasta",
+                "--noplot",
+                "--ngen=20",
+                "--npop=20",
+                "--cpus=1",
+                f"--partition_cpus={partition_cpus}",
+            ]
+        )
+        with open("maps.tour") as fp:
+            tours.append(fp.read())
+    os.chdir(cwd)
+    assert tours[0] == tours[1]
+    assert tours[0].count("FINAL") == 3
+
+
+def test_colinear_evaluate_compiled():
+    import numpy as np
+
+    from jcvi.assembly.allmaps import (
+        ColinearSeries,
+        colinear_evaluate_compiled,
+        colinear_evaluate_multi,
+        colinear_score_py,
+    )
+
+    scfs = [{0: [1, 2], 1: [5, 4, 3], 2: []}, {0: [3.5], 1: [], 2: [1.0, 2.0, 2.0]}]
+    weights = [2.0, 1.0]
+    series = ColinearSeries(scfs, 3)
+    for tour in ([0, 1, 2], [2, 1, 0], [1, 2, 0], [1], []):
+        expected = colinear_evaluate_multi(tour, scfs, weights)
+        assert colinear_evaluate_compiled(tour, series, np.array(weights)) == expected
+        markers, bounds = series.gather(tour)
+        assert (colinear_score_py(markers, bounds, weights),) == expected
@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+import array
+import random
+import time
+
+import numpy as np
+import pytest
+
+
+def make_scfs(nscaffolds=200, nmaps=4, seed=666):
+    """Marker series of scaffolds in a few maps, as from ScaffoldOO.prepare_ec()"""
+    random.seed(seed)
+    scfs = []
+    for _ in range(nmaps):
+        scf = {}
+        for i in range(nscaffolds):
+            n = random.randint(0, 30) if random.random() < 0.8 else 0
+            scf[i] = sorted(random.randint(i * 10, i * 10 + 40) for _ in range(n))
+        scfs.append(scf)
+    tours = [
+        array.array("i", random.sample(range(nscaffolds), nscaffolds))
+        for _ in range(100)
+    ]
+    return scfs, [2.0, 1.0, 1.0, 0.5], tours
+
+
+# Benchmark GA fitness of ALLMAPS, dict of marker lists vs precompiled arrays
+@pytest.mark.benchmark(
+    group="ALLMAPS fitness", timer=time.time, disable_gc=True, warmup=False
+)
+def test_colinear_evaluate_multi(benchmark):
+    from jcvi.assembly.allmaps import colinear_evaluate_multi
+
+    scfs, weights, tours = make_scfs()
+
+    @benchmark
+    def result():
+        return [colinear_evaluate_multi(x, scfs, weights) for x in tours]
+
+    assert len(result) == len(tours)
+
+
+@pytest.mark.benchmark(
+    group="ALLMAPS fitness", timer=time.time, disable_gc=True, warmup=False
+)
+def test_colinear_evaluate_compiled(benchmark):
+    from jcvi.assembly.allmaps import (
+        ColinearSeries,
+        colinear_evaluate_compiled,
+        colinear_evaluate_multi,
+    )
+
+    scfs, weights, tours = make_scfs()
+    series = ColinearSeries(scfs, 200)
+    ww = np.array(weights)
+
+    @benchmark
+    def result():
+        return [colinear_evaluate_compiled(x, series, ww) for x in tours]
+
+    assert result == [colinear_evaluate_multi(x, scfs, weights) for x in tours]
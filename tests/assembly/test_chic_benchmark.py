@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+import array
+import random
+import time
+
+import numpy as np
+import pytest
+
+
+def make_population(n=2000, npop=100, seed=666):
+    """One GA generation: mutants of an evaluated tour"""
+    from jcvi.algorithms.ec import GA_setup, genome_mutation
+    from jcvi.assembly.chic import score_evaluate_M
+
+    rng = np.random.default_rng(seed)
+    sizes = rng.integers(10000, 500000, size=n)
+    M = np.zeros((n, n), dtype=int)
+    for i in range(n):
+        for j in rng.choice(n, size=10, replace=False):
+            if i != j:
+                M[i, j] = M[j, i] = rng.integers(1, 100)
+
+    random.seed(seed)
+    toolbox = GA_setup(array.array("i", rng.permutation(n).tolist()))
+    population = []
+    for _ in range(npop):
+        ind = toolbox.individual()
+        ind.fitness.values = score_evaluate_M(ind, sizes, M)
+        (mutant,) = genome_mutation(toolbox.clone(ind))
+        population.append(mutant)
+    return sizes, M, population
+
+
+# Benchmark scoring one GA generation, full tour vs moved window
+@pytest.mark.benchmark(
+    group="GA generation", timer=time.time, disable_gc=True, warmup=False
+)
+def test_generation_full(benchmark):
+    from jcvi.assembly.chic import score_evaluate_M
+
+    sizes, M, population = make_population()
+
+    @benchmark
+    def result():
+        return [score_evaluate_M(x, sizes, M) for x in population]
+
+    assert len(result) == len(population)
+
+
+@pytest.mark.benchmark(
+    group="GA generation", timer=time.time, disable_gc=True, warmup=False
+)
+def test_generation_delta(benchmark):
+    from jcvi.assembly.chic import score_evaluate_M
+    from jcvi.assembly.hic import TourScorer, score_evaluate_M_shared
+
+    sizes, M, population = make_population()
+
+    with TourScorer(sizes, M):
+
+        @benchmark
+        def result():
+            return [score_evaluate_M_shared(x) for x in population]
+
+    expected = [score_evaluate_M(x, sizes, M) for x in population]
+    assert np.allclose(result, expected)
+
+
+def test_score_delta_M_delete():
+    from jcvi.assembly.chic import score_delta_M_delete, score_evaluate_M
+
+    sizes, M, population = make_population(n=100, npop=1)
+    (tour,) = population
+    (score,) = score_evaluate_M(tour, sizes, M)
+    deltas = score_delta_M_delete(tour, range(len(tour)), sizes, M)
+    expected = [
+        score - score_evaluate_M(tour[:i] + tour[i + 1 :], sizes, M)[0]
+        for i in range(len(tour))
+    ]
+    assert np.allclose(deltas, expected, rtol=1e-9, atol=1e-15)
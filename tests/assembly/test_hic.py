@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+import array
+import os.path as op
+import random
+
+import numpy as np
+import pytest
+
+
+@pytest.fixture
+def clmfile(tmp_path):
+    random.seed(1)
+    tigs = ["tig{:03d}".format(i) for i in range(40)]
+    with open(op.join(tmp_path, "test.ids"), "w") as fw:
+        for tig in tigs:
+            print(tig, tig, random.randint(20000, 300000), sep="\t", file=fw)
+    with open(op.join(tmp_path, "test.clm"), "w") as fw:
+        for i, at in enumerate(tigs):
+            for bt in random.sample(tigs[i + 1 :], min(len(tigs) - i - 1, 5)):
+                n = random.randint(1, 8)
+                for ao in "+-":
+                    for bo in "+-":
+                        dists = [random.randint(1000, 1000000) for _ in range(n)]
+                        dists = " ".join(str(x) for x in dists)
+                        print(f"{at}{ao} {bt}{bo}", n, dists, sep="\t", file=fw)
+    return op.join(tmp_path, "test.clm")
+
+
+def dense_matrices(clm):
+    """Build the matrices from the dicts, as reference"""
+    N, tig_to_idx, signs = clm.N, clm.tig_to_idx, clm.signs
+    M = np.zeros((N, N), dtype=int)
+    Q = np.ones((N, N, 12), dtype=int) * -1
+    for (at, bt), links in clm.contacts.items():
+        if at in tig_to_idx and bt in tig_to_idx:
+            ai, bi = tig_to_idx[at], tig_to_idx[bt]
+            M[ai, bi] = M[bi, ai] = links
+    for (at, bt), k in clm.contacts_oriented.items():
+        if at in tig_to_idx and bt in tig_to_idx:
+            ai, bi = tig_to_idx[at], tig_to_idx[bt]
+            Q[ai, bi] = k[(signs[ai], signs[bi])]
+    return M, Q
+
+
+def test_clm_matrices(clmfile):
+    from jcvi.assembly.hic import CLMFile
+
+    clm = CLMFile(clmfile)
+    clm.activate(minsize=0)
+    M, Q = dense_matrices(clm)
+    assert (clm.M == M).all()
+    assert (clm.Q == Q).all()
+    assert clm.M is clm.M  # cached
+
+    # Deactivate contigs, the rows and columns are removed
+    clm.active -= set(clm.active_contigs[::3])
+    M, Q = dense_matrices(clm)
+    assert (clm.M == M).all()
+    assert (clm.Q == Q).all()
+    assert (clm.O == clm.O.T).all()
+    assert clm.P.shape == (clm.N, clm.N, 2)
+
+    # Flip orientations, Q is updated
+    clm.signs[1] = -clm.signs[1]
+    clm.signs = -clm.signs
+    _, Q = dense_matrices(clm)
+    assert (clm.Q == Q).all()
+
+
+def test_score_evaluate_Q_csr(clmfile):
+    from jcvi.assembly.chic import score_evaluate_Q, score_evaluate_Q_csr
+    from jcvi.assembly.hic import CLMFile
+
+    clm = CLMFile(clmfile)
+    clm.activate(minsize=0)
+    rng = np.random.default_rng(1)
+
+    def check():
+        tour = array.array("i", rng.permutation(clm.N).tolist())
+        (score,) = score_evaluate_Q(tour, clm.active_sizes, clm.Q)
+        (sparse_score,) = score_evaluate_Q_csr(tour, clm.active_sizes, clm.Q_csr)
+        assert sparse_score == pytest.approx(score)
+
+    check()
+    # Cached until the orientations or the active contigs change
+    assert clm.Q_csr is clm.Q_csr
+    clm.signs[1] = -clm.signs[1]
+    check()
+    clm.signs = -clm.signs
+    check()
+    clm.active -= set(clm.active_contigs[:2])
+    check()
+
+
+@pytest.mark.parametrize("cpus", [1, 2])
+def test_tour_scorer(clmfile, cpus):
+    from jcvi.assembly.chic import score_evaluate_M
+    from jcvi.assembly.hic import CLMFile, TourScorer, score_evaluate_M_shared
+
+    clm = CLMFile(clmfile)
+    clm.activate(minsize=0)
+    rng = np.random.default_rng(1)
+    tours = [array.array("i", rng.permutation(clm.N).tolist()) for _ in range(5)]
+    expected = [score_evaluate_M(x, clm.active_sizes, clm.M) for x in tours]
+    with TourScorer(clm.active_sizes, clm.M, cpus) as scorer:
+        assert scorer.map(score_evaluate_M_shared, tours) == expected
+        assert scorer.evaluate(tours[0]) == expected[0]
+
+
+@pytest.mark.parametrize("cpus", [1, 2])
+def test_bam2mat(tmp_path, cpus):
+    pysam = pytest.importorskip("pysam")
+    from scipy.sparse import load_npz
+
+    from jcvi.assembly.hic import bam2mat
+
+    header = {
+        "HD": {"VN": "1.0", "SO": "coordinate"},
+        "SQ": [{"SN": "chr1", "LN": 20000}, {"SN": "chr2", "LN": 15000}],
+    }
+    # (chr, pos, mate chr, mate pos, flag, mapq)
+    pairs = [
+        (0, 100, 0, 5100, 0x41, 60),  # chr1 bins 0 and 5
+        (0, 200, 0, 250, 0x41, 60),  # Too close
+        (0, 1500, 1, 2500, 0x41, 60),  # chr1 bin 1 and chr2 bin 2
+        (0, 3000, 0, 3500, 0x41, 60),  # Same bin
+        (0, 4000, 0, 9000, 0x41, 0),  # Zero mapping quality
+        (0, 6000, 0, 100, 0x81, 60),  # read2
+        (0, 7000, 0, 100, 0x941, 60),  # Secondary and supplementary
+        (1, 14000, 0, 100, 0x41, 60),  # chr2 bin 14 and chr1 bin 0
+    ]
+    bamfile = str(tmp_path / "test.bam")
+    with pysam.AlignmentFile(bamfile, "wb", header=header) as fw:
+        for i, (tid, pos, mtid, mpos, flag, mapq) in enumerate(pairs):
+            s = pysam.AlignedSegment()
+            s.query_name = f"r{i}"
+            s.query_sequence = "A" * 50
+            s.flag = flag
+            s.reference_id, s.reference_start = tid, pos
+            s.next_reference_id, s.next_reference_start = mtid, mpos
+            s.mapping_quality = mapq
+            s.cigartuples = [(0, 50)]
+            fw.write(s)
+    pysam.index(bamfile)
+
+    bam2mat([bamfile, "--resolution=1000", f"--cpus={cpus}"])
+    A = np.load(str(tmp_path / "test.resolution_1000.npy"))
+    bam2mat([bamfile, "--resolution=1000", f"--cpus={cpus}", "--sparse"])
+    assert (load_npz(str(tmp_path / "test.resolution_1000.npz")).toarray() == A).all()
+
+    expected = np.zeros((37, 37), dtype=int)
+    for a, b in ((0, 5), (1, 23), (3, 3), (35, 0)):
+        expected[a, b] += 1
+        if a != b:
+            expected[b, a] += 1
+    assert (A == expected).all()
+    B = np.load(str(tmp_path / "test.resolution_1000.dist.npy"))
+    assert B.sum() == 2
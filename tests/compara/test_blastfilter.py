@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+import os.path as op
+
+import pytest
+
+import numpy as np
+
+
+def make_inputs(tmp_path, ngenes=300, nhits=3000, seed=666):
+    rng = np.random.default_rng(seed)
+    for sp in "ab":
+        with open(tmp_path / "{}.bed".format(sp), "w") as fw:
+            for i in range(ngenes):
+                start = (i % 100) * 1000
+                print(
+                    "{0}chr{1}\t{2}\t{3}\t{0}g{4}\t0\t+".format(
+                        sp, i // 100, start, start + 500, i
+                    ),
+                    file=fw,
+                )
+    blastfile = str(tmp_path / "a.b.last")
+    with open(blastfile, "w") as fw:
+        for _ in range(nhits):
+            q = int(rng.integers(0, ngenes))
+            s = q + int(rng.integers(-3, 4)) if rng.random() < 0.6 else q
+            s = min(ngenes - 1, max(0, s))
+            score = int(rng.integers(30, 100))  # lots of ties
+            evalue = 10.0 ** -int(rng.integers(3, 50))
+            print(
+                "ag{}\tbg{}\t90.00\t100\t5\t0\t1\t100\t1\t100\t{:.2g}\t{}".format(
+                    q, s, evalue, score
+                ),
+                file=fw,
+            )
+    return blastfile
+
+
+def test_sort_blast(tmp_path):
+    from jcvi.compara.blastfilter import sort_blast
+    from jcvi.formats.blast import Blast
+
+    blastfile = make_inputs(tmp_path)
+    expected = sorted(Blast(blastfile), key=lambda b: b.score, reverse=True)
+    observed = list(sort_blast(blastfile, chunksize=128, tmpdir=str(tmp_path)))
+    assert [str(x) for x in observed] == [str(x) for x in expected]
+
+
+@pytest.mark.parametrize(
+    "options", [["--cscore=.5"], ["--cscore=.7", "--tandem_Nmax=0"], ["--cscore=0"]]
+)
+def test_blastfilter_streaming(tmp_path, options):
+    from jcvi.compara.blastfilter import main
+
+    blastfile = make_inputs(tmp_path)
+    filteredfile = blastfile + ".filtered"
+    main([blastfile] + options)
+    expected = open(filteredfile).read()
+    main([blastfile, "--streaming", "--chunksize=100"] + options)
+    observed = open(filteredfile).read()
+    assert op.getsize(filteredfile) > 0
+    assert observed == expected
+
+
+def test_group_tandems_on_disk(tmp_path):
+    from jcvi.compara.blastfilter import TandemHits, group_tandems
+
+    rng = np.random.default_rng(666)
+    hits = [
+        (int(g), ("chr{}".format(int(c)), int(r)))
+        for g, c, r in rng.integers(0, (50, 3, 200), size=(2000, 3))
+    ]
+    ondisk = TandemHits(str(tmp_path), "hits", chunksize=128)
+    for hit in hits:
+        ondisk.append(hit)
+    assert len(ondisk.chunkfiles) == 15
+    expected = group_tandems(list(hits), tandem_Nmax=5)
+    observed = group_tandems(ondisk, tandem_Nmax=5, link_batch=10)
+    assert sorted(map(sorted, observed)) == sorted(map(sorted, expected))
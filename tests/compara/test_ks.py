@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+import os
+import os.path as op
+
+import numpy as np
+import pytest
+
+
+def fake_ks_pair(recs, work_dir, msa="clustalw", method="yn00"):
+    # Scratch file that would clash if workers shared a folder
+    scratch = op.join(work_dir, "nuc-subs.yn")
+    assert not op.exists(scratch)
+    with open(scratch, "w") as fw:
+        fw.write(recs[0].name)
+    os.remove(scratch)
+    if recs[0].name == "g3a":  # yn00 failure
+        return None
+    return "{},0.1,0.2,0.3,0.4".format(recs[0].name + ";" + recs[1].name)
+
+
+@pytest.mark.parametrize("cpus", [1, 2])
+def test_calc(tmp_path, monkeypatch, cpus: int):
+    import jcvi.compara.ks as ks
+
+    monkeypatch.setattr(ks, "ks_pair", fake_ks_pair)
+    pepfile = str(tmp_path / "pairs.pep")
+    cdsfile = str(tmp_path / "pairs.cds")
+    with open(pepfile, "w") as fw, open(cdsfile, "w") as fw2:
+        for i in range(10):
+            for s in "ab":
+                print(">g{}{}\nMK*".format(i, s), file=fw)
+                print(">g{}{}\nATGAAATAA".format(i, s), file=fw2)
+    ksfile = str(tmp_path / "pairs.ks")
+    expected = [ks.fields] + [
+        "g{0}a;g{0}b,0.1,0.2,0.3,0.4".format(i) for i in range(10) if i != 3
+    ]
+    workdir = str(tmp_path)
+    ks.calc([pepfile, cdsfile, "-o", ksfile, "--workdir", workdir, f"--cpus={cpus}"])
+    with open(ksfile) as fp:
+        assert fp.read().splitlines() == expected
+
+    # Interrupted run, with a partially written row
+    with open(ksfile, "w") as fw:
+        fw.write("\n".join(expected[:5]) + "\ng5a;g5")
+    assert ks.resume_pairs(ksfile) == {"g0a;g0b", "g1a;g1b", "g2a;g2b", "g4a;g4b"}
+    ks.calc(
+        [pepfile, cdsfile, "-o", ksfile, "--workdir", workdir, f"--cpus={cpus}"]
+        + ["--resume"]
+    )
+    with open(ksfile) as fp:
+        assert fp.read().splitlines() == expected
+    assert os.listdir(op.join(workdir, "syn_analysis")) == []
+
+
+def failing_ks_pair(recs, work_dir, msa="clustalw", method="yn00"):
+    if recs[0].name == "g5a":
+        raise ValueError("Cannot align `g5a`")
+    return fake_ks_pair(recs, work_dir, msa=msa, method=method)
+
+
+def test_calc_failed_pair(tmp_path, monkeypatch):
+    import jcvi.compara.ks as ks
+
+    monkeypatch.setattr(ks, "ks_pair", failing_ks_pair)
+    pepfile = str(tmp_path / "pairs.pep")
+    cdsfile = str(tmp_path / "pairs.cds")
+    with open(pepfile, "w") as fw, open(cdsfile, "w") as fw2:
+        for i in range(10):
+            for s in "ab":
+                print(">g{}{}\nMK*".format(i, s), file=fw)
+                print(">g{}{}\nATGAAATAA".format(i, s), file=fw2)
+    ksfile = str(tmp_path / "pairs.ks")
+    workdir = str(tmp_path)
+    with pytest.raises(ValueError):
+        ks.calc([pepfile, cdsfile, "-o", ksfile, "--workdir", workdir, "--cpus=2"])
+    # Workers are stopped and their scratch folders removed
+    assert os.listdir(op.join(workdir, "syn_analysis")) == []
+
+
+def test_ng86():
+    from jcvi.compara.ks import back_translate, codon_index, ng86, ng86_tables
+
+    sites, sd, nd, stop = ng86_tables()
+    assert stop.sum() == 3
+    aaa, tta, ctg, ttt = (codon_index(x)[0] for x in ("AAA", "TTA", "CTG", "TTT"))
+    assert sites[tta] == pytest.approx(2 / 3)  # Nei and Gojobori (1986)
+    assert (sd[tta, ctg], nd[tta, ctg]) == (2, 0)
+    assert (sd[tta, ttt], nd[tta, ttt]) == (0, 1)
+    assert codon_index("AAAN-Auuu").tolist() == [aaa, -1, ttt]
+
+    # 10 codons with one synonymous and one nonsynonymous difference
+    a = "CTG" * 8 + "CCC" + "GAA"
+    b = "CTG" * 8 + "CCG" + "GAC"
+    S = (8 * 4 / 3 + 1 + 1 / 3) * 2 / 2
+    N = 30 - S
+    ks, ka = ng86(a, b)
+    assert ks == pytest.approx(-0.75 * np.log(1 - 4 / 3 / S))
+    assert ka == pytest.approx(-0.75 * np.log(1 - 4 / 3 / N))
+    assert ng86(a, a) == (0, 0)
+    assert ng86("CCC", "CCG") == (-1, 0)  # Saturated
+    # Gaps and stop codons are skipped
+    assert ng86(a + "---TAA", b + "CCCTAG") == (ks, ka)
+
+    assert back_translate(["M-K", "MRK"], ["ATGAAA", "ATGCGTAAG"]) == [
+        "ATG---AAA",
+        "ATGCGTAAG",
+    ]
+    assert back_translate(["MK"], ["ATGAA"]) is None
+
+
+def test_ks_pair_ng86(tmp_path, monkeypatch):
+    from Bio.Seq import Seq
+    from Bio.SeqRecord import SeqRecord
+    import jcvi.compara.ks as ks
+
+    monkeypatch.setattr(
+        ks, "clustal_align_protein", lambda recs, work_dir: ">a\nMP-E\n>b\nMPLD\n"
+    )
+    recs = [
+        SeqRecord(Seq(x), id=name, name=name)
+        for name, x in (
+            ("a", "MPE"),
+            ("b", "MPLD"),
+            ("a", "ATGCCCGAA"),
+            ("b", "ATGCCGCTGGAC"),
+        )
+    ]
+    row = ks.ks_pair(recs, str(tmp_path), method="ng86")
+    ks_value, ka_value = ks.ng86("ATGCCC---GAA", "ATGCCGCTGGAC")
+    assert row == "a;b,,,{:.4f},{:.4f}".format(ks_value, ka_value)
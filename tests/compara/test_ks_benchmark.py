@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+
+import pytest
+import random
+import time
+
+
+def make_pairs(npairs=1000, ncodons=400, divergence=0.1, seed=666):
+    """
+    Synthetic codon-aligned CDS pairs, with point mutations avoiding stops.
+    """
+    from Bio.Data.CodonTable import standard_dna_table
+
+    codons = sorted(standard_dna_table.forward_table)
+    rng = random.Random(seed)
+    pairs = []
+    for _ in range(npairs):
+        a = [rng.choice(codons) for _ in range(ncodons)]
+        b = []
+        for codon in a:
+            while rng.random() < divergence:
+                k = rng.randrange(3)
+                mutant = codon[:k] + rng.choice("ACGT") + codon[k + 1 :]
+                if mutant in standard_dna_table.forward_table:
+                    codon = mutant
+            b.append(codon)
+        pairs.append(("".join(a), "".join(b)))
+    return pairs
+
+
+@pytest.mark.benchmark(group="NG86", timer=time.time, warmup=False)
+def test_ng86(benchmark):
+    from jcvi.compara.ks import ng86
+
+    pairs = make_pairs()
+
+    @benchmark
+    def result():
+        return [ng86(a, b) for a, b in pairs]
+
+    assert all(0 <= ks < 1 and 0 <= ka < 1 for ks, ka in result)
+
+
+@pytest.mark.benchmark(group="NG86", timer=time.time, warmup=False)
+def test_biopython_ng86(benchmark):
+    from Bio.codonalign.codonseq import CodonSeq, cal_dn_ds
+    from jcvi.compara.ks import ng86
+
+    pairs = make_pairs(npairs=20)
+
+    @benchmark
+    def result():
+        return [cal_dn_ds(CodonSeq(a), CodonSeq(b), method="NG86") for a, b in pairs]
+
+    # Biopython also counts pathways through stop codons
+    for (a, b), (dn, ds) in zip(pairs, result):
+        ks, ka = ng86(a, b)
+        assert ks == pytest.approx(ds, abs=0.01)
+        assert ka == pytest.approx(dn, abs=0.01)
+
+
+def test_ng86_yn00(tmp_path):
+    """
+    Accuracy against the NG86 values from yn00, when it is installed.
+    """
+    from jcvi.apps.base import which
+    from jcvi.compara.ks import find_synonymous, ng86
+
+    if not which("yn00"):
+        pytest.skip("yn00 not installed")
+
+    for i, (a, b) in enumerate(make_pairs(npairs=20)):
+        work_dir = tmp_path / str(i)
+        work_dir.mkdir()
+        nucfile = work_dir / "nuc-align.mrtrans"
+        nucfile.write_text(">a\n{}\n>b\n{}\n".format(a, b))
+        _, _, ds, dn = find_synonymous(str(nucfile), str(work_dir))
+        ks, ka = ng86(a, b)
+        assert ks == pytest.approx(float(ds), abs=0.002)
+        assert ka == pytest.approx(float(dn), abs=0.002)
@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+
+import pytest
+import time
+
+import numpy as np
+
+
+def synteny_scan_reference(points, xdist, ydist, N, is_self=False, intrabound=300):
+    """
+    The original point-by-point single linkage, kept as the reference.
+    """
+    from jcvi.compara.synteny import _score
+    from jcvi.utils.grouper import Grouper
+
+    clusters = Grouper()
+    n = len(points)
+    points.sort()
+    for i in range(n):
+        for j in range(i - 1, -1, -1):
+            del_x = points[i][0] - points[j][0]
+            if del_x > xdist:
+                break
+            del_y = points[i][1] - points[j][1]
+            if abs(del_y) > ydist:
+                continue
+            if is_self:
+                intradist = min(
+                    abs(points[i][0] - points[i][1]), abs(points[j][0] - points[j][1])
+                )
+                if intradist < intrabound:
+                    continue
+            clusters.join(points[i], points[j])
+
+    return [sorted(cluster) for cluster in list(clusters) if _score(cluster) >= N]
+
+
+def make_dotplot(nblocks=50, blocksize=40, noise=5000, size=20000, seed=666):
+    """
+    Synthetic dot-plot with diagonal and anti-diagonal blocks among noise.
+    """
+    rng = np.random.default_rng(seed)
+    points = set()
+    for _ in range(nblocks):
+        x0, y0 = rng.integers(0, size, 2)
+        slope = rng.choice((-1, 1))
+        for k in range(blocksize):
+            x = x0 + k + int(rng.integers(0, 3))
+            y = y0 + slope * k + int(rng.integers(0, 3))
+            points.add((int(x), int(y)))
+    for x, y in rng.integers(0, size, (noise, 2)):
+        points.add((int(x), int(y)))
+    return [(x, y, 50.0) for x, y in points]
+
+
+@pytest.mark.parametrize(
+    "xdist,N,is_self,duplicate",
+    [(20, 5, False, False), (5, 2, False, True), (20, 4, True, False)],
+)
+def test_synteny_scan(xdist, N, is_self, duplicate):
+    from jcvi.compara.synteny import synteny_scan
+
+    points = make_dotplot(nblocks=20, noise=2000, size=5000)
+    if duplicate:
+        points += points[:100]
+    expected = synteny_scan_reference(
+        list(points), xdist, xdist, N, is_self=is_self, intrabound=30
+    )
+    observed = synteny_scan(
+        list(points), xdist, xdist, N, is_self=is_self, intrabound=30
+    )
+    assert observed == expected
+
+
+def test_batch_scan_cpus():
+    from jcvi.compara.synteny import batch_scan
+
+    class Hit(object):
+        def __init__(self, qseqid, sseqid, qi, si):
+            self.qseqid, self.sseqid = qseqid, sseqid
+            self.qi, self.si, self.score = qi, si, 50.0
+
+    hits = []
+    for i, (x, y, score) in enumerate(make_dotplot(nblocks=20, noise=2000)):
+        hits.append(Hit("q{}".format(x % 3), "s{}".format(y % 2), x, y))
+    assert batch_scan(hits, cpus=1) == batch_scan(hits, cpus=2)
+
+
+# Benchmark array-based synteny_scan vs the point-by-point reference
+@pytest.mark.benchmark(
+    group="synteny_scan", timer=time.time, disable_gc=True, warmup=False
+)
+def test_synteny_scan_arrays(benchmark):
+    from jcvi.compara.synteny import synteny_scan
+
+    points = make_dotplot()
+
+    @benchmark
+    def result():
+        return synteny_scan(list(points), 20, 20, 5)
+
+    assert len(result) >= 40
+
+
+@pytest.mark.benchmark(
+    group="synteny_scan", timer=time.time, disable_gc=True, warmup=False
+)
+def test_synteny_scan_reference(benchmark):
+    points = make_dotplot()
+
+    @benchmark
+    def result():
+        return synteny_scan_reference(list(points), 20, 20, 5)
+
+    assert len(result) >= 40
@@ -22,7 +22,7 @@ import time
 import yaml
 
 from importlib import import_module
-from shutil import rmtree as rmdir_
+from shutil import copytree, rmtree as rmdir_
 from typing import Optional, Tuple
 
 # https://stackoverflow.com/questions/16571150/how-to-capture-stdout-output-from-a-python-function-call
@@ -117,11 +117,17 @@ def test_script(
 
     tmp_dir = tempfile.mkdtemp()
 
+    # Inputs are read from a copy, so that the indexes built next to them are
+    # not left in the test directory
+    input_dir = tmp_dir
+    if op.isdir(op.join(work_dir, "inputs")):
+        copytree(op.join(work_dir, "inputs"), op.join(input_dir, "inputs"))
+
     opts, args = "", ""
     if options:
-        opts = _fname_resolver(options, tmp_dir=tmp_dir, work_dir=work_dir)
+        opts = _fname_resolver(options, tmp_dir=tmp_dir, work_dir=input_dir)
     if arguments:
-        args = _fname_resolver(arguments, tmp_dir=tmp_dir, work_dir=work_dir)
+        args = _fname_resolver(arguments, tmp_dir=tmp_dir, work_dir=input_dir)
 
     stdout, stderr = op.join(tmp_dir, "stdout"), op.join(tmp_dir, "stderr")
 
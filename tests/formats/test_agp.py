@@ -32,3 +32,159 @@ def test_agp_validate(line: str, should_assert: bool):
             line.validate()
     else:
         line.validate()
+
+
+@pytest.mark.parametrize("cpus", [1, 2])
+def test_build(tmp_path, cpus: int):
+    from jcvi.formats.agp import build
+
+    componentfasta = str(tmp_path / "components.fasta")
+    with open(componentfasta, "w") as fw:
+        fw.write(">ctg1\nAACCG\nGTT\n>ctg2\nACGT\n")
+    agpfile = str(tmp_path / "test.agp")
+    with open(agpfile, "w") as fw:
+        print("chr1\t1\t4\t1\tW\tctg1\t2\t5\t+", file=fw)
+        print("chr1\t5\t7\t2\tU\t3\tscaffold\tyes\tmap", file=fw)
+        print("chr1\t8\t11\t3\tW\tctg2\t1\t4\t-", file=fw)
+        print("chr2\t1\t8\t1\tW\tctg1\t1\t8\t-", file=fw)
+    targetfasta = str(tmp_path / "test.fasta")
+    build([agpfile, componentfasta, targetfasta, f"--cpus={cpus}"])
+    with open(targetfasta) as fp:
+        assert fp.read() == ">chr1\nACCGNNNACGT\n>chr2\nAACCGGTT\n"
+
+
+def test_build_many_objects(tmp_path):
+    from jcvi.formats.agp import build
+
+    componentfasta = str(tmp_path / "components.fasta")
+    with open(componentfasta, "w") as fw:
+        fw.write(">ctg1\nAACCGGTT\n>ctg2\nACGT\n")
+    agpfile = str(tmp_path / "test.agp")
+    with open(agpfile, "w") as fw:
+        for i in range(12):
+            print(f"chr{i}\t1\t4\t1\tW\tctg{i % 2 + 1}\t1\t4\t+", file=fw)
+    outputs = []
+    for cpus in (1, 2):
+        targetfasta = str(tmp_path / f"test{cpus}.fasta")
+        build([agpfile, componentfasta, targetfasta, f"--cpus={cpus}"])
+        with open(targetfasta) as fp:
+            outputs.append(fp.read())
+    assert outputs[0] == outputs[1]
+    assert outputs[0].count(">") == 12
+
+
+def write_edit_agp(agpfile: str, ncomponents: int = 8):
+    with open(agpfile, "w") as fw:
+        beg = 1
+        for i in range(ncomponents):
+            if i:
+                print(
+                    f"chr1\t{beg}\t{beg + 9}\t{2 * i}\tU\t10\tcontig\tyes\tmap", file=fw
+                )
+                beg += 10
+            print(f"chr1\t{beg}\t{beg + 99}\t{2 * i + 1}\tW\tc{i}\t1\t100\t+", file=fw)
+            beg += 100
+
+
+@pytest.mark.parametrize("batch", [False, True])
+def test_agp_edits(tmp_path, batch: bool):
+    from contextlib import nullcontext
+    from jcvi.formats.agp import AGP, AGPLine
+
+    agpfile = str(tmp_path / "edit.agp")
+    write_edit_agp(agpfile)
+    agp = AGP(agpfile)
+    new = AGPLine("chr1\t1\t50\t1\tW\tn1\t1\t50\t-")
+    with agp.batch_edits() if batch else nullcontext():
+        agp.delete_line("c1")
+        agp.insert_lines("c3", [new], after=True)
+        agp.switch_between("c0", "c7", verbose=False)
+        agp.convert_to_gap("c5")
+        agp.delete_between("c3", "c6", verbose=False)
+        assert agp.insert_lines("c2", [new], delete=True) == {"n1"}
+    assert ["-" if x.is_gap else x.component_id for x in agp] == [
+        "c7",
+        "-",
+        "-",
+        "n1",
+        "c2",
+        "-",
+        "c3",
+        "c6",
+        "-",
+        "c0",
+    ]
+    assert agp.get_line("n1") == (3, new)
+    assert agp.get_line("c5") == (None, None)
+
+
+@pytest.mark.parametrize("batch", [False, True])
+def test_agp_edits_repeated_component(tmp_path, batch: bool):
+    from contextlib import nullcontext
+    from jcvi.formats.agp import AGP, AGPLine
+
+    agpfile = str(tmp_path / "edit.agp")
+    with open(agpfile, "w") as fw:
+        print("chr1\t1\t50\t1\tW\tc0\t1\t50\t+", file=fw)
+        print("chr1\t51\t150\t2\tW\tc1\t1\t100\t+", file=fw)
+        print("chr1\t151\t200\t3\tW\tc0\t51\t100\t+", file=fw)
+    agp = AGP(agpfile)
+    first, _, second = agp
+    assert agp.get_line("c0") == (0, first)
+    with agp.batch_edits() if batch else nullcontext():
+        agp.delete_line("c0")
+        assert agp.get_line("c0")[1] is second
+        agp.delete_line("c0")
+        assert agp.get_line("c0") == (None, None)
+    assert [x.component_id for x in agp] == ["c1"]
+
+    # The first line in AGP order is found, also after inserting lines
+    agp = AGP(agpfile)
+    new = AGPLine("chr1\t1\t50\t1\tW\tc0\t101\t150\t-")
+    with agp.batch_edits() if batch else nullcontext():
+        agp.insert_lines("c1", [new], after=True)
+        agp.delete_line("c0")
+        agp.insert_lines("c1", [first])
+        assert agp.get_line("c0")[1] is first
+        agp.delete_line("c0")
+        assert agp.get_line("c0")[1] is new
+    assert [x.component_id for x in agp] == ["c1", "c0", "c0"]
+
+
+def test_agp_batch_edits_repeated_component(tmp_path):
+    from jcvi.formats.agp import AGP, AGPLine
+
+    agpfile = str(tmp_path / "edit.agp")
+    with open(agpfile, "w") as fw:
+        print("chr1\t1\t50\t1\tW\tc0\t1\t50\t+", file=fw)
+        print("chr1\t51\t150\t2\tW\tc1\t1\t100\t+", file=fw)
+        print("chr1\t151\t200\t3\tW\tc0\t51\t100\t+", file=fw)
+        print("chr1\t201\t300\t4\tW\tc2\t1\t100\t+", file=fw)
+
+    def edit(agp):
+        new = AGPLine("chr1\t1\t50\t1\tW\tc0\t101\t150\t-")
+        agp.switch_between("c0", "c2", verbose=False)
+        agp.insert_lines("c1", [new])
+        agp.convert_to_gap("c0")
+        agp.switch_between("c0", "c1", verbose=False)
+        agp.delete_line("c0")
+
+    agp = AGP(agpfile)
+    edit(agp)
+    with AGP(agpfile).batch_edits() as batch_agp:
+        edit(batch_agp)
+    assert [str(x) for x in batch_agp] == [str(x) for x in agp]
+
+
+def test_agp_edit_index_invalidated(tmp_path):
+    from jcvi.formats.agp import AGP, AGPLine
+
+    agpfile = str(tmp_path / "edit.agp")
+    write_edit_agp(agpfile)
+    agp = AGP(agpfile)
+    assert agp.get_line("c0")[0] == 0
+    line = AGPLine("chr1\t101\t110\t2\tW\tc9\t1\t10\t+")
+    agp[1] = line
+    assert agp.get_line("c9") == (1, line)
+    agp.reverse()
+    assert agp.get_line("c0") == (len(agp) - 1, agp[-1])
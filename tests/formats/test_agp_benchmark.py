@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+
+import pytest
+import random
+import time
+
+NCOMPONENTS = 100000
+NEDITS = 100000
+
+
+@pytest.fixture(scope="module")
+def chromosome_agp(tmp_path_factory):
+    # One chromosome-scale object with 100k components separated by gaps
+    agpfile = str(tmp_path_factory.mktemp("agp") / "chr1.agp")
+    with open(agpfile, "w") as fw:
+        beg = 1
+        for i in range(NCOMPONENTS):
+            if i:
+                print(
+                    f"chr1\t{beg}\t{beg + 99}\t{2 * i}\tU\t100\tcontig\tyes\tmap",
+                    file=fw,
+                )
+                beg += 100
+            print(
+                f"chr1\t{beg}\t{beg + 999}\t{2 * i + 1}\tW\tc{i}\t1\t1000\t+", file=fw
+            )
+            beg += 1000
+    return agpfile
+
+
+def random_edits(agp):
+    # Switch 25k pairs, convert 25k components to gaps and delete 25k more
+    rng = random.Random(42)
+    cids = [f"c{i}" for i in range(NCOMPONENTS)]
+    rng.shuffle(cids)
+    switched, converted, deleted = cids[:50000], cids[50000:75000], cids[75000:]
+    for a, b in zip(switched[::2], switched[1::2]):
+        agp.switch_between(a, b, verbose=False)
+    for cid in converted:
+        agp.convert_to_gap(cid)
+    for cid in deleted:
+        agp.delete_line(cid)
+
+
+@pytest.mark.benchmark(group="AGP edits", timer=time.time, warmup=False)
+def test_agp_batch_edits(benchmark, chromosome_agp):
+    from jcvi.formats.agp import AGP
+
+    def edit(agp):
+        with agp.batch_edits():
+            random_edits(agp)
+        return agp
+
+    result = benchmark.pedantic(
+        edit, setup=lambda: ((AGP(chromosome_agp),), {}), rounds=3
+    )
+    assert len(result) == 2 * NCOMPONENTS - 1 - 25000
+    assert sum(not x.is_gap for x in result) == NCOMPONENTS - 50000
+
+
+@pytest.mark.benchmark(group="AGP edits", timer=time.time, warmup=False)
+def test_agp_sweep_edits(benchmark, chromosome_agp):
+    from jcvi.formats.agp import AGP, AGPLine
+
+    def edit(agp):
+        # Edits along the chromosome only refresh positions up to the next edit
+        for i in range(0, NCOMPONENTS - 1, 2):
+            agp.insert_lines(f"c{i}", [AGPLine.gline("chr1", 100)], after=True)
+            agp.delete_line(f"c{i + 1}")
+        return agp
+
+    result = benchmark.pedantic(
+        edit, setup=lambda: ((AGP(chromosome_agp),), {}), rounds=3
+    )
+    assert len(result) == 2 * NCOMPONENTS - 1
@@ -0,0 +1,147 @@
+import pytest
+
+from jcvi.formats.bed import (
+    Bed,
+    bed_complement,
+    bed_coverage,
+    bed_depth,
+    bed_intersect,
+    bed_intersect_wao,
+    bed_merge,
+)
+
+A_ROWS = [
+    ("chr1", 0, 10, "a1", 1, "+"),
+    ("chr1", 5, 20, "a2", 3, "+"),
+    ("chr1", 20, 25, "a3", 5, "-"),
+    ("chr1", 30, 40, "a4", 2, "+"),
+    ("chr2", 0, 5, "a5", 1, "+"),
+]
+B_ROWS = [("chr1", 8, 32, "b1"), ("chr1", 35, 36, "b2"), ("chr3", 0, 3, "b3")]
+SIZES = {"chr1": 50, "chr2": 5, "chr3": 7}
+
+
+def make_bed(rows):
+    bed = Bed()
+    for row in rows:
+        bed.add("\t".join(str(x) for x in row))
+    return bed
+
+
+def to_rows(bed):
+    return [str(b) for b in bed]
+
+
+@pytest.mark.parametrize(
+    "kwargs,expected",
+    [
+        ({}, ["chr1\t0\t25", "chr1\t30\t40", "chr2\t0\t5"]),
+        ({"d": 5}, ["chr1\t0\t40", "chr2\t0\t5"]),
+        (
+            {"nms": True, "scores": "max"},
+            ["chr1\t0\t25\ta1;a2;a3\t5", "chr1\t30\t40\ta4\t2", "chr2\t0\t5\ta5\t1"],
+        ),
+        (
+            {"nms": True, "s": True},
+            [
+                "chr1\t0\t20\ta1;a2",
+                "chr1\t20\t25\ta3",
+                "chr1\t30\t40\ta4",
+                "chr2\t0\t5\ta5",
+            ],
+        ),
+    ],
+)
+def test_bed_merge(kwargs, expected):
+    assert to_rows(bed_merge(make_bed(A_ROWS), **kwargs)) == expected
+
+
+def test_bed_complement():
+    assert to_rows(bed_complement(make_bed(A_ROWS), SIZES)) == [
+        "chr1\t25\t30",
+        "chr1\t40\t50",
+        "chr3\t0\t7",
+    ]
+
+
+def test_bed_intersect():
+    abed, bbed = make_bed(A_ROWS), make_bed(B_ROWS)
+    assert [str(b).split("\t")[:4] for b in bed_intersect(abed, bbed)] == [
+        ["chr1", "8", "10", "a1"],
+        ["chr1", "8", "20", "a2"],
+        ["chr1", "20", "25", "a3"],
+        ["chr1", "30", "32", "a4"],
+        ["chr1", "35", "36", "a4"],
+    ]
+    pairs = [
+        (a.accn, b.accn if b else None, c)
+        for a, b, c in bed_intersect_wao(abed, bbed, minOverlap=0)
+    ]
+    assert pairs == [
+        ("a1", "b1", 2),
+        ("a2", "b1", 12),
+        ("a3", "b1", 5),
+        ("a4", "b1", 2),
+        ("a4", "b2", 1),
+        ("a5", None, 0),
+    ]
+
+
+def test_bed_coverage():
+    assert to_rows(bed_coverage(make_bed(A_ROWS), SIZES)) == [
+        "chr1\t0\t5\t1",
+        "chr1\t5\t10\t2",
+        "chr1\t10\t25\t1",
+        "chr1\t25\t30\t0",
+        "chr1\t30\t40\t1",
+        "chr1\t40\t50\t0",
+        "chr2\t0\t5\t1",
+        "chr3\t0\t7\t0",
+    ]
+
+
+def test_bed_depth():
+    depths = [(f.accn, d) for f, d in bed_depth(make_bed(A_ROWS), make_bed(B_ROWS))]
+    assert depths == [("b1", 0.875), ("b2", 1.0), ("b3", 0.0)]
+
+
+def test_bed_columns():
+    bed = make_bed(A_ROWS)
+    assert [b.accn for b in bed.extract("chr1", 1, 25)] == ["a1", "a2", "a3"]
+    assert [b.accn for b in bed.extract("chr1", 6, 40)] == ["a2", "a3", "a4"]
+    assert list(bed.extract("chr3", 1, 100)) == []
+    assert [b.accn for b in bed.sub_bed("chr2")] == ["a5"]
+    assert bed.columns.seqids == ["chr1", "chr2"]
+    assert bed.columns.strands.tolist() == [1, 1, -1, 1, 1]
+
+
+def test_bed_cache_invalidation():
+    bed = make_bed(A_ROWS)
+    order = bed.order
+    assert bed.order is order
+    assert bed.order_in_chr["a5"][:2] == ("chr2", 0)
+
+    bed.add("chr2\t1\t2\ta6")
+    assert bed.order is not order
+    assert bed.order["a6"][0] == 5
+    assert [b.accn for b in bed.sub_bed("chr2")] == ["a5", "a6"]
+    assert bed.order_in_chr["a6"][:2] == ("chr2", 1)
+
+
+def test_bed_cache_line_edits():
+    bed = make_bed(A_ROWS)
+    order = bed.order
+    with pytest.raises(TypeError):
+        order["a6"] = (5, None)
+    with pytest.raises(TypeError):
+        bed.order_in_chr["a6"] = ("chr2", 1, None)
+
+    # Editing a line in place drops the cached lookups
+    assert bed.max_bp_in_chr["chr2"] == 5
+    bed[-1].end = 80
+    assert bed.max_bp_in_chr["chr2"] == 80
+    bed[0].accn = "a0"
+    assert "a0" in bed.order and "a1" not in bed.order
+    bed[0].seqid = "chr3"
+    assert bed.order_in_chr["a0"][:2] == ("chr3", 0)
+    assert [b.accn for b in bed.sub_bed("chr3")] == ["a0"]
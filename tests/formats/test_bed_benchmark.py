@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+
+import pytest
+import shutil
+import time
+
+import numpy as np
+
+
+def make_bedfile(filename, nfeatures=20000, seed=666):
+    rng = np.random.default_rng(seed)
+    seqids = rng.integers(1, 6, nfeatures)
+    starts = rng.integers(0, 10000000, nfeatures)
+    spans = rng.integers(1, 5000, nfeatures)
+    with open(filename, "w") as fw:
+        for i, (seqid, start, span) in enumerate(zip(seqids, starts, spans)):
+            print(f"chr{seqid}\t{start}\t{start + span}\tf{i}", file=fw)
+    return filename
+
+
+@pytest.fixture
+def bedfile(tmp_path):
+    return make_bedfile(str(tmp_path / "features.bed"))
+
+
+# Benchmark in-process interval engine vs bedtools
+@pytest.mark.benchmark(
+    group="bed_merge vs mergeBed", timer=time.time, disable_gc=True, warmup=False
+)
+def test_bed_merge(benchmark, bedfile):
+    from jcvi.formats.bed import Bed, bed_merge
+
+    @benchmark
+    def result():
+        return bed_merge(Bed(bedfile, sorted=False), nms=True)
+
+    assert len(result) > 0
+
+
+@pytest.mark.skipif(shutil.which("mergeBed") is None, reason="bedtools not found")
+@pytest.mark.benchmark(
+    group="bed_merge vs mergeBed", timer=time.time, disable_gc=True, warmup=False
+)
+def test_mergeBed_bedtools(benchmark, bedfile):
+    from jcvi.apps.base import popen
+    from jcvi.formats.bed import Bed, bed_merge
+
+    @benchmark
+    def result():
+        cmd = f"sort -k1,1 -k2,2n {bedfile} | mergeBed -i stdin -c 4 -o collapse"
+        return popen(cmd).read().decode().splitlines()
+
+    merged = bed_merge(Bed(bedfile, sorted=False), nms=True, delim=",")
+    assert result == [str(b) for b in merged]
@@ -20,3 +20,73 @@ def test_filtered_blastfile_name(
     from jcvi.formats.blast import filtered_blastfile_name
 
     assert filtered_blastfile_name(blastfile, pctid, hitlen, inverse) == expected
+
+
+def test_blast_cache(tmp_path):
+    import os
+
+    from jcvi.formats.blast import Blast
+
+    blastfile = str(tmp_path / "a.b.blast")
+    with open(blastfile, "w") as fw:
+        print("# BLASTN comment", file=fw)
+        print("a1\tb1\t99.50\t200\t1\t0\t1\t200\t300\t101\t1e-50\t350.5", file=fw)
+        print("a1\tb2\t90.00\t100\t10\t1\t50\t149\t1\t100\t2e-10\t120", file=fw)
+        print("a2\tb1\t85.25\t80\t12\t2\t80\t1\t20\t99\t0\t99", file=fw)
+
+    def hits(blast):
+        return [(q, [str(b) for b in blines]) for q, blines in blast.iter_hits()]
+
+    def best_hits(blast):
+        return [(s, str(b)) for s, b in blast.iter_best_hit(ref="subject")]
+
+    blast = Blast(blastfile)
+    expected = [str(b) for b in blast]
+    expected_hits, expected_best_hits = hits(blast), best_hits(blast)
+    assert [q for q, _ in expected_hits] == ["a1", "a2"]
+    assert not blast.has_cache
+    blast.build_cache()
+    assert blast.has_cache
+    # The text is no longer read once the cache is there
+    blast.fp.close()
+    assert [str(b) for b in blast.iter_cache()] == expected
+    assert hits(blast) == expected_hits
+    assert best_hits(blast) == expected_best_hits
+    assert [str(b) for b in Blast(blastfile)] == expected
+
+    records, names = blast.load_cache()
+    assert len(records) == 3
+    assert list(names) == ["a1", "b1", "b2", "a2"]
+    assert list(records["orientation"]) == [-1, 1, -1]
+
+    # Stale cache is ignored once the BLAST file is newer
+    st = os.stat(blastfile)
+    os.utime(blastfile, (st.st_atime, st.st_mtime + 10))
+    assert not Blast(blastfile).has_cache
+
+
+@pytest.mark.parametrize("cpus,gzipped", [(1, False), (2, False), (2, True)])
+def test_cscore(tmp_path, cpus: int, gzipped: bool):
+    import gzip
+
+    from jcvi.formats.blast import cscore
+
+    blastfile = str(tmp_path / "a.b.blast")
+    if gzipped:
+        blastfile += ".gz"
+    with (gzip.open if gzipped else open)(blastfile, "wt") as fw:
+        print("a1.1\tb1.1\t99.50\t200\t1\t0\t1\t200\t300\t101\t1e-50\t350", file=fw)
+        print("a1.2\tb1.1\t98.00\t200\t4\t0\t1\t200\t300\t101\t1e-40\t300", file=fw)
+        print("a1.1\tb2.1\t90.00\t100\t10\t1\t50\t149\t1\t100\t2e-10\t120", file=fw)
+        print("a2.1\tb1.1\t85.25\t80\t12\t2\t80\t1\t20\t99\t1e-5\t99", file=fw)
+        print("a2.1\tb2.1\t88.00\t90\t11\t0\t1\t90\t1\t90\t1e-8\t100", file=fw)
+
+    outfile = str(tmp_path / "a.b.cscore")
+    cscore(
+        [blastfile, "--cutoff=0.5", "--pct", "--writeblast", f"--cpus={cpus}"]
+        + ["-o", outfile]
+    )
+    with open(outfile) as fp:
+        assert fp.read().split("\n") == ["a1\tb1\t1.00\t99.5", "a2\tb2\t0.83\t88.0", ""]
+    with open(outfile + ".filtered.blast") as fp:
+        assert [x.split("\t")[:2] for x in fp] == [["a1.1", "b1.1"], ["a2.1", "b2.1"]]
@@ -30,3 +30,60 @@ class TestCblast(unittest.TestCase):
         query, subject = self.b.query, self.b.subject
         self.b.query, self.b.subject = subject, query
         assert str(self.b).startswith("Os08g13650")
+
+    def test_long_names(self):
+        from jcvi.formats.cblast import BlastLine
+
+        query, subject = "q" * 300, "s" * 200
+        b = BlastLine("\t".join([query, subject] + str(self.b).split("\t")[2:]))
+        assert b.query == query and b.subject == subject
+        assert str(b).split("\t")[:3] == [query, subject, "92.31"]
+
+    def test_iter_chunks(self):
+        import os
+        import tempfile
+
+        from jcvi.formats.cblast import Blast
+        from jcvi.formats.pyblast import iter_blast_chunks
+
+        rows = [
+            "# comment",
+            "a" * 200 + "\tb1\t99.5\t200\t1\t0\t200\t1\t300\t101\t1e-50\t350",
+            "a2\tb1\t90\t100\t10\t1\t50\t149\t1\t100\t2e-10\t120",
+            "a2\tb2\t85.25\t80\t12\t2\t1\t80\t20\t99\t0\t99",
+        ]
+        with tempfile.NamedTemporaryFile("w", suffix=".blast", delete=False) as fw:
+            print("\n".join(rows), file=fw)
+        try:
+            chunks = list(Blast(fw.name).iter_chunks(2))
+            with open(fw.name) as fp:
+                pychunks = list(iter_blast_chunks(fp, 2))
+        finally:
+            os.remove(fw.name)
+
+        assert [len(x) for x, _ in chunks] == [2, 1]
+        names = chunks[-1][1]
+        assert names == ["a" * 200, "b1", "a2", "b2"]
+        assert chunks[0][0]["qstart"].tolist() == [1, 50]
+        assert chunks[0][0]["orientation"].tolist() == [-1, 1]
+        assert chunks[1][0]["pctid"].tolist() == [85.25]
+        for (a, an), (b, bn) in zip(chunks, pychunks):
+            assert an == bn
+            assert a.tolist() == b.tolist()
+
+    def test_tiny_evalue(self):
+        import os
+        import tempfile
+
+        from jcvi.formats.cblast import Blast
+
+        row = "a1\tb1\t99.5\t200\t1\t0\t1\t200\t1\t200\t1e-120\t350"
+        with tempfile.NamedTemporaryFile("w", suffix=".blast", delete=False) as fw:
+            print(row, file=fw)
+        try:
+            (b,) = list(Blast(fw.name))
+            ((records, _),) = list(Blast(fw.name).iter_chunks())
+        finally:
+            os.remove(fw.name)
+
+        assert b.evalue == records["evalue"][0] == 1e-120
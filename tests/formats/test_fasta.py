@@ -23,3 +23,126 @@ def test_iter_clean_fasta():
         assert records == [("seq1", "ACGTxyz*"), ("seq2", "GCC")]
 
     m.assert_called_once_with("test.fasta", "r")
+
+
+def test_fasta_index(tmp_path):
+    import bz2
+    import os.path as op
+    import pickle
+
+    import pytest
+
+    from Bio import SeqIO
+
+    from jcvi.formats.fasta import Fasta, FastaIndex
+
+    fastafile = str(tmp_path / "test.fasta")
+    with open(fastafile, "w") as fw:
+        fw.write(">chr1 description\nACGTA\nCCGTT\nAC\n>chr2\nggccN\nAT\n>empty\n")
+
+    # The index is kept in memory, unless asked to be written
+    assert isinstance(Fasta(fastafile).index, dict)
+    assert isinstance(FastaIndex(fastafile).index, dict)
+    assert not op.exists(fastafile + ".fai")
+    assert isinstance(Fasta(fastafile, index=True).index, FastaIndex)
+    assert op.exists(fastafile + ".fai")
+    f = FastaIndex(fastafile)
+    with open(fastafile + ".fai") as fp:
+        assert fp.read().split("\n") == [
+            "chr1\t12\t18\t5\t6",
+            "chr2\t7\t39\t5\t6",
+            "empty\t0\t55\t0\t0",
+            "",
+        ]
+    records = SeqIO.to_dict(SeqIO.parse(fastafile, "fasta"))
+    for name in ("chr1", "chr2"):
+        for start in range(1, len(records[name]) + 1):
+            for stop in range(start, len(records[name]) + 1):
+                for strand in "+-":
+                    feature = dict(chr=name, start=start, stop=stop, strand=strand)
+                    seq = Fasta.subseq(records[name], start, stop, strand)
+                    assert f.sequence(feature) == str(seq)
+    assert f.fetch("empty") == ""
+
+    # Records are read lazily through an existing .fai, but behave like the
+    # SeqIO ones
+    fasta = Fasta(fastafile)
+    assert isinstance(fasta.index, FastaIndex)
+    assert list(fasta.keys()) == list(records.keys())
+    for name, rec in records.items():
+        assert fasta[name].description == rec.description
+        assert str(fasta[name].seq) == str(rec.seq)
+        assert len(fasta[name]) == len(rec)
+    assert str(fasta["chr1"].seq[3:9].reverse_complement()) == "ACGGTA"
+    assert fasta["chr1"].seq[-1] == "C"
+    assert fasta.sequence(dict(chr="chr2", start=4, stop=6, strand="-")) == "TNg"
+    assert dict(fasta.itersizes()) == {"chr1": 12, "chr2": 7, "empty": 0}
+
+    # Workers open the file again
+    g = pickle.loads(pickle.dumps(f))
+    assert g.fetch("chr2", 2, 7) == "ccNAT"
+    g.close()
+
+    # Compressed files and custom keys are parsed as before
+    fasta = Fasta(fastafile, key_function=lambda x: x.split()[-1])
+    assert isinstance(fasta.index, dict)
+    assert str(fasta["description"].seq) == "ACGTACCGTTAC"
+
+    unevenfile = str(tmp_path / "uneven.fasta")
+    with open(unevenfile, "w") as fw:
+        fw.write(">chr1\nACGTA\nCC\nACGTA\n")
+    with pytest.raises(ValueError):
+        FastaIndex(unevenfile)
+    assert str(Fasta(unevenfile)["chr1"].seq) == "ACGTACCACGTA"
+
+    # Files without a FASTA header are not indexed, e.g. bzip2 compressed
+    bz2file = str(tmp_path / "test.fasta.bz2")
+    with bz2.open(bz2file, "wt") as fw, open(fastafile) as fp:
+        fw.write(fp.read())
+    textfile = str(tmp_path / "test.txt")
+    with open(textfile, "w") as fw:
+        fw.write("ACGT\n")
+    for filename in (bz2file, textfile):
+        with pytest.raises(ValueError):
+            FastaIndex(filename)
+        assert not op.exists(filename + ".fai")
+    assert dict(Fasta(bz2file).itersizes()) == {"chr1": 12, "chr2": 7, "empty": 0}
+
+
+def test_scan_fasta(tmp_path):
+    import bz2
+    import gzip
+
+    import numpy as np
+
+    from jcvi.formats.fasta import scan_blocks, scan_fasta, scan_fasta_files
+
+    data = ">chr1 description\nNNacg\nTNNnN\nAC\n>chr2\nggccN\nAT\n>empty\n"
+    fastafile = str(tmp_path / "test.fasta")
+    with open(fastafile, "w") as fw:
+        fw.write(data)
+    gzfile = str(tmp_path / "test.fasta.gz")
+    with gzip.open(gzfile, "wt") as fw:
+        fw.write(data)
+    bz2file = str(tmp_path / "test.fasta.bz2")
+    with bz2.open(bz2file, "wt") as fw:
+        fw.write(data)
+
+    filenames = [fastafile, gzfile, bz2file]
+    for stats in scan_fasta_files(filenames, gaps=True, cpus=2):
+        assert [(x.name, x.size, x.real, x.gc, x.nn) for x in stats] == [
+            ("chr1", 12, 6, 3, 6),
+            ("chr2", 7, 6, 4, 1),
+            ("empty", 0, 0, 0, 0),
+        ]
+        assert [x.gaps for x in stats] == [[(0, 2), (6, 10)], [(4, 5)], []]
+    assert [(x.name, x.size) for x in scan_fasta(gzfile, bases=False)] == [
+        ("chr1", 12),
+        ("chr2", 7),
+        ("empty", 0),
+    ]
+
+    # Gaps that span several blocks are merged
+    seq = np.frombuffer(b"ACNNNNNNGTNN", dtype=np.uint8)
+    blocks = [seq[i : i + 3] for i in range(0, len(seq), 3)]
+    assert scan_blocks("x", blocks, gaps=True).gaps == [(2, 8), (10, 12)]
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+
+import pytest
+import random
+import time
+
+NCHROMS = 10
+CHROMSIZE = 4800000
+NSLICES = 10000
+
+
+@pytest.fixture(scope="module")
+def genome_fasta(tmp_path_factory):
+    # A 48Mb genome stands in for the 3Gb ones, the cost of the index does not
+    # depend on the genome size, the cost of parsing does
+    fastafile = str(tmp_path_factory.mktemp("fasta") / "genome.fasta")
+    rng = random.Random(42)
+    line = "".join(rng.choice("ACGT") for _ in range(60 * 1000))
+    with open(fastafile, "w") as fw:
+        for i in range(NCHROMS):
+            print(f">chr{i + 1} synthetic chromosome", file=fw)
+            for j in range(0, CHROMSIZE, 60):
+                k = j % len(line)
+                print(line[k : k + 60], file=fw)
+    return fastafile
+
+
+def random_slices(fasta):
+    rng = random.Random(42)
+    seqs = []
+    for _ in range(NSLICES):
+        chrom = f"chr{rng.randint(1, NCHROMS)}"
+        start = rng.randint(1, CHROMSIZE - 1000)
+        feature = dict(chr=chrom, start=start, stop=start + 999, strand="-")
+        seqs.append(fasta.sequence(feature))
+    return seqs
+
+
+@pytest.mark.benchmark(group="FASTA slices", timer=time.time, warmup=False)
+def test_fasta_indexed_slices(benchmark, genome_fasta):
+    from jcvi.formats.fasta import Fasta, FastaIndex
+
+    def fetch():
+        return random_slices(Fasta(genome_fasta))
+
+    FastaIndex(genome_fasta, write=True)  # .fai is built once and reused
+    seqs = benchmark.pedantic(fetch, rounds=3)
+    assert len(seqs) == NSLICES and all(len(x) == 1000 for x in seqs)
+
+
+@pytest.mark.benchmark(group="FASTA slices", timer=time.time, warmup=False)
+def test_fasta_parsed_slices(benchmark, genome_fasta):
+    from jcvi.formats.fasta import Fasta
+
+    def fetch():
+        fasta = Fasta(genome_fasta, key_function=lambda x: x.split()[0])
+        return random_slices(fasta)
+
+    seqs = benchmark.pedantic(fetch, rounds=3)
+    assert len(seqs) == NSLICES and all(len(x) == 1000 for x in seqs)
+
+
+@pytest.mark.benchmark(group="FASTA summary", timer=time.time, warmup=False)
+def test_fasta_scan_summary(benchmark, genome_fasta):
+    from jcvi.formats.fasta import scan_fasta
+
+    stats = benchmark.pedantic(lambda: list(scan_fasta(genome_fasta)), rounds=3)
+    assert sum(x.size for x in stats) == NCHROMS * CHROMSIZE
+
+
+@pytest.mark.benchmark(group="FASTA summary", timer=time.time, warmup=False)
+def test_fasta_parse_summary(benchmark, genome_fasta):
+    from Bio import SeqIO
+
+    def parse():
+        stats = []
+        for rec in SeqIO.parse(genome_fasta, "fasta"):
+            s = str(rec.seq).upper()
+            real = sum(s.count(x) for x in "ACGT")
+            stats.append((rec.id, len(s), real, s.count("N")))
+        return stats
+
+    stats = benchmark.pedantic(parse, rounds=3)
+    assert sum(x[1] for x in stats) == NCHROMS * CHROMSIZE
@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+
+import io
+
+import numpy as np
+import pytest
+
+FASTQ = (
+    b"@r1 1:N:0:ACGT\nACGTN\n+\nIIII#\n"
+    b"@r2 1:N:0:ACGT\r\nAC\r\n+r2\r\n#I\r\n"
+    b"@r3\n\n+\n\n"
+    b"@r4\nGGCAT\n+\nIIIII"
+)
+
+
+def test_iter_fastq_batches():
+    from jcvi.formats.fastq import FastqBatch, iter_fastq_batches
+
+    batches = list(iter_fastq_batches(io.BytesIO(FASTQ), batchsize=3, blocksize=7))
+    assert [len(x) for x in batches] == [3, 1]
+    batch = FastqBatch.concatenate(batches)
+    assert batch.names == ["@r1", "@r2", "@r3", "@r4"]
+    assert batch.header_lines[0] == "@r1 1:N:0:ACGT"
+    assert batch.lengths.tolist() == [5, 2, 0, 5]
+    assert batch.tobytes() == (
+        b"@r1 1:N:0:ACGT\nACGTN\n+\nIIII#\n"
+        b"@r2 1:N:0:ACGT\nAC\n+\n#I\n"
+        b"@r3\n\n+\n\n"
+        b"@r4\nGGCAT\n+\nIIIII\n"
+    )
+
+    assert batch.count(batch.qual == ord("I")).tolist() == [4, 1, 0, 5]
+    assert batch.high_quality("5", pct=80).tolist() == [True, False, True, True]
+    assert batch.select([3, 0]).names == ["@r4", "@r1"]
+    assert batch.select(np.array([False, True, False, False])).tobytes() == (
+        b"@r2 1:N:0:ACGT\nAC\n+\n#I\n"
+    )
+    read2 = batch.slice(1, 4).reverse_complement()
+    assert read2.lengths.tolist() == [3, 1, 0, 3]
+    assert read2.seq.tobytes() == b"ACG" + b"G" + b"TGC"
+    assert read2.qual.tobytes() == b"III" + b"I" + b"III"
+    assert batch.shift_quality(-31).qual.tobytes()[:5] == b"****!"
+
+    with pytest.raises(ValueError):
+        list(iter_fastq_batches(io.BytesIO(b"@r1\nACGT\n+\nIII\n")))
+    with pytest.raises(ValueError):
+        list(iter_fastq_batches(io.BytesIO(b"@r1\nACGT\n+\n")))
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+
+import gzip
+import pytest
+import random
+import time
+
+NREADS = 200000
+READLEN = 150
+
+
+@pytest.fixture(scope="module")
+def illumina_fastq(tmp_path_factory):
+    # Gzipped 2x150bp Illumina 1.8+ reads, interleaved
+    fastqfile = str(tmp_path_factory.mktemp("fastq") / "reads.fastq.gz")
+    rng = random.Random(42)
+    seqs = ["".join(rng.choice("ACGT") for _ in range(READLEN)) for _ in range(1000)]
+    quals = [
+        "".join(
+            chr(33 + min(41, max(2, int(rng.gauss(34, 8))))) for _ in range(READLEN)
+        )
+        for _ in range(1000)
+    ]
+    with gzip.open(fastqfile, "wt", compresslevel=1) as fw:
+        for i in range(NREADS):
+            header = f"@A00123:8:H7KJ2DSXX:1:1101:{i // 2}:1000 {i % 2 + 1}:N:0:ACGT"
+            print(header, seqs[i % 1000], "+", quals[(i * 7) % 1000], sep="\n", file=fw)
+    return fastqfile
+
+
+@pytest.mark.benchmark(group="FASTQ size", timer=time.time, warmup=False)
+def test_fastq_size_records(benchmark, illumina_fastq):
+    from jcvi.formats.fastq import iter_fastq
+
+    def size():
+        return sum(len(rec) for rec in iter_fastq(illumina_fastq) if rec)
+
+    assert benchmark.pedantic(size, rounds=3) == NREADS * READLEN
+
+
+@pytest.mark.benchmark(group="FASTQ size", timer=time.time, warmup=False)
+def test_fastq_size_batches(benchmark, illumina_fastq):
+    from jcvi.formats.fastq import iter_fastq_batches
+
+    def size():
+        return sum(int(b.lengths.sum()) for b in iter_fastq_batches(illumina_fastq))
+
+    assert benchmark.pedantic(size, rounds=3) == NREADS * READLEN
+
+
+@pytest.mark.benchmark(group="FASTQ filter", timer=time.time, warmup=False)
+def test_fastq_filter_records(benchmark, illumina_fastq):
+    from jcvi.formats.fastq import isHighQv, iter_fastq
+
+    # Quality check and conversion to Phred+64, one read at a time
+    def filter():
+        return sum(
+            len(str(rec))
+            for rec in iter_fastq(illumina_fastq, offset=31)
+            if rec and isHighQv(rec.qual, chr(64 + 20), pct=90)
+        )
+
+    assert benchmark.pedantic(filter, rounds=3) > 0
+
+
+@pytest.mark.benchmark(group="FASTQ filter", timer=time.time, warmup=False)
+def test_fastq_filter_batches(benchmark, illumina_fastq):
+    from jcvi.formats.fastq import iter_fastq_batches
+
+    def filter():
+        total = 0
+        for batch in iter_fastq_batches(illumina_fastq):
+            batch = batch.shift_quality(31)
+            batch = batch.select(batch.high_quality(chr(64 + 20), pct=90))
+            total += len(batch.tobytes())
+        return total
+
+    assert benchmark.pedantic(filter, rounds=3) > 0
@@ -71,3 +71,147 @@ def test_make_attributes(attr, gff3, expected):
 def test_parent_key(gff3_line, parent_key, expected):
     gff3_line = GffLine(gff3_line, parent_key=parent_key)
     assert gff3_line.parent == expected
+
+
+def test_gffline_lazy_attributes():
+    g = GffLine("chr1\t.\tmRNA\t1\t100\t.\t+\t.\tID=m1;Parent=g1;Name=A%20B")
+    assert g._attributes is None
+    assert (g.seqid, g.type, g.span, g.bedline.accn) == ("chr1", "mRNA", 100, "m1")
+    assert g.name == "A B"
+    g.set_attr("Note", "test", update=True)
+    assert g.attributes_text == "ID=m1;Parent=g1;Name=A B;Note=test"
+    assert not hasattr(g, "__dict__")
+
+
+def test_gff_iter_lines(tmp_path):
+    from jcvi.formats.gff import Gff
+
+    gffile = str(tmp_path / "test.gff")
+    with open(gffile, "w") as fw:
+        print("##gff-version 3", file=fw)
+        print("chr1\t.\tgene\t1\t100\t.\t+\t.\tID=g1", file=fw)
+        print("chr1\t.\tmRNA\t1\t100\t.\t+\t.\tID=m1;Parent=g1", file=fw)
+        print("chr1\t.\texon\t1\t100\t.\t+\t.\tParent=m1", file=fw)
+        print("chr1 . mRNA 1 50 . - . ID=m2;Parent=g1", file=fw)
+    gff = Gff(gffile)
+    assert [g.type for g in gff] == ["gene", "mRNA", "exon", "mRNA"]
+    assert [g.accn for g in gff.iter_lines(types={"mRNA"})] == ["m1", "m2"]
+    assert [g.accn for g in gff.iter_lines(types={"exon"})] == ["exon_3"]
+
+
+def test_gff_index(tmp_path):
+    import gffutils
+    from jcvi.formats.gff import FeatureNotFoundError, GffIndex, make_index
+
+    gffile = str(tmp_path / "test.gff")
+    with open(gffile, "w") as fw:
+        print("##gff-version 3", file=fw)
+        print("chr1\t.\texon\t5\t50\t.\t+\t.\tParent=m1,m2", file=fw)
+        print("chr1\t.\tgene\t1\t100\t.\t+\t.\tID=g1;Name=G1", file=fw)
+        print("chr1\t.\tmRNA\t1\t100\t.\t+\t.\tID=m1;Parent=g1", file=fw)
+        print("chr1\t.\tmRNA\t1\t90\t.\t+\t.\tID=m2;Parent=g1", file=fw)
+        print("chr1\t.\tCDS\t10\t40\t.\t+\t0\tID=c1;Parent=m1", file=fw)
+        print("chr1\t.\tCDS\t10\t40\t.\t+\t0\tID=c1;Parent=m2", file=fw)
+        print("chr1\t.\texon\t60\t70\t.\t+\t.\tParent=m9", file=fw)
+        print("chr2\t.\tgene\t5\t10\t.\t-\t.\tID=g2", file=fw)
+        print("##FASTA", file=fw)
+        print(">chr1", file=fw)
+        print("ACGT", file=fw)
+
+    db = gffutils.create_db(gffile, ":memory:", merge_strategy="create_unique")
+    for index in (make_index(gffile), GffIndex(gffile)):  # Build, then load
+        assert isinstance(index, GffIndex)
+        assert len(index) == 8
+        for f in db.all_features():
+            assert str(index[f.id]) == str(f)
+            for level in (1, 2, None):
+                expected = db.children(f, level=level, order_by="start")
+                observed = index.children(f.id, level, order_by="start")
+                assert [x.id for x in observed] == [x.id for x in expected]
+                expected = db.parents(f, level=level)
+                observed = index.parents(f.id, level)
+                assert sorted(x.id for x in observed) == sorted(x.id for x in expected)
+            assert index.children_bp(f.id) == db.children_bp(f)
+        assert [x.id for x in index.children("m9")] == ["exon_2"]
+        assert [x.id for x in index.features_of_type("CDS")] == ["c1", "c1_1"]
+        assert [x.id for x in index.region("chr1:45-65")] == [
+            "exon_1",
+            "g1",
+            "m1",
+            "m2",
+            "exon_2",
+        ]
+        assert [x.id for x in index.region(("chr1", 45, 65), featuretype="gene")] == [
+            "g1"
+        ]
+        assert [x.id for x in index.region("chr1:1-50", completely_within=True)] == [
+            "exon_1",
+            "c1",
+            "c1_1",
+        ]
+        assert "g2" in index and "m9" not in index
+        with pytest.raises(FeatureNotFoundError):
+            index["m9"]
+        index.close()
+        assert index.fp is None
+
+    with GffIndex(gffile) as index:
+        g = index["g1"]
+        assert index.fp is not None
+    assert index.fp is None
+    assert (g.chrom, g.stop, g.featuretype, len(g), g["Name"]) == (
+        "chr1",
+        100,
+        "gene",
+        100,
+        ["G1"],
+    )
+    g["Note"] = ["a"]
+    g.stop = 120
+    assert str(g) == "chr1\t.\tgene\t1\t120\t.\t+\t.\tID=g1;Name=G1;Note=a"
+
+    # Without order_by, relatives come in the file order, the same features as
+    # gffutils which leaves the order to SQLite
+    with GffIndex(gffile) as index:
+        for f in db.all_features():
+            observed = [x.id for x in index.children(f.id)]
+            assert observed == sorted(observed, key=index.id_index.get)
+            assert sorted(observed) == sorted(x.id for x in db.children(f))
+        assert [x.id for x in index.children("g1")] == [
+            "exon_1",
+            "m1",
+            "m2",
+            "c1",
+            "c1_1",
+        ]
+
+
+def test_gff_index_cache(tmp_path):
+    import numpy as np
+
+    from jcvi.formats.gff import GffIndex
+
+    gffile = str(tmp_path / "test.gff")
+    with open(gffile, "w") as fw:
+        print("##gff-version 3", file=fw)
+        print("chr1\t.\tgene\t1\t100\t.\t+\t.\tID=g1", file=fw)
+        print("chr1\t.\tmRNA\t1\t100\t.\t+\t.\tID=m1;Parent=g1", file=fw)
+    with GffIndex(gffile) as index:
+        expected = [x.id for x in index.children("g1")]
+    cachefile = gffile + ".index.npz"
+    with np.load(cachefile) as data:
+        arrays = dict(data)
+    assert int(arrays["version"]) == GffIndex.FORMAT_VERSION
+
+    # Caches of another version, or without one, are rebuilt
+    for version in (GffIndex.FORMAT_VERSION + 1, None):
+        stale = dict(arrays, ids=np.frombuffer(b"x\ny", dtype=np.uint8))
+        if version is None:
+            del stale["version"]
+        else:
+            stale["version"] = np.array(version)
+        np.savez(cachefile, **stale)
+        with GffIndex(gffile) as index:
+            assert [x.id for x in index.children("g1")] == expected
+        with np.load(cachefile) as data:
+            assert int(data["version"]) == GffIndex.FORMAT_VERSION
@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+
+import pytest
+import time
+
+NGENES = 10000
+
+
+@pytest.fixture(scope="module")
+def annotation_gff(tmp_path_factory):
+    # Gene models with 2 isoforms of 4 exons and 4 CDS each, 190k lines
+    gffile = str(tmp_path_factory.mktemp("gff") / "genes.gff")
+    with open(gffile, "w") as fw:
+        print("##gff-version 3", file=fw)
+        for i in range(NGENES):
+            start = i * 10000 + 1
+            gid = f"gene{i:06d}"
+            print(
+                f"chr1\tmaker\tgene\t{start}\t{start + 4999}\t.\t+\t.\t"
+                f"ID={gid};Name={gid};Note=Protein%20kinase",
+                file=fw,
+            )
+            for j in (1, 2):
+                mid = f"{gid}.{j}"
+                print(
+                    f"chr1\tmaker\tmRNA\t{start}\t{start + 4999}\t.\t+\t.\t"
+                    f"ID={mid};Parent={gid};Name={mid}",
+                    file=fw,
+                )
+                for ftype in ("exon", "CDS"):
+                    for k in range(4):
+                        s = start + k * 1250
+                        print(
+                            f"chr1\tmaker\t{ftype}\t{s}\t{s + 999}\t.\t+\t0\t"
+                            f"ID={mid}.{ftype}{k};Parent={mid}",
+                            file=fw,
+                        )
+    return gffile
+
+
+@pytest.mark.benchmark(group="GFF iteration", timer=time.time, warmup=False)
+def test_gff_iter_attributes(benchmark, annotation_gff):
+    from jcvi.formats.gff import Gff
+
+    # Every line parses its attributes, as GffLine used to do
+    def iterate():
+        return sum(len(g.attributes) for g in Gff(annotation_gff))
+
+    assert benchmark.pedantic(iterate, rounds=3) > 0
+
+
+@pytest.mark.benchmark(group="GFF iteration", timer=time.time, warmup=False)
+def test_gff_iter_coords(benchmark, annotation_gff):
+    from jcvi.formats.gff import Gff
+
+    def iterate():
+        return sum(g.span for g in Gff(annotation_gff))
+
+    assert benchmark.pedantic(iterate, rounds=3) > 0
+
+
+@pytest.mark.benchmark(group="GFF iteration", timer=time.time, warmup=False)
+def test_gff_iter_types(benchmark, annotation_gff):
+    from jcvi.formats.gff import Gff
+
+    def iterate():
+        return [g.accn for g in Gff(annotation_gff).iter_lines(types={"gene"})]
+
+    assert len(benchmark.pedantic(iterate, rounds=3)) == NGENES
+
+
+def gene_cds_bp(index):
+    # Query pattern of `annotation.stats genestats`, one query per gene
+    return sum(
+        c.end - c.start + 1
+        for g in index.features_of_type("gene")
+        for c in index.children(g.id, 2)
+        if c.featuretype == "CDS"
+    )
+
+
+@pytest.mark.benchmark(group="GFF index", timer=time.time, warmup=False)
+def test_gff_index_gffutils(benchmark, annotation_gff):
+    import gffutils
+
+    def index_and_query():
+        db = gffutils.create_db(
+            annotation_gff, ":memory:", merge_strategy="create_unique"
+        )
+        return gene_cds_bp(db)
+
+    assert benchmark.pedantic(index_and_query, rounds=3) == NGENES * 8000
+
+
+@pytest.mark.benchmark(group="GFF index", timer=time.time, warmup=False)
+def test_gff_index(benchmark, annotation_gff):
+    from jcvi.apps.base import cleanup
+    from jcvi.formats.gff import GffIndex
+
+    def index_and_query():
+        cleanup(annotation_gff + ".index.npz")
+        return gene_cds_bp(GffIndex(annotation_gff))
+
+    assert benchmark.pedantic(index_and_query, rounds=3) == NGENES * 8000
+
+
+@pytest.mark.benchmark(group="GFF index", timer=time.time, warmup=False)
+def test_gff_index_cached(benchmark, annotation_gff):
+    from jcvi.formats.gff import GffIndex
+
+    GffIndex(annotation_gff)
+
+    def query():
+        return gene_cds_bp(GffIndex(annotation_gff))
+
+    assert benchmark.pedantic(query, rounds=3) == NGENES * 8000
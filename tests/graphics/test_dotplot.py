@@ -8,6 +8,8 @@
 # Copyright © 2021 Haibao Tang. All rights reserved.
 #
 
+import pytest
+
 
 def test_downsample():
     from random import random
@@ -22,3 +24,143 @@ def test_downsample():
     assert len(few_data) == 10
     assert len(downsample(few_data)) == 10
     assert len(downsample(few_data, 1)) == 1
+
+
+def test_density_raster():
+    import numpy as np
+    from jcvi.graphics.dotplot import density_raster
+
+    x = np.array([0, 9, 10, 99, 100])
+    y = np.array([0, 0, 50, 99, 100])
+    counts = density_raster(x, y, 100, 100, bins=(10, 2))
+    assert counts.shape == (2, 10)
+    assert counts.sum() == 5
+    assert counts[0, 0] == 2 and counts[1, 1] == 1 and counts[1, 9] == 2
+
+    counts, sums = density_raster(
+        x, y, 100, 100, bins=(10, 2), weights=np.arange(10).reshape(5, 2)
+    )
+    assert sums.shape == (2, 10, 2)
+    assert sums[0, 0].tolist() == [2, 4]
+    assert sums[1, 9].tolist() == [14, 16]
+
+
+def test_draw_raster():
+    import numpy as np
+    from jcvi.graphics.base import plt
+    from jcvi.graphics.dotplot import draw_raster
+
+    fig = plt.figure(1, (4, 4))
+    ax = fig.add_axes((0, 0, 1, 1))
+    draw_raster(
+        ax,
+        [0, 0, 5],
+        [0, 0, 9],
+        10,
+        10,
+        c=["#ff0000", "#0000ff", "#00ff00"],
+        bins=(2, 2),
+    )
+    (image,) = ax.get_images()
+    rgba = image.get_array()
+    assert rgba[0, 0].tolist() == [0.5, 0, 0.5, 1]  # mean of red and blue
+    assert rgba[1, 1, 3] < 1  # sparser, more transparent
+    assert rgba[0, 1, 3] == rgba[1, 0, 3] == 0
+    fig.clear()
+
+
+def read_anchors_rows(
+    anchorfile, qorder, sorder, vmin, vmax, is_self, cmap_text, palette
+):
+    # Parsing of the anchors row by row, as dotplot() used to do
+    xs, ys, cs = [], [], []
+    block_id = 0
+    block_color = "k"
+    for row in open(anchorfile):
+        atoms = row.split()
+        if row[0] == "#":
+            block_id += 1
+            block_color = palette.get(block_id, "k") if palette else None
+            continue
+        if len(atoms) < 2:
+            continue
+        query, subject = atoms[:2]
+        value = atoms[-1]
+        if cmap_text:
+            try:
+                value = float(value)
+            except ValueError:
+                value = vmax
+            if value < vmin or value > vmax:
+                continue
+        else:
+            value = 0
+        if query not in qorder or subject not in sorder:
+            continue
+        qi, si = qorder[query][0], sorder[subject][0]
+        nv = block_color or value
+        xs.append(qi)
+        ys.append(si)
+        cs.append(nv)
+        if is_self:
+            xs.append(si)
+            ys.append(qi)
+            cs.append(nv)
+    return xs, ys, cs
+
+
+@pytest.mark.parametrize("is_self", [False, True])
+@pytest.mark.parametrize("cmap_text", [None, "Ks"])
+@pytest.mark.parametrize("palette", [None, {1: "r", 3: "b"}])
+def test_read_anchors(tmp_path, is_self, cmap_text, palette):
+    from random import Random
+    import jcvi.graphics.dotplot as dotplot
+
+    rng = Random(666)
+    qorder = {f"q{i}": (i, None) for i in range(50)}
+    sorder = {f"s{i}": (i, None) for i in range(40)}
+    anchorfile = str(tmp_path / "a.b.anchors")
+    with open(anchorfile, "w") as fw:
+        for i in range(300):
+            r = rng.random()
+            if r < 0.05:
+                print("###", file=fw)
+            elif r < 0.08:
+                print("", file=fw)
+            elif r < 0.1:
+                print("\tq1  ", file=fw)
+            else:
+                value = rng.choice(["{:.3f}".format(rng.random() * 1.2), "na", "-1"])
+                print(
+                    "q{}\ts{}  {}\t{}".format(
+                        rng.randrange(55), rng.randrange(45), rng.randrange(9), value
+                    ),
+                    end="\r\n" if r < 0.2 else "\n",
+                    file=fw,
+                )
+        fw.write("q1\ts2\t0.5")  # no trailing newline
+
+    args = (anchorfile, qorder, sorder, 0.1, 1, is_self, cmap_text, palette)
+    expected = read_anchors_rows(*args)
+    xs, ys, cs = dotplot.read_anchors(*args)
+    assert xs.tolist() == expected[0]
+    assert ys.tolist() == expected[1]
+    assert cs.tolist() == expected[2]
+
+
+def test_to_ranks():
+    import numpy as np
+    import jcvi.graphics.dotplot as dotplot
+
+    order = {
+        name: (i, None)
+        for i, name in enumerate(
+            ["g1", "g10", "Glyma.01G000100.1", "Glyma.01G000100.2", "gène", ""]
+        )
+    }
+    names = np.array(
+        ["g1", "g2", "Glyma.01G000100.2", "Glyma.01G000100.20", "gène", "g10", "g1"]
+    )
+    assert dotplot.to_ranks(names, order).tolist() == [0, -1, 3, -1, 4, 1, 0]
+    assert dotplot.to_ranks(names, {}).tolist() == [-1] * len(names)
+    assert dotplot.to_ranks(np.array([]), order).tolist() == []
@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+
+import pytest
+import time
+
+import numpy as np
+
+NPOINTS = 5000000
+SIZE = 50000
+
+
+@pytest.fixture(scope="module")
+def points():
+    rng = np.random.default_rng(666)
+    x = rng.integers(0, SIZE, NPOINTS)
+    y = rng.integers(0, SIZE, NPOINTS)
+    c = rng.random(NPOINTS)
+    return x, y, c
+
+
+@pytest.mark.benchmark(group="dotplot", timer=time.time, warmup=False)
+def test_draw_raster(benchmark, points):
+    from jcvi.graphics.base import plt
+    from jcvi.graphics.dotplot import draw_raster
+
+    x, y, c = points
+    fig = plt.figure(1, (9, 9))
+    ax = fig.add_axes((0.1, 0.1, 0.8, 0.8))
+
+    @benchmark
+    def result():
+        # All the points
+        ax.cla()
+        draw_raster(ax, x, y, SIZE, SIZE, c=c)
+        fig.canvas.draw()
+        return ax.get_images()[0].get_array()
+
+    assert result.shape[-1] == 4  # RGBA
+    fig.clear()
+
+
+@pytest.mark.benchmark(group="dotplot", timer=time.time, warmup=False)
+def test_scatter_downsample(benchmark, points):
+    from jcvi.graphics.base import plt
+    from jcvi.graphics.dotplot import downsample
+
+    x, y, c = points
+    fig = plt.figure(1, (9, 9))
+    ax = fig.add_axes((0.1, 0.1, 0.8, 0.8))
+
+    @benchmark
+    def result():
+        # Random 10,000 points only
+        ax.cla()
+        data = downsample(list(zip(x, y, c)))
+        xs, ys, cs = zip(*data)
+        ax.scatter(xs, ys, c=cs, edgecolors="none", s=2, lw=0, cmap="copper")
+        fig.canvas.draw()
+        return data
+
+    assert len(result) == 10000
+    fig.clear()
+
+
+NANCHORS = 2000000
+NGENES = 50000
+
+
+@pytest.fixture(scope="module")
+def anchors(tmp_path_factory):
+    from jcvi.formats.bed import Bed
+
+    rng = np.random.default_rng(666)
+    tmp_path = tmp_path_factory.mktemp("dotplot")
+    beds = []
+    for sp in "ab":
+        bedfile = str(tmp_path / f"{sp}.bed")
+        with open(bedfile, "w") as fw:
+            for i in range(NGENES):
+                chrom, start = i // 5000, (i % 5000) * 1000
+                print(f"{sp}chr{chrom}\t{start}\t{start + 500}\t{sp}g{i}", file=fw)
+        beds.append(Bed(bedfile))
+    anchorfile = str(tmp_path / "a.b.anchors")
+    q = rng.integers(0, NGENES, NANCHORS)
+    s = rng.integers(0, NGENES, NANCHORS)
+    with open(anchorfile, "w") as fw:
+        for i in range(0, NANCHORS, 100):
+            rows = "\n".join(
+                f"ag{a}\tbg{b}\t{c}"
+                for a, b, c in zip(q[i : i + 100], s[i : i + 100], range(100))
+            )
+            fw.write("###\n" + rows + "\n")
+    return anchorfile, beds[0], beds[1]
+
+
+def read_anchors_rows(anchorfile, qorder, sorder, **kwargs):
+    # Row by row parsing of the anchors, as dotplot() used to do
+    xs, ys, cs = [], [], []
+    for row in open(anchorfile):
+        atoms = row.split()
+        if row[0] == "#" or len(atoms) < 2:
+            continue
+        query, subject = atoms[:2]
+        if query not in qorder or subject not in sorder:
+            continue
+        xs.append(qorder[query][0])
+        ys.append(sorder[subject][0])
+        cs.append(0)
+    return xs, ys, cs
+
+
+def parse_and_draw(anchorfile, qbed, sbed):
+    from jcvi.graphics.base import plt
+    from jcvi.graphics.dotplot import dotplot
+
+    fig = plt.figure(1, (9, 9))
+    fig.clear()
+    root = fig.add_axes((0, 0, 1, 1))
+    ax = fig.add_axes((0.1, 0.1, 0.8, 0.8))
+    dotplot(anchorfile, qbed, sbed, fig, root, ax, raster=True, usetex=False)
+    fig.canvas.draw()
+    (image,) = ax.get_images()
+    fig.clear()
+    return image.get_array()
+
+
+@pytest.mark.benchmark(group="dotplot-anchors", timer=time.time, warmup=False)
+def test_dotplot_anchors_rows(benchmark, anchors, monkeypatch):
+    import jcvi.graphics.dotplot as dotplot
+
+    monkeypatch.setattr(dotplot, "read_anchors", read_anchors_rows)
+    result = benchmark.pedantic(parse_and_draw, args=anchors, rounds=3)
+    assert result.shape[-1] == 4  # RGBA
+
+
+@pytest.mark.benchmark(group="dotplot-anchors", timer=time.time, warmup=False)
+def test_dotplot_anchors(benchmark, anchors):
+    result = benchmark.pedantic(parse_and_draw, args=anchors, rounds=3)
+    assert result.shape[-1] == 4  # RGBA
@@ -12,3 +12,30 @@ def test_grouper():
     assert not g.joined("a", "d")
     del g["b"]
     assert list(g) == [["a", "c"], ["d", "e"]]
+
+
+def test_int_grouper():
+    import numpy as np
+
+    from jcvi.utils.grouper import Grouper, IntGrouper
+
+    g = IntGrouper()
+    g.join(1, 2)
+    g.join(2, 3)
+    g.join(7, 8)
+    assert list(g) == [[1, 2, 3], [7, 8]]
+    assert g.joined(1, 3)
+    assert not g.joined(1, 7)
+    assert 5 not in g
+    assert g[2] == (1, 2, 3)
+    assert len(g) == 2 and g.num_members == 5
+
+    # bulk joins agree with the dict-based Grouper
+    rng = np.random.default_rng(666)
+    a, b = rng.integers(0, 2000, (2, 1500))
+    g, expected = IntGrouper(), Grouper()
+    g.join_pairs(a, b)
+    for x, y in zip(a.tolist(), b.tolist()):
+        expected.join(x, y)
+    assert sorted(list(g)) == sorted(sorted(x) for x in expected)
+    assert len(g) == len(expected)